@@ -10,7 +10,16 @@ from app.database import init_db
 # Tạo instance của Bcrypt để sử dụng mã hóa mật khẩu
 bcrypt = Bcrypt()
 
-def create_app(config_class=Config):
+def create_app(config_class=Config, web=True, lazy_db=None):
+    """
+    Tạo ứng dụng Flask
+    Tham số:
+        config_class - Class cấu hình
+        web (bool) - False cho script bảo trì/worker: bỏ qua blueprint, manifest file tĩnh, template filter
+        lazy_db (bool, optional) - True: kết nối MongoDB và kiểm tra index ở truy vấn đầu tiên
+                                   (mặc định theo MONGODB_LAZY_INIT)
+    Trả về: Ứng dụng Flask
+    """
     # Import os để xử lý đường dẫn file
     import os
     # Lấy đường dẫn tuyệt đối đến thư mục templates (thư mục chứa file HTML)
@@ -29,9 +38,63 @@ def create_app(config_class=Config):
     # Khởi tạo Bcrypt với ứng dụng Flask để có thể sử dụng mã hóa mật khẩu
     bcrypt.init_app(app)
     
+    # Logging qua hàng đợi (JSON, request id) cấu hình trước mọi phần khác để cả log khi khởi tạo đi qua đây
+    from app.utils.logs import init_app as init_logs
+    init_logs(app, web=web)
+    
+    # Đếm lệnh MongoDB theo request (đăng ký listener trước khi tạo MongoClient)
+    from app.utils.query_stats import init_app as init_query_stats
+    init_query_stats(app, web=web)
+    # Ghi lệnh MongoDB chậm (kèm explain) vào capped collection slow_queries
+    from app.utils.slow_queries import init_app as init_slow_queries
+    init_slow_queries(app)
+    # Metrics Prometheus: listener pool kết nối cũng phải đăng ký trước khi tạo MongoClient
+    if web:
+        from app.utils.metrics import init_app as init_metrics
+        init_metrics(app)
+    
     # Khởi tạo kết nối database MongoDB
-    # Gọi hàm init_db để tạo kết nối đến MongoDB và tạo các index
-    init_db(app)
+    # Gọi hàm init_db để tạo kết nối đến MongoDB và tạo các index (hoặc hoãn đến truy vấn đầu tiên)
+    if lazy_db is None:
+        lazy_db = app.config.get('MONGODB_LAZY_INIT', False)
+    init_db(app, lazy=lazy_db)
+    # Cache document nhà hàng/món ăn (kích thước, TTL theo cấu hình)
+    from app.utils.doc_cache import init_app as init_doc_cache
+    init_doc_cache(app)
+    # Bus xóa cache giữa các process: chỉ process web nhận thay đổi, mọi process đều gửi khi ghi
+    from app.utils.invalidation import init_app as init_invalidation
+    init_invalidation(app, listen=web)
+    
+    # Script/worker không phục vụ request: không cần route, file tĩnh, template
+    if web:
+        init_web(app)
+    
+    # Trả về ứng dụng Flask đã được cấu hình đầy đủ
+    return app
+
+def init_web(app):
+    """Đăng ký các phần chỉ dùng khi phục vụ request HTTP"""
+    # Đăng ký template filter cho ảnh nhiều kích thước (srcset)
+    from app.utils.images import init_app as init_images
+    init_images(app)
+    # File upload lưu theo hash nội dung được trả về với header cache vĩnh viễn
+    from app.utils.uploads import init_app as init_uploads
+    init_uploads(app)
+    # File tĩnh (css/js/img) có hash trong URL và bản nén sẵn .gz/.br
+    from app.utils.assets import init_app as init_assets
+    init_assets(app)
+    # Cache HTML của các khối catalog (trang chủ, menu nhà hàng)
+    from app.utils.fragment_cache import init_app as init_fragment_cache
+    init_fragment_cache(app)
+    # Snapshot catalog dạng file mmap dùng chung giữa các worker (trang chủ, trang nhà hàng, tìm kiếm)
+    from app.utils.catalog_snapshot import init_app as init_catalog_snapshot
+    init_catalog_snapshot(app)
+    # ETag / Last-Modified cho trang catalog và trang đơn hàng (trình duyệt nhận 304)
+    from app.utils.conditional import init_app as init_conditional
+    init_conditional(app)
+    # Admin profile một request bằng ?_profile=1 / ?_profile=sample (kết quả ở /admin/profiles)
+    from app.utils.profiler import init_app as init_profiler
+    init_profiler(app)
     
     # Đăng ký các blueprint (nhóm route) cho ứng dụng
     # Import blueprint xử lý xác thực (đăng nhập, đăng ký)
@@ -59,7 +122,3 @@ def create_app(config_class=Config):
     app.register_blueprint(restaurant_bp)
     # Đăng ký blueprint main vào ứng dụng Flask
     app.register_blueprint(main_bp)
-    
-    # Trả về ứng dụng Flask đã được cấu hình đầy đủ
-    return app
-
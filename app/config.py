@@ -17,6 +17,9 @@ class Config:
     MONGODB_DB = os.environ.get('MONGODB_DB') or 'fastfood'
     # Tạo chuỗi kết nối MongoDB từ các thông tin trên, hoặc lấy từ biến môi trường nếu có
     MONGODB_URI = os.environ.get('MONGODB_URI') or f'mongodb://{MONGODB_HOST}:{MONGODB_PORT}/{MONGODB_DB}'
+    # Đặt MONGODB_LAZY_INIT=1 để không kết nối/tạo index khi tạo app mà đợi đến truy vấn đầu tiên
+    # (create_app(lazy_db=True) cũng bật chế độ này, các script bảo trì luôn dùng)
+    MONGODB_LAZY_INIT = os.environ.get('MONGODB_LAZY_INIT') == '1'
     
     # Cấu hình Session
     # Thời gian sống của session là 24 giờ
@@ -34,6 +37,96 @@ class Config:
     # Các định dạng file hình ảnh được phép upload
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
     
+    # Cấu hình Cache HTML của catalog (trang chủ, menu nhà hàng)
+    # Số khối HTML tối đa giữ trong bộ nhớ mỗi process (LRU)
+    FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE') or 256)
+    # Thời gian (giây) mỗi process dùng lại version catalog trước khi đọc lại từ database
+    CATALOG_VERSION_TTL = float(os.environ.get('CATALOG_VERSION_TTL') or 1.0)
+    
+    # Cấu hình Web server production (wsgi.py, gunicorn.conf.py)
+    # Địa chỉ lắng nghe
+    WEB_BIND = os.environ.get('WEB_BIND') or '0.0.0.0:5000'
+    # Số process worker, mặc định bằng số CPU (mỗi process có nhiều thread vì phần lớn thời gian chờ MongoDB)
+    WEB_WORKERS = int(os.environ.get('WEB_WORKERS') or os.cpu_count() or 1)
+    # Số thread mỗi worker (gthread); với waitress là tổng số thread của process
+    WEB_THREADS = int(os.environ.get('WEB_THREADS') or 4)
+    # Loại worker của gunicorn: gthread (mặc định) hoặc gevent (cần cài gevent)
+    WEB_WORKER_CLASS = os.environ.get('WEB_WORKER_CLASS') or 'gthread'
+    # Thời gian (giây) giữ kết nối keep-alive chờ request tiếp theo
+    WEB_KEEPALIVE = int(os.environ.get('WEB_KEEPALIVE') or 5)
+    # Worker không phản hồi quá số giây này sẽ bị khởi động lại
+    WEB_TIMEOUT = int(os.environ.get('WEB_TIMEOUT') or 30)
+    # Thời gian (giây) chờ worker xử lý nốt request khi reload/tắt
+    WEB_GRACEFUL_TIMEOUT = int(os.environ.get('WEB_GRACEFUL_TIMEOUT') or 30)
+    # Khởi động lại worker sau số request này (0 = không) để giới hạn bộ nhớ bị phân mảnh theo thời gian
+    WEB_MAX_REQUESTS = int(os.environ.get('WEB_MAX_REQUESTS') or 0)
+    
+    # Thư mục chứa snapshot catalog (file nhị phân các worker mmap dùng chung); để trống để tắt
+    CATALOG_SNAPSHOT_DIR = os.environ.get('CATALOG_SNAPSHOT_DIR', os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'catalog'))
+    
+    # Cấu hình Cache document nhà hàng/món ăn trong process (Restaurant.find_by_id, Menu.find_by_id, Menu.find_by_restaurant)
+    # Số entry tối đa (LRU); đặt 0 để tắt cache
+    MODEL_CACHE_SIZE = int(os.environ.get('MODEL_CACHE_SIZE') or 2048)
+    # Thời gian (giây) một entry được dùng lại; giới hạn độ cũ khi process khác ghi dữ liệu
+    MODEL_CACHE_TTL = float(os.environ.get('MODEL_CACHE_TTL') or 30)
+    
+    # Bus xóa cache giữa các process (app/utils/invalidation.py)
+    # auto: dùng change stream nếu MongoDB là replica set, nếu không thì poll cache_versions; đặt off để tắt
+    CACHE_BUS_MODE = os.environ.get('CACHE_BUS_MODE') or 'auto'
+    # Chu kỳ (giây) đọc số thứ tự event ở chế độ poll
+    CACHE_BUS_POLL_INTERVAL = float(os.environ.get('CACHE_BUS_POLL_INTERVAL') or 1.0)
+    
+    # Logging (app/utils/logs.py): ghi qua hàng đợi, mỗi dòng một object JSON có request_id
+    # Mức log: DEBUG, INFO, WARNING, ERROR
+    LOG_LEVEL = os.environ.get('LOG_LEVEL') or 'INFO'
+    # json hoặc text (dễ đọc khi phát triển)
+    LOG_FORMAT = os.environ.get('LOG_FORMAT') or 'json'
+    # Tỉ lệ request (0-1) được ghi log debug của code trong app; 0 để tắt
+    LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE') or 0.01)
+    
+    # Thống kê lệnh MongoDB theo request (app/utils/query_stats.py)
+    # Một dạng lệnh (collection + filter) chạy nhiều hơn số lần này trong một request bị cảnh báo N+1
+    QUERY_N_PLUS_ONE_THRESHOLD = int(os.environ.get('QUERY_N_PLUS_ONE_THRESHOLD') or 5)
+    # Đặt QUERY_STATS_HEADER=1 để thêm header Server-Timing cả khi không chạy debug
+    QUERY_STATS_HEADER = os.environ.get('QUERY_STATS_HEADER') == '1'
+    
+    # Nhật ký truy vấn chậm (app/utils/slow_queries.py, trang /admin/slow-queries)
+    # Lệnh MongoDB chạy lâu hơn số ms này được ghi lại kèm explain; đặt 0 để tắt
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS') or 100)
+    # Kích thước (bytes) capped collection slow_queries
+    SLOW_QUERY_LOG_SIZE = int(os.environ.get('SLOW_QUERY_LOG_SIZE') or 16 * 1024 * 1024)
+    
+    # Profile request (app/utils/profiler.py): admin thêm ?_profile=1 (cProfile) hoặc ?_profile=sample vào URL
+    # Thư mục lưu kết quả, xem ở /admin/profiles
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'profiles'))
+    # Số profile giữ lại (cũ hơn bị xóa)
+    PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP') or 50)
+    # Chu kỳ (giây) lấy mẫu stack ở chế độ sample
+    PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL') or 0.001)
+    
+    # Metrics Prometheus ở /metrics (app/utils/metrics.py)
+    # Thư mục dùng chung để gộp số liệu của mọi worker gunicorn; để trống thì /metrics chỉ có số liệu
+    # của worker trả lời request đó
+    METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR', '')
+    # Chu kỳ (giây) mỗi worker ghi số liệu ra thư mục trên
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL') or 5.0)
+    # Token Prometheus phải gửi (Authorization: Bearer ...); để trống thì chỉ request trực tiếp từ localhost đọc được
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+    
+    # Cấu hình Hàng đợi công việc nền (collection jobs, chạy bằng worker.py)
+    # Số thread xử lý job trong mỗi process worker
+    JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS') or 4)
+    # Thời gian (giây) một job được giữ bởi worker; quá thời gian này job được trả lại hàng đợi
+    JOB_VISIBILITY_TIMEOUT = int(os.environ.get('JOB_VISIBILITY_TIMEOUT') or 60)
+    # Số lần thử tối đa trước khi chuyển job sang collection jobs_dead
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS') or 5)
+    # Thời gian chờ (giây) giữa các lần kiểm tra khi hàng đợi trống
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL') or 1.0)
+    # Đặt JOB_RUN_INLINE=1 để chạy job ngay trong request (khi phát triển không chạy worker.py)
+    JOB_RUN_INLINE = os.environ.get('JOB_RUN_INLINE') == '1'
+    
     # Cấu hình Thanh toán - VnPay
     # ============================================
     # CẤU HÌNH VNPAY - Thay thế các giá trị bên dưới:
@@ -62,4 +155,6 @@ class Config:
     VNPAY_RETURN_URL = 'http://localhost:5000/customer/payment/vnpay_return'
     # URL IPN (Instant Payment Notification) - VnPay gọi đến server để thông báo kết quả thanh toán (server-to-server)
     VNPAY_IPN_URL = 'http://localhost:5000/customer/payment/vnpay_ipn'
+    # URL API truy vấn kết quả giao dịch (querydr) - dùng cho script đối soát reconcile_payments.py
+    VNPAY_API_URL = os.environ.get('VNPAY_API_URL') or 'https://sandbox.vnpayment.vn/merchant_webapi/api/transaction'
 
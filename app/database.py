@@ -1,19 +1,48 @@
 # Import thư viện MongoClient từ pymongo để tạo kết nối đến MongoDB
 from pymongo import MongoClient
-# Import lớp lỗi ConnectionFailure để xử lý khi kết nối thất bại
-from pymongo.errors import ConnectionFailure
+# Import lớp lỗi ConnectionFailure để xử lý khi kết nối thất bại, OperationFailure cho lỗi từ server
+# (index đã tồn tại với tùy chọn khác, dữ liệu trùng với index unique...)
+from pymongo.errors import ConnectionFailure, OperationFailure
 # Import current_app từ Flask để truy cập cấu hình ứng dụng
 from flask import current_app
+# Import threading để chỉ một thread tạo index khi khởi tạo trễ
+import threading
+# Import time để chờ giữa các lần thử tạo lại index
+import time
+# Import logging để ghi log kết nối / tạo index
+import logging
+
+logger = logging.getLogger(__name__)
 
 # Khai báo biến global để lưu trữ client MongoDB (kết nối đến server)
 client = None
 # Khai báo biến global để lưu trữ database instance (kết nối đến database cụ thể)
 db = None
+# URI và tên database đã dùng, để tạo lại client trong process con sau khi fork
+_settings = None
+# Khởi tạo trễ: index được kiểm tra ở lần get_db() đầu tiên thay vì khi tạo app
+_indexes_pending = False
+_indexes_lock = threading.Lock()
+# Tạo index lỗi (mất kết nối...) thì thử lại ở get_db() sau số giây này, không chặn mọi request trong lúc chờ
+INDEX_RETRY_SECONDS = 30
+_indexes_retry_at = 0.0
 
-def init_db(app):
-    """Khởi tạo kết nối MongoDB"""
+def init_db(app, lazy=False):
+    """
+    Khởi tạo kết nối MongoDB
+    Tham số: lazy (bool) - True: không ping, không tạo index khi khởi động; kết nối được mở ở truy vấn đầu tiên
+                           và index được kiểm tra ở lần get_db() đầu tiên (script, worker khởi động nhanh hơn)
+    """
     # Khai báo sử dụng biến global để có thể thay đổi giá trị từ trong hàm
-    global client, db
+    global client, db, _settings, _indexes_pending, _indexes_retry_at
+    _settings = (app.config['MONGODB_URI'], app.config['MONGODB_DB'])
+    
+    if lazy:
+        # connect=False: MongoClient chưa mở kết nối, chưa chạy thread giám sát
+        client = MongoClient(app.config['MONGODB_URI'], connect=False)
+        db = client[app.config['MONGODB_DB']]
+        _indexes_pending = True
+        return
     
     try:
         # Tạo kết nối đến MongoDB server sử dụng URI từ cấu hình ứng dụng
@@ -23,26 +52,51 @@ def init_db(app):
         
         # Kiểm tra kết nối bằng lệnh ping đến admin database
         client.admin.command('ping')
-        # In thông báo thành công khi kết nối được thiết lập
-        print(f"Connected to MongoDB: {app.config['MONGODB_DB']}")
+        # Ghi log khi kết nối được thiết lập
+        logger.info("Connected to MongoDB: %s", app.config['MONGODB_DB'])
         
-        # Gọi hàm tạo các index để tối ưu hiệu suất truy vấn
-        create_indexes(db)
+        # Gọi hàm tạo các index để tối ưu hiệu suất truy vấn (lỗi thì get_db() thử lại sau)
+        if not create_indexes(db):
+            _indexes_pending = True
+            _indexes_retry_at = time.monotonic() + INDEX_RETRY_SECONDS
         
     except ConnectionFailure as e:
-        print(f"Failed to connect to MongoDB: {e}")
+        logger.error("Failed to connect to MongoDB: %s", e)
         raise
 
+def reconnect_after_fork():
+    """
+    Tạo MongoClient mới trong process con (gunicorn preload_app fork từ process chính)
+    MongoClient không an toàn khi dùng chung qua fork: pool kết nối và thread giám sát thuộc về process cha
+    Client mới chỉ kết nối khi có truy vấn đầu tiên, không ping và không tạo lại index
+    """
+    global client, db
+    if _settings is None:
+        return
+    uri, name = _settings
+    client = MongoClient(uri, connect=False)
+    db = client[name]
+
+def close_db():
+    """Đóng kết nối của process hiện tại (process chính của gunicorn không phục vụ request)"""
+    if client is not None:
+        client.close()
+
 def create_indexes(database):
-    """Tạo các index cho database để tối ưu hiệu suất truy vấn"""
+    """
+    Tạo các index cho database để tối ưu hiệu suất truy vấn
+    Lỗi từ server của từng index (đã tồn tại với tùy chọn khác, dữ liệu trùng...) chỉ ghi cảnh báo;
+    lỗi kết nối làm dừng và trả về False để lần sau thử lại
+    Trả về: True nếu đã chạy hết, False nếu bị lỗi giữa chừng
+    """
     try:
         # Tạo index cho collection users
         try:
             # Tạo index unique cho trường phone để đảm bảo số điện thoại không trùng lặp
             database.users.create_index("phone", unique=True)
-        except Exception as e:
-            # Nếu index đã tồn tại hoặc có lỗi thì in cảnh báo nhưng không dừng chương trình
-            print(f"Warning: Index users.phone already exists or error: {e}")
+        except OperationFailure as e:
+            # Nếu index đã tồn tại hoặc có lỗi thì ghi cảnh báo nhưng không dừng chương trình
+            logger.warning("Index users.phone already exists or error: %s", e)
         
         # Tạo index cho trường role để tìm kiếm người dùng theo vai trò nhanh hơn
         database.users.create_index("role")
@@ -53,9 +107,9 @@ def create_indexes(database):
         try:
             # Tạo index địa lý 2dsphere cho trường loc để hỗ trợ tìm kiếm theo vị trí (geospatial queries)
             database.restaurants.create_index([("loc", "2dsphere")])
-        except Exception as e:
-            # Nếu index đã tồn tại hoặc có lỗi thì in cảnh báo
-            print(f"Warning: Index restaurants.loc already exists or error: {e}")
+        except OperationFailure as e:
+            # Nếu index đã tồn tại hoặc có lỗi thì ghi cảnh báo
+            logger.warning("Index restaurants.loc already exists or error: %s", e)
         
         # Tạo index cho trường status để lọc nhà hàng theo trạng thái
         database.restaurants.create_index("status")
@@ -81,6 +135,9 @@ def create_indexes(database):
         database.orders.create_index("status")
         # Tạo index cho trường created_at để sắp xếp đơn hàng theo thời gian tạo
         database.orders.create_index("created_at")
+        # Tạo index cho outbox để script xử lý tác vụ phụ tìm đơn còn tồn đọng nhanh hơn
+        database.orders.create_index("outbox")
+        database.orders.create_index("outbox_claims.at")
         
         # Tạo index cho collection payments
         # Lưu ý: Không đặt unique vì một đơn hàng có thể có nhiều thanh toán (hoàn tiền, v.v.)
@@ -88,22 +145,35 @@ def create_indexes(database):
         database.payments.create_index("order_id")
         # Tạo index cho trường status để lọc thanh toán theo trạng thái
         database.payments.create_index("status")
+        # Tạo index kết hợp status + created_at để job đối soát tìm payment pending quá hạn
+        database.payments.create_index([("status", 1), ("created_at", 1)])
+        try:
+            # Tạo index unique cho txn_ref (mã giao dịch VnPay) để callback tìm payment không phải quét collection
+            # Chỉ áp dụng cho payment có txn_ref (thanh toán tiền mặt không có trường này)
+            database.payments.create_index(
+                "txn_ref",
+                unique=True,
+                partialFilterExpression={"txn_ref": {"$type": "string"}}
+            )
+        except OperationFailure as e:
+            # Nếu dữ liệu cũ có txn_ref trùng thì ghi cảnh báo
+            logger.warning("Index payments.txn_ref already exists or error: %s", e)
         
         # Tạo index cho collection reviews
         # Xóa index cũ nếu tồn tại và tạo lại với unique
         try:
             # Thử xóa index cũ có tên "order_id_1" nếu có
             database.reviews.drop_index("order_id_1")
-        except Exception:
+        except OperationFailure:
             # Nếu index không tồn tại thì bỏ qua, không cần xử lý
             pass
         
         try:
             # Tạo index unique cho trường order_id để đảm bảo mỗi đơn hàng chỉ có 1 đánh giá
             database.reviews.create_index("order_id", unique=True, name="order_id_unique")
-        except Exception as e:
-            # Nếu index đã tồn tại hoặc có lỗi thì in cảnh báo
-            print(f"Warning: Index reviews.order_id already exists or error: {e}")
+        except OperationFailure as e:
+            # Nếu index đã tồn tại hoặc có lỗi thì ghi cảnh báo
+            logger.warning("Index reviews.order_id already exists or error: %s", e)
         
         # Tạo index cho trường restaurant_id để tìm đánh giá theo nhà hàng
         database.reviews.create_index("restaurant_id")
@@ -116,15 +186,55 @@ def create_indexes(database):
         # Tạo index cho trường menu_ratings.menu_id (nested field) để tìm đánh giá món ăn nhanh hơn
         database.reviews.create_index("menu_ratings.menu_id")
         
-        # In thông báo thành công khi tạo xong tất cả index
-        print("Database indexes created successfully")
+        # Tạo index cho collection jobs (hàng đợi công việc nền)
+        # Index để worker tìm job đang chờ theo thời gian chạy
+        database.jobs.create_index([("status", 1), ("run_at", 1)])
+        # Index để worker tìm job đã hết hạn lease
+        database.jobs.create_index([("status", 1), ("lease_expires_at", 1)])
+        # TTL index: tự xóa job đã xong sau 1 ngày (job chưa xong không có finished_at nên không bị xóa)
+        database.jobs.create_index("finished_at", expireAfterSeconds=86400)
+        
+        # Tạo index cho collection revenue_credits (mỗi lần cộng tiền của một đơn cho một user)
+        # Index unique để job chạy lại không cộng doanh thu / tiền ship hai lần (xem app/utils/revenue.py)
+        database.revenue_credits.create_index([("order_id", 1), ("user_id", 1)], unique=True)
+        
+        # Tạo index cho collection cache_invalidations (event xóa cache khi MongoDB không có change stream)
+        # Process web tìm event theo số thứ tự
+        database.cache_invalidations.create_index("seq", unique=True)
+        # TTL index: event chỉ cần giữ vài phút, xóa sau 1 giờ
+        database.cache_invalidations.create_index("at", expireAfterSeconds=3600)
+        
+        # Tạo capped collection slow_queries (nhật ký truy vấn chậm, tự ghi đè bản ghi cũ nhất khi đầy)
+        from app.utils.slow_queries import create_collection as create_slow_query_log
+        create_slow_query_log(database)
+        
+        # Ghi log khi tạo xong tất cả index
+        logger.info("Database indexes created successfully")
+        return True
         
     except Exception as e:
-        # Bắt mọi lỗi khác và in cảnh báo nhưng không dừng chương trình
-        print(f"Warning: Could not create all indexes: {e}")
+        # Bắt mọi lỗi khác và ghi cảnh báo nhưng không dừng chương trình
+        logger.warning("Could not create all indexes: %s", e)
+        return False
+
+def ensure_indexes():
+    """
+    Tạo index một lần cho process (chế độ khởi tạo trễ), các thread khác chờ đến khi xong
+    Chỉ đánh dấu xong khi tạo thành công; lỗi thì thử lại sau INDEX_RETRY_SECONDS
+    """
+    global _indexes_pending, _indexes_retry_at
+    with _indexes_lock:
+        if _indexes_pending and time.monotonic() >= _indexes_retry_at:
+            if create_indexes(db):
+                _indexes_pending = False
+            else:
+                _indexes_retry_at = time.monotonic() + INDEX_RETRY_SECONDS
 
 def get_db():
     """Lấy instance database để sử dụng trong các route và hàm khác"""
+    # Chế độ khởi tạo trễ: lần gọi đầu tiên kiểm tra index trước khi trả về
+    if _indexes_pending and time.monotonic() >= _indexes_retry_at:
+        ensure_indexes()
     # Trả về biến global db đã được khởi tạo trong hàm init_db
     return db
 
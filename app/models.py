@@ -2,8 +2,16 @@
 from datetime import datetime
 # Import ObjectId từ bson để chuyển đổi string ID sang ObjectId của MongoDB
 from bson import ObjectId
+# Import ReturnDocument để lấy document sau khi cập nhật bằng find_one_and_update
+from pymongo import ReturnDocument
 # Import hàm get_db để lấy database instance từ database.py
 from app.database import get_db
+# Import hàm tăng version catalog để làm mất hiệu lực cache HTML khi menu/nhà hàng thay đổi
+from app.utils.fragment_cache import bump_catalog_version
+# Import cache document nhà hàng/món ăn trong process (đọc nhiều, ít thay đổi)
+from app.utils.doc_cache import catalog_cache
+# Import publish để báo cho process khác xóa cache (bus xóa cache)
+from app.utils.invalidation import publish
 
 class User:
     """Class User - Model quản lý người dùng (khách hàng, admin, shipper, chủ nhà hàng)"""
@@ -70,18 +78,23 @@ class User:
         return list(get_db().users.find({"role": role}))
     
     @staticmethod
-    def save_cart(user_id, cart):
+    def save_cart(user_id, cart, cart_meta=None):
         """
         Lưu giỏ hàng của người dùng vào database
         Tham số:
             user_id (string) - ID của user
             cart (dict) - Dictionary chứa thông tin giỏ hàng (menu_id: quantity)
+            cart_meta (dict, optional) - Metadata giỏ hàng (rest_id đã ghim và giá chụp theo từng món)
         Trả về: Kết quả của thao tác update
         """
         # Cập nhật trường cart và cart_updated_at của user trong database
+        update_data = {"cart": cart, "cart_updated_at": datetime.now()}
+        # Lưu metadata cùng lúc để giỏ hàng nạp lại khi đăng nhập không cần migrate
+        if cart_meta is not None:
+            update_data["cart_meta"] = cart_meta
         return get_db().users.update_one(
             {"_id": ObjectId(user_id)},  # Tìm user theo ID
-            {"$set": {"cart": cart, "cart_updated_at": datetime.now()}}  # Cập nhật giỏ hàng và thời gian
+            {"$set": update_data}  # Cập nhật giỏ hàng và thời gian
         )
     
     @staticmethod
@@ -92,7 +105,7 @@ class User:
         Trả về: Dictionary chứa giỏ hàng, hoặc {} nếu không tìm thấy user hoặc không có giỏ hàng
         """
         # Tìm user theo ID
-        user = get_db().users.find_one({"_id": ObjectId(user_id)})
+        user = get_db().users.find_one({"_id": ObjectId(user_id)}, {"cart": 1})
         # Nếu tìm thấy user và có trường cart thì trả về cart, ngược lại trả về dictionary rỗng
         return user.get('cart', {}) if user else {}
 
@@ -126,8 +139,12 @@ class Restaurant:
         Tham số: rest_id (string) - ID của restaurant cần tìm
         Trả về: Document của restaurant nếu tìm thấy, None nếu không tìm thấy
         """
-        # Chuyển rest_id từ string sang ObjectId và tìm restaurant có _id khớp
-        return get_db().restaurants.find_one({"_id": ObjectId(rest_id)})
+        # Chuyển rest_id từ string sang ObjectId và tìm restaurant có _id khớp (qua cache)
+        rest_oid = ObjectId(rest_id)
+        return catalog_cache.get(
+            ('restaurant', str(rest_oid)),
+            lambda: get_db().restaurants.find_one({"_id": rest_oid})
+        )
     
     @staticmethod
     def find_by_owner(owner_id):
@@ -195,10 +212,39 @@ class Restaurant:
         if 'owner_id' in data and data['owner_id']:
             data['owner_id'] = ObjectId(data['owner_id'])
         # Cập nhật document có _id khớp với rest_id
-        return get_db().restaurants.update_one(
+        result = get_db().restaurants.update_one(
             {"_id": ObjectId(rest_id)},  # Điều kiện tìm
             {"$set": data}  # Cập nhật các trường trong data
         )
+        # Thông tin nhà hàng hiển thị trong catalog: làm mất hiệu lực cache document và cache HTML
+        Restaurant.invalidate(rest_id)
+        return result
+    
+    @staticmethod
+    def set_rating(rest_id, rating):
+        """
+        Ghi điểm đánh giá trung bình (job tính lại sau mỗi review)
+        Chỉ làm mất hiệu lực cache catalog khi điểm hiển thị (đã làm tròn) thay đổi: mỗi review không xóa
+        toàn bộ cache HTML và ETag của catalog
+        Tham số:
+            rest_id (string) - ID của restaurant
+            rating (float) - Điểm trung bình đã làm tròn (Review.calculate_restaurant_rating)
+        Trả về: True nếu điểm thay đổi
+        """
+        result = get_db().restaurants.update_one(
+            {"_id": ObjectId(rest_id), "rating": {"$ne": rating}},
+            {"$set": {"rating": rating}}
+        )
+        if result.modified_count:
+            Restaurant.invalidate(rest_id)
+        return result.modified_count > 0
+    
+    @staticmethod
+    def invalidate(rest_id):
+        """Xóa nhà hàng khỏi cache sau khi ghi (dùng cả cho route admin duyệt/khóa nhà hàng)"""
+        catalog_cache.invalidate(('restaurant', str(rest_id)))
+        publish('restaurants', str(rest_id))
+        bump_catalog_version()
 
 class Menu:
     """Class Menu - Model quản lý món ăn/thực đơn của nhà hàng"""
@@ -213,12 +259,17 @@ class Menu:
         Trả về: List các document menu thuộc về restaurant đó
         """
         # Tạo query cơ bản: tìm menu có rest_id khớp
-        query = {"rest_id": ObjectId(rest_id)}
+        rest_oid = ObjectId(rest_id)
+        query = {"rest_id": rest_oid}
         # Nếu có filters thì thêm vào query
         if filters:
             query.update(filters)
-        # Tìm tất cả menu theo query và chuyển thành list
-        return list(get_db().menus.find(query))
+        # Tìm tất cả menu theo query và chuyển thành list (qua cache, nhóm theo nhà hàng để xóa khi menu thay đổi)
+        return catalog_cache.get(
+            ('menus', str(rest_oid), repr(sorted((filters or {}).items()))),
+            lambda: list(get_db().menus.find(query)),
+            group=str(rest_oid)
+        )
     
     @staticmethod
     def find_by_id(menu_id):
@@ -227,8 +278,12 @@ class Menu:
         Tham số: menu_id (string) - ID của menu cần tìm
         Trả về: Document của menu nếu tìm thấy, None nếu không tìm thấy
         """
-        # Chuyển menu_id từ string sang ObjectId và tìm menu có _id khớp
-        return get_db().menus.find_one({"_id": ObjectId(menu_id)})
+        # Chuyển menu_id từ string sang ObjectId và tìm menu có _id khớp (qua cache)
+        menu_oid = ObjectId(menu_id)
+        return catalog_cache.get(
+            ('menu', str(menu_oid)),
+            lambda: get_db().menus.find_one({"_id": menu_oid})
+        )
     
     @staticmethod
     def create(data):
@@ -243,6 +298,8 @@ class Menu:
         data['created_at'] = datetime.now()
         # Chèn document mới vào collection menus
         result = get_db().menus.insert_one(data)
+        # Làm mất hiệu lực danh sách món của nhà hàng và cache HTML của catalog
+        Menu.invalidate(result.inserted_id, data['rest_id'])
         # Trả về ID của menu vừa được tạo
         return result.inserted_id
     
@@ -253,28 +310,71 @@ class Menu:
         Tham số:
             menu_id (string) - ID của menu cần cập nhật
             data (dict) - Dictionary chứa các trường cần cập nhật
-        Trả về: Kết quả của thao tác update
+        Trả về: Document menu trước khi cập nhật (chỉ có rest_id), None nếu không tìm thấy
         """
         # Thêm thời gian cập nhật vào dữ liệu
         data['updated_at'] = datetime.now()
         # Nếu có rest_id trong data thì chuyển sang ObjectId
         if 'rest_id' in data:
             data['rest_id'] = ObjectId(data['rest_id'])
-        # Cập nhật document có _id khớp với menu_id
-        return get_db().menus.update_one(
+        # Cập nhật document có _id khớp với menu_id (lấy rest_id cũ để xóa danh sách món của nhà hàng khỏi cache)
+        before = get_db().menus.find_one_and_update(
             {"_id": ObjectId(menu_id)},  # Điều kiện tìm
-            {"$set": data}  # Cập nhật các trường trong data
+            {"$set": data},  # Cập nhật các trường trong data
+            projection={"rest_id": 1}
         )
+        # Làm mất hiệu lực cache document và cache HTML của catalog
+        Menu.invalidate(menu_id, before and before.get('rest_id'), data.get('rest_id'))
+        return before
+    
+    @staticmethod
+    def set_image_variants(menu_id, image_url, variants):
+        """
+        Ghi các bản thu nhỏ của ảnh món ăn (do worker tạo)
+        Chỉ ghi khi món ăn vẫn dùng ảnh image_url (chủ nhà hàng có thể đã đổi ảnh khác)
+        Tham số:
+            menu_id (string) - ID của menu
+            image_url (string) - URL ảnh gốc đã xử lý
+            variants (dict) - Kết quả của images.make_variants
+        Trả về: Document menu (chỉ có rest_id) nếu đã cập nhật, None nếu ảnh đã thay đổi
+        """
+        menu = get_db().menus.find_one_and_update(
+            {"_id": ObjectId(menu_id), "image_url": image_url},
+            {"$set": {"image_variants": variants}},
+            projection={"rest_id": 1}
+        )
+        # Catalog đổi sang dùng ảnh thu nhỏ
+        if menu:
+            Menu.invalidate(menu_id, menu.get('rest_id'))
+        return menu
     
     @staticmethod
     def delete(menu_id):
         """
         Xóa món ăn
         Tham số: menu_id (string) - ID của menu cần xóa
-        Trả về: Kết quả của thao tác delete
+        Trả về: Document menu đã xóa (chỉ có rest_id), None nếu không tìm thấy
         """
         # Xóa document có _id khớp với menu_id
-        return get_db().menus.delete_one({"_id": ObjectId(menu_id)})
+        deleted = get_db().menus.find_one_and_delete({"_id": ObjectId(menu_id)}, projection={"rest_id": 1})
+        # Làm mất hiệu lực cache document và cache HTML của catalog
+        Menu.invalidate(menu_id, deleted and deleted.get('rest_id'))
+        return deleted
+    
+    @staticmethod
+    def invalidate(menu_id, *rest_ids):
+        """
+        Xóa món ăn và danh sách món của các nhà hàng liên quan khỏi cache sau khi ghi
+        Tham số:
+            menu_id (string) - ID của menu
+            *rest_ids - ID nhà hàng chứa món (trước/sau khi cập nhật), None được bỏ qua
+        """
+        catalog_cache.invalidate(('menu', str(menu_id)))
+        rest_ids = sorted({str(rest_id) for rest_id in rest_ids if rest_id})
+        for rest_id in rest_ids:
+            catalog_cache.invalidate_group(rest_id)
+        publish('menus', str(menu_id), {'rest_ids': rest_ids})
+        bump_catalog_version()
 
 class Order:
     """Class Order - Model quản lý đơn hàng"""
@@ -360,6 +460,19 @@ class Order:
             {"$set": update_data}  # Cập nhật trạng thái và shipper_id (nếu có)
         )
     
+    @staticmethod
+    def touch(order_id):
+        """
+        Cập nhật updated_at của đơn hàng khi dữ liệu hiển thị cùng đơn (payment, review) thay đổi
+        Trang chi tiết đơn hàng dùng updated_at làm ETag / Last-Modified
+        Tham số: order_id (string hoặc ObjectId) - ID của order
+        Trả về: Kết quả của thao tác update
+        """
+        return get_db().orders.update_one(
+            {"_id": ObjectId(order_id)},
+            {"$set": {"updated_at": datetime.now()}}
+        )
+    
     @staticmethod
     def confirm_received(order_id, user_id):
         """
@@ -416,6 +529,44 @@ class Payment:
         # Trả về ID của payment vừa được tạo
         return result.inserted_id
     
+    @staticmethod
+    def find_by_txn_ref(txn_ref):
+        """
+        Tìm thanh toán theo mã giao dịch gửi sang VnPay (vnp_TxnRef)
+        Tham số: txn_ref (string) - Mã giao dịch
+        Trả về: Document của payment nếu tìm thấy, None nếu không tìm thấy
+        """
+        # Dùng unique index payments.txn_ref nên không phải quét toàn bộ collection
+        return get_db().payments.find_one({"txn_ref": txn_ref})
+    
+    @staticmethod
+    def settle_pending(txn_ref, status, data=None, amount=None):
+        """
+        Chuyển thanh toán từ pending sang trạng thái mới trong một lệnh find_one_and_update
+        Callback gửi lại (IPN retry, return + IPN cùng lúc) sẽ không khớp điều kiện nên là no-op
+        Tham số:
+            txn_ref (string) - Mã giao dịch (vnp_TxnRef)
+            status (string) - Trạng thái mới (success, failed)
+            data (dict, optional) - Các trường cập nhật thêm (transaction_id, bank_code, paid_at, v.v.)
+            amount (float, optional) - Số tiền VnPay báo về, nếu có thì phải khớp với payment
+        Trả về: Document payment sau khi cập nhật, None nếu không có payment pending phù hợp
+        """
+        query = {"txn_ref": txn_ref, "status": "pending"}
+        # Kiểm tra số tiền ngay trong điều kiện cập nhật
+        if amount is not None:
+            query["amount"] = amount
+        update_data = dict(data or {})
+        update_data.update({"status": status, "updated_at": datetime.now()})
+        payment = get_db().payments.find_one_and_update(
+            query,
+            {"$set": update_data},
+            return_document=ReturnDocument.AFTER
+        )
+        # Trang đơn hàng hiển thị trạng thái thanh toán: đổi ETag của trang
+        if payment:
+            Order.touch(payment['order_id'])
+        return payment
+    
     @staticmethod
     def update_status(payment_id, status):
         """
@@ -426,10 +577,15 @@ class Payment:
         Trả về: Kết quả của thao tác update
         """
         # Cập nhật document có _id khớp với payment_id, cập nhật status và updated_at
-        return get_db().payments.update_one(
+        result = get_db().payments.update_one(
             {"_id": ObjectId(payment_id)},  # Điều kiện tìm
             {"$set": {"status": status, "updated_at": datetime.now()}}  # Cập nhật trạng thái và thời gian
         )
+        if result.modified_count:
+            payment = get_db().payments.find_one({"_id": ObjectId(payment_id)}, {"order_id": 1})
+            if payment and payment.get('order_id'):
+                Order.touch(payment['order_id'])
+        return result
 
 class Review:
     """Class Review - Model quản lý đánh giá (nhà hàng, shipper, món ăn)"""
@@ -466,9 +622,31 @@ class Review:
                     menu_rating['menu_id'] = ObjectId(menu_rating['menu_id'])
         # Chèn document mới vào collection reviews
         result = get_db().reviews.insert_one(data)
+        # Đánh giá hiển thị trên trang đơn hàng: đổi ETag của trang
+        if data.get('order_id'):
+            Order.touch(data['order_id'])
         # Trả về ID của review vừa được tạo
         return result.inserted_id
     
+    @staticmethod
+    def set_image_variants(review_id, images, variants):
+        """
+        Ghi các bản thu nhỏ của ảnh đánh giá (do worker tạo)
+        Tham số:
+            review_id (string) - ID của review
+            images (list) - Danh sách URL ảnh gốc đã xử lý (phải khớp với review hiện tại)
+            variants (list) - Kết quả make_variants cho từng ảnh, cùng thứ tự với images
+        Trả về: Review (chỉ có order_id) nếu đã cập nhật, None nếu ảnh đã thay đổi
+        """
+        review = get_db().reviews.find_one_and_update(
+            {"_id": ObjectId(review_id), "images": images},
+            {"$set": {"image_variants": variants}},
+            projection={"order_id": 1}
+        )
+        if review and review.get('order_id'):
+            Order.touch(review['order_id'])
+        return review
+    
     @staticmethod
     def find_by_order(order_id):
         """
@@ -1,9 +1,10 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, send_file
 from app.models import User, Restaurant, Order, Payment
 from app.utils.auth import login_required, role_required, get_current_user
-from app.utils.helpers import to_object_id, paginate
+from app.utils.helpers import to_object_id, paginate, find_by_ids
 from app.database import get_db
 from datetime import datetime
+import os
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -94,13 +95,10 @@ def restaurants():
     
     restaurants_list = Restaurant.find_all(filters)
     
-    # Lấy thông tin chủ nhà hàng cho mỗi restaurant
+    # Lấy thông tin chủ nhà hàng của tất cả restaurant bằng một truy vấn $in
+    owners = find_by_ids(get_db().users, [r['owner_id'] for r in restaurants_list if r.get('owner_id')])
     for restaurant in restaurants_list:
-        if restaurant.get('owner_id'):
-            owner = User.find_by_id(str(restaurant['owner_id']))
-            restaurant['owner'] = owner
-        else:
-            restaurant['owner'] = None
+        restaurant['owner'] = owners.get(str(restaurant['owner_id'])) if restaurant.get('owner_id') else None
     
     return render_template('admin/restaurants.html', restaurants=restaurants_list)
 
@@ -113,6 +111,8 @@ def approve_restaurant(rest_id):
         {'_id': to_object_id(rest_id)},
         {'$set': {'status': 'approved', 'updated_at': datetime.now()}}
     )
+    # Nhà hàng xuất hiện/biến mất khỏi catalog: làm mất hiệu lực cache document và cache HTML
+    Restaurant.invalidate(rest_id)
     flash('Đã duyệt nhà hàng', 'success')
     return redirect(url_for('admin.restaurants'))
 
@@ -125,6 +125,8 @@ def ban_restaurant(rest_id):
         {'_id': to_object_id(rest_id)},
         {'$set': {'status': 'banned', 'updated_at': datetime.now()}}
     )
+    # Nhà hàng xuất hiện/biến mất khỏi catalog: làm mất hiệu lực cache document và cache HTML
+    Restaurant.invalidate(rest_id)
     flash('Đã khóa nhà hàng', 'success')
     return redirect(url_for('admin.restaurants'))
 
@@ -193,7 +195,8 @@ def order_detail(order_id):
     
     restaurant = Restaurant.find_by_id(str(order['rest_id']))
     user = User.find_by_id(str(order['user_id']))
-    payment = Payment.find_by_order(order_id)
+    # Đơn đặt qua OrderService có payment nhúng, đơn cũ/VnPay đọc từ collection payments
+    payment = order.get('payment') or Payment.find_by_order(order_id)
     
     return render_template('admin/order_detail.html',
                          order=order,
@@ -208,10 +211,14 @@ def restaurant_owners():
     """View mapping between restaurant owners and restaurants"""
     owners = User.find_by_role('restaurant_owner')
     
-    # Lấy thông tin nhà hàng cho mỗi owner
+    # Lấy nhà hàng của tất cả owner bằng một truy vấn rồi nhóm theo owner_id
+    restaurants_by_owner = {}
+    for restaurant in get_db().restaurants.find({'owner_id': {'$in': [owner['_id'] for owner in owners]}}):
+        restaurants_by_owner.setdefault(str(restaurant['owner_id']), []).append(restaurant)
+    
     owners_data = []
     for owner in owners:
-        restaurants = Restaurant.find_by_owner(str(owner['_id']))
+        restaurants = restaurants_by_owner.get(str(owner['_id']), [])
         owners_data.append({
             'owner': owner,
             'restaurants': restaurants,
@@ -220,3 +227,46 @@ def restaurant_owners():
     
     return render_template('admin/restaurant_owners.html', owners_data=owners_data)
 
+@admin_bp.route('/slow-queries')
+@login_required
+@role_required('admin')
+def slow_queries():
+    """Slowest MongoDB query shapes"""
+    from app.utils.slow_queries import worst_shapes
+    shapes = worst_shapes()
+    return render_template('admin/slow_queries.html', shapes=shapes,
+                           threshold_ms=current_app.config.get('SLOW_QUERY_MS', 0))
+
+@admin_bp.route('/profiles')
+@login_required
+@role_required('admin')
+def profiles():
+    """Saved request profiles"""
+    from app.utils.profiler import list_profiles
+    return render_template('admin/profiles.html', profiles=list_profiles())
+
+@admin_bp.route('/profiles/<profile_id>')
+@login_required
+@role_required('admin')
+def profile_detail(profile_id):
+    """Request profile summary"""
+    from app.utils.profiler import load_profile
+    loaded = load_profile(profile_id)
+    if not loaded:
+        flash('Profile không tồn tại', 'danger')
+        return redirect(url_for('admin.profiles'))
+    meta, _, summary = loaded
+    return render_template('admin/profile_detail.html', profile=meta, summary=summary)
+
+@admin_bp.route('/profiles/<profile_id>/download')
+@login_required
+@role_required('admin')
+def download_profile(profile_id):
+    """Download raw profile (.pstats or .folded)"""
+    from app.utils.profiler import load_profile
+    loaded = load_profile(profile_id)
+    if not loaded:
+        flash('Profile không tồn tại', 'danger')
+        return redirect(url_for('admin.profiles'))
+    _, path, _ = loaded
+    return send_file(path, as_attachment=True, download_name=os.path.basename(path))
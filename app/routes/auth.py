@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, request, redirect, url_for, sessio
 from app.models import User
 from app.utils.auth import login_required
 from app.utils.helpers import to_object_id
+from app.utils.cart import load_user_cart
 from app import bcrypt
 
 auth_bp = Blueprint('auth', __name__)
@@ -51,11 +52,9 @@ def login():
                 session.permanent = True
                 
                 # Load cart từ database vào session (nếu là customer)
+                # Dùng luôn document user vừa đọc, giỏ hàng cũ sẽ được bổ sung metadata
                 if user.get('role') == 'customer':
-                    cart = User.get_cart(str(user['_id']))
-                    if cart:
-                        session['cart'] = cart
-                        session.modified = True
+                    load_user_cart(user)
                 
             # Redirect based on role
             role = user.get('role')
@@ -133,7 +132,7 @@ def logout():
     if user_id and session.get('user_role') == 'customer':
         cart = session.get('cart', {})
         if cart:
-            User.save_cart(user_id, cart)
+            User.save_cart(user_id, cart, session.get('cart_meta'))
     
     session.clear()
     flash('Đã đăng xuất thành công', 'info')
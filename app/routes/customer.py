@@ -1,13 +1,24 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify, current_app, url_for as flask_url_for
 from app.models import Restaurant, Menu, Order, Payment, User, Review
 from app.utils.auth import login_required, get_current_user
-from app.utils.helpers import to_object_id, format_currency, paginate
-from app.utils.vnpay import VnPay
+from app.utils.helpers import to_object_id, format_currency, paginate, find_by_ids
+from app.utils.vnpay import VnPay, get_vnpay
+from app.utils import cart as cart_utils
+from app.utils.order_service import OrderService, DELIVERY_FEE
+from app.utils.jobs import enqueue
+from app.utils.uploads import save_upload
+from app.utils.fragment_cache import get_fragment_cache, catalog_version
+from app.utils.conditional import page_etag, not_modified, with_validators
+from app.utils.catalog_snapshot import get_catalog_snapshot
 from app.database import get_db
 from datetime import datetime
 from werkzeug.utils import secure_filename
 from bson import ObjectId
 import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
 
 customer_bp = Blueprint('customer', __name__, url_prefix='/customer')
 
@@ -43,29 +54,47 @@ def restaurants():
     category_filter = request.args.get('category', '')
     status_filter = request.args.get('status', 'approved')
     
-    filters = {'status': status_filter}
-    if search:
-        filters['$or'] = [
-            {'name': {'$regex': search, '$options': 'i'}},
-            {'addr': {'$regex': search, '$options': 'i'}}
-        ]
-    
-    restaurants = Restaurant.find_all(filters)
+    # Danh sách nhà hàng đã duyệt: tìm trong snapshot catalog (mmap) thay vì truy vấn database
+    snapshot = get_catalog_snapshot() if status_filter == 'approved' else None
+    if snapshot is not None:
+        restaurants = snapshot.restaurants()
+        if search:
+            try:
+                pattern = re.compile(search, re.IGNORECASE)
+            except re.error:
+                pattern = re.compile(re.escape(search), re.IGNORECASE)
+            restaurants = [r for r in restaurants
+                           if pattern.search(str(r.get('name', ''))) or pattern.search(str(r.get('addr', '')))]
+        menus_of = lambda rest_id: snapshot.menus(rest_id)
+    else:
+        filters = {'status': status_filter}
+        if search:
+            filters['$or'] = [
+                {'name': {'$regex': search, '$options': 'i'}},
+                {'addr': {'$regex': search, '$options': 'i'}}
+            ]
+        
+        restaurants = Restaurant.find_all(filters)
+        # Món đang bán của mọi nhà hàng trong danh sách: một truy vấn $in, nhóm theo rest_id
+        available = {}
+        if restaurants:
+            for menu in get_db().menus.find({'rest_id': {'$in': [rest['_id'] for rest in restaurants]},
+                                             'status': 'available'}):
+                available.setdefault(str(menu['rest_id']), []).append(menu)
+        menus_of = lambda rest_id: available.get(rest_id, [])
+    
+    # Món đang bán của từng nhà hàng (dùng cho cả lọc category và danh sách category)
+    menus_by_restaurant = {str(rest['_id']): menus_of(str(rest['_id'])) for rest in restaurants}
     
     # Nếu có filter category, chỉ hiển thị nhà hàng có món ăn thuộc category đó
     if category_filter:
-        filtered_restaurants = []
-        for rest in restaurants:
-            menus = Menu.find_by_restaurant(str(rest['_id']), {'cat': category_filter, 'status': 'available'})
-            if menus:
-                filtered_restaurants.append(rest)
-        restaurants = filtered_restaurants
+        restaurants = [rest for rest in restaurants
+                       if any(menu.get('cat') == category_filter for menu in menus_by_restaurant[str(rest['_id'])])]
     
     # Lấy tất cả categories từ menu items
     all_categories = set()
     for rest in restaurants:
-        menus = Menu.find_by_restaurant(str(rest['_id']), {'status': 'available'})
-        for menu in menus:
+        for menu in menus_by_restaurant[str(rest['_id'])]:
             if menu.get('cat'):
                 all_categories.add(menu.get('cat'))
     
@@ -87,24 +116,44 @@ def restaurants():
 @login_required
 def restaurant_detail(rest_id):
     """Restaurant detail with menu"""
-    restaurant = Restaurant.find_by_id(rest_id)
+    # Nhà hàng/menu chưa đổi kể từ lần xem trước: trả 304 trước khi truy vấn
+    etag = page_etag('restaurant', rest_id, catalog_version())
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    # Nhà hàng đã duyệt có trong snapshot catalog (mmap); nhà hàng khác hoặc chưa có snapshot thì đọc database
+    snapshot = get_catalog_snapshot()
+    restaurant = snapshot.restaurant(rest_id) if snapshot is not None else None
+    if restaurant is None:
+        restaurant = Restaurant.find_by_id(rest_id)
+        snapshot = None
     if not restaurant:
         flash('Nhà hàng không tồn tại', 'danger')
         return redirect(url_for('customer.restaurants'))
     
-    # Get menus - filter only available
-    menus = Menu.find_by_restaurant(rest_id, {'status': 'available'})
-    
-    # Import function từ main.py để gán hình ảnh
-    from app.routes.main import get_menu_image
+    def render_menu_grid():
+        # Get menus - filter only available
+        if snapshot is not None:
+            menus = snapshot.menus(rest_id)
+        else:
+            menus = Menu.find_by_restaurant(rest_id, {'status': 'available'})
+        
+        # Import function từ main.py để gán hình ảnh
+        from app.routes.main import get_menu_image
+        
+        # Gán hình ảnh cho mỗi menu item
+        for menu in menus:
+            menu['display_image'] = get_menu_image(menu)
+        
+        return render_template('customer/_menu_grid.html', restaurant=restaurant, menus=menus)
     
-    # Gán hình ảnh cho mỗi menu item
-    for menu in menus:
-        menu['display_image'] = get_menu_image(menu)
+    # Danh sách món giống nhau với mọi khách: lấy HTML từ cache, chỉ truy vấn + render khi catalog thay đổi
+    menu_grid_html = get_fragment_cache().get_or_render(('restaurant', str(restaurant['_id'])), render_menu_grid)
     
-    return render_template('customer/restaurant_detail.html',
-                         restaurant=restaurant,
-                         menus=menus)
+    return with_validators(render_template('customer/restaurant_detail.html',
+                                           restaurant=restaurant,
+                                           menu_grid_html=menu_grid_html), etag)
 
 @customer_bp.route('/cart')
 @login_required
@@ -115,20 +164,9 @@ def cart():
         flash('Phiên đăng nhập đã hết hạn. Vui lòng đăng nhập lại', 'warning')
         return redirect(url_for('auth.login'))
     
-    cart = session.get('cart', {})
-    cart_items = []
-    total = 0
-    
-    for menu_id, quantity in cart.items():
-        menu = Menu.find_by_id(menu_id)
-        if menu:
-            item_total = menu['price'] * quantity
-            cart_items.append({
-                'menu': menu,
-                'quantity': quantity,
-                'total': item_total
-            })
-            total += item_total
+    # Giá và tên món lấy từ bản chụp trong giỏ hàng, không cần đọc lại collection menus
+    cart, cart_meta = cart_utils.get_cart()
+    cart_items, total = cart_utils.cart_lines(cart, cart_meta)
     
     return render_template('customer/cart.html',
                          cart_items=cart_items,
@@ -166,25 +204,10 @@ def add_to_cart_from_home():
         flash('Món ăn không thuộc nhà hàng này', 'danger')
         return redirect(url_for('main.index'))
     
-    # Kiểm tra giỏ hàng hiện tại có món từ nhà hàng khác không
-    if 'cart' in session and session['cart']:
-        # Lấy rest_id của món đầu tiên trong giỏ hàng
-        first_menu_id = list(session['cart'].keys())[0]
-        first_menu = Menu.find_by_id(first_menu_id)
-        if first_menu and str(first_menu.get('rest_id')) != str(menu.get('rest_id')):
-            flash('Giỏ hàng của bạn đã có món từ nhà hàng khác. Vui lòng thanh toán hoặc xóa giỏ hàng trước khi thêm món mới.', 'warning')
-            return redirect(url_for('customer.cart'))
-    
-    # Thêm vào giỏ hàng
-    if 'cart' not in session:
-        session['cart'] = {}
-    
-    current_qty = session['cart'].get(menu_id, 0)
-    session['cart'][menu_id] = current_qty + quantity
-    session.modified = True
-    
-    # Lưu cart vào database
-    User.save_cart(str(user['_id']), session['cart'])
+    # Thêm vào giỏ hàng (kiểm tra nhà hàng bằng rest_id đã ghim trong giỏ, lưu luôn vào database)
+    if not cart_utils.add_item(str(user['_id']), menu, quantity):
+        flash('Giỏ hàng của bạn đã có món từ nhà hàng khác. Vui lòng thanh toán hoặc xóa giỏ hàng trước khi thêm món mới.', 'warning')
+        return redirect(url_for('customer.cart'))
     
     flash('Đã thêm món vào giỏ hàng!', 'success')
     return redirect(url_for('customer.cart'))
@@ -212,24 +235,10 @@ def add_to_cart():
             return redirect(url_for('customer.restaurant_detail', rest_id=rest_id))
         return redirect(url_for('customer.restaurants'))
     
-    # Kiểm tra giỏ hàng hiện tại có món từ nhà hàng khác không
-    if 'cart' in session and session['cart']:
-        # Lấy rest_id của món đầu tiên trong giỏ hàng
-        first_menu_id = list(session['cart'].keys())[0]
-        first_menu = Menu.find_by_id(first_menu_id)
-        if first_menu and str(first_menu.get('rest_id')) != str(menu.get('rest_id')):
-            flash('Giỏ hàng của bạn đã có món từ nhà hàng khác. Vui lòng thanh toán hoặc xóa giỏ hàng trước khi thêm món mới.', 'warning')
-            return redirect(url_for('customer.cart'))
-    
-    if 'cart' not in session:
-        session['cart'] = {}
-    
-    current_qty = session['cart'].get(menu_id, 0)
-    session['cart'][menu_id] = current_qty + quantity
-    session.modified = True
-    
-    # Lưu cart vào database
-    User.save_cart(str(user['_id']), session['cart'])
+    # Kiểm tra nhà hàng bằng rest_id đã ghim trong giỏ hàng, thêm món và lưu cart vào database
+    if not cart_utils.add_item(str(user['_id']), menu, quantity):
+        flash('Giỏ hàng của bạn đã có món từ nhà hàng khác. Vui lòng thanh toán hoặc xóa giỏ hàng trước khi thêm món mới.', 'warning')
+        return redirect(url_for('customer.cart'))
     
     flash('Đã thêm món vào giỏ hàng!', 'success')
     
@@ -264,17 +273,8 @@ def update_cart_quantity():
     if not menu:
         return jsonify({'success': False, 'message': 'Món ăn không tồn tại'}), 404
     
-    # Cập nhật số lượng trong session
-    if 'cart' not in session:
-        session['cart'] = {}
-    
-    if menu_id in session['cart']:
-        session['cart'][menu_id] = quantity
-        session.modified = True
-        
-        # Lưu cart vào database
-        User.save_cart(str(user['_id']), session['cart'])
-        
+    # Cập nhật số lượng trong session và lưu cart vào database
+    if cart_utils.set_quantity(str(user['_id']), menu_id, quantity):
         return jsonify({'success': True, 'message': 'Đã cập nhật số lượng'})
     else:
         return jsonify({'success': False, 'message': 'Món ăn không có trong giỏ hàng'}), 404
@@ -285,12 +285,8 @@ def remove_from_cart(menu_id):
     """Remove item from cart"""
     user = get_current_user()
     
-    if 'cart' in session and menu_id in session['cart']:
-        del session['cart'][menu_id]
-        session.modified = True
-        
-        # Lưu cart vào database
-        User.save_cart(str(user['_id']), session['cart'])
+    # Xóa món khỏi giỏ hàng và lưu cart vào database
+    cart_utils.remove_item(str(user['_id']), menu_id)
     
     return redirect(url_for('customer.cart'))
 
@@ -319,14 +315,18 @@ def reviews():
     # Lấy tất cả reviews của khách hàng này
     reviews_list = list(get_db().reviews.find({"user_id": ObjectId(user['_id'])}).sort("created_at", -1))
     
-    # Lấy thông tin nhà hàng và shipper cho mỗi review
+    # Lấy thông tin nhà hàng, shipper và đơn hàng của các review (mỗi collection một truy vấn $in)
+    db = get_db()
+    restaurants = find_by_ids(db.restaurants, [r['restaurant_id'] for r in reviews_list if r.get('restaurant_id')])
+    shippers = find_by_ids(db.users, [r['shipper_id'] for r in reviews_list if r.get('shipper_id')])
+    orders = find_by_ids(db.orders, [r['order_id'] for r in reviews_list if r.get('order_id')])
     for review in reviews_list:
         if review.get('restaurant_id'):
-            review['restaurant'] = Restaurant.find_by_id(str(review['restaurant_id']))
+            review['restaurant'] = restaurants.get(str(review['restaurant_id']))
         if review.get('shipper_id'):
-            review['shipper'] = User.find_by_id(str(review['shipper_id']))
+            review['shipper'] = shippers.get(str(review['shipper_id']))
         if review.get('order_id'):
-            review['order'] = Order.find_by_id(str(review['order_id']))
+            review['order'] = orders.get(str(review['order_id']))
     
     return render_template('customer/reviews.html', reviews=reviews_list)
 
@@ -359,9 +359,9 @@ def review_restaurant(rest_id):
         for file in files:
             if file and file.filename:
                 if allowed_file(file.filename):
-                    filename = save_review_image(file, str(user['_id']))
-                    if filename:
-                        image_urls.append(url_for('static', filename=f'uploads/reviews/{filename}'))
+                    image_url = save_review_image(file)
+                    if image_url:
+                        image_urls.append(image_url)
     
     # Tạo review data (không có order_id)
     review_data = {
@@ -389,18 +389,23 @@ def review_restaurant(rest_id):
                 'restaurant_rating': rating,
                 'restaurant_comment': comment if comment else None,
                 'images': image_urls if image_urls else [],
+                'image_variants': [],
                 'created_at': datetime.now()
             }}
         )
+        review_id = existing_review['_id']
         flash('Đã cập nhật đánh giá của bạn', 'success')
     else:
         # Tạo review mới
-        Review.create(review_data)
+        review_id = Review.create(review_data)
         flash('Cảm ơn bạn đã đánh giá nhà hàng!', 'success')
     
-    # Cập nhật rating trung bình của nhà hàng
-    avg_rating = Review.calculate_restaurant_rating(rest_id)
-    Restaurant.update(rest_id, {'rating': avg_rating})
+    # Tạo bản thu nhỏ cho ảnh đánh giá (chạy nền qua hàng đợi job)
+    if image_urls:
+        enqueue('images.review', {'review_id': str(review_id), 'images': image_urls})
+    
+    # Cập nhật rating trung bình của nhà hàng (chạy nền qua hàng đợi job)
+    enqueue('ratings.restaurant', {'rest_id': rest_id})
     
     return redirect(url_for('customer.restaurants'))
 
@@ -408,6 +413,20 @@ def review_restaurant(rest_id):
 @login_required
 def order_detail(order_id):
     """Order detail"""
+    # Chỉ đọc thời điểm cập nhật của đơn (mọi thay đổi trạng thái/thanh toán/đánh giá đều ghi updated_at)
+    # để trả 304 mà không phải truy vấn nhà hàng, payment, review, shipper, món ăn
+    version = get_db().orders.find_one(
+        {'_id': to_object_id(order_id)},
+        {'user_id': 1, 'created_at': 1, 'updated_at': 1}
+    )
+    etag = last_modified = None
+    if version and str(version['user_id']) == session.get('user_id'):
+        last_modified = version.get('updated_at') or version.get('created_at')
+        etag = page_etag('order', order_id, last_modified, catalog_version())
+        cached = not_modified(etag, last_modified)
+        if cached:
+            return cached
+    
     user = get_current_user()
     if not user:
         flash('Phiên đăng nhập đã hết hạn. Vui lòng đăng nhập lại', 'warning')
@@ -420,7 +439,8 @@ def order_detail(order_id):
         return redirect(url_for('customer.orders'))
     
     restaurant = Restaurant.find_by_id(str(order['rest_id']))
-    payment = Payment.find_by_order(order_id)
+    # Đơn đặt qua OrderService có payment nhúng, đơn cũ/VnPay đọc từ collection payments
+    payment = order.get('payment') or Payment.find_by_order(order_id)
     
     # Kiểm tra đã đánh giá chưa
     review = Review.find_by_order(order_id)
@@ -430,43 +450,36 @@ def order_detail(order_id):
     if order.get('shipper_id'):
         shipper = User.find_by_id(str(order['shipper_id']))
     
-    # Lấy thông tin menu items từ order để hiển thị form đánh giá món ăn
+    # Lấy thông tin menu items từ order để hiển thị form đánh giá món ăn (một truy vấn $in cho mọi món)
     menu_items = []
     if order.get('items'):
         items = order.get('items', [])
         if isinstance(items, list) and len(items) > 0:
             # Format mới: array of objects
             if isinstance(items[0], dict):
-                for item in items:
-                    menu_id = item.get('menu_id') or item.get('_id')
-                    if menu_id:
-                        menu = Menu.find_by_id(str(menu_id))
-                        if menu:
-                            menu_items.append({
-                                'menu': menu,
-                                'quantity': item.get('quantity', 1)
-                            })
+                lines = [(str(item.get('menu_id') or item.get('_id')), item.get('quantity', 1))
+                         for item in items if item.get('menu_id') or item.get('_id')]
+                menus = find_by_ids(get_db().menus, [menu_id for menu_id, _ in lines])
+                menu_items = [{'menu': menus[menu_id], 'quantity': quantity}
+                              for menu_id, quantity in lines if menu_id in menus]
             # Format cũ: array of strings (tên món)
             elif isinstance(items[0], str):
                 # Tìm menu theo tên trong restaurant
-                for item_name in items:
-                    menu = get_db().menus.find_one({
-                        'rest_id': ObjectId(order['rest_id']),
-                        'name': item_name
-                    })
-                    if menu:
-                        menu_items.append({
-                            'menu': menu,
-                            'quantity': 1
-                        })
-    
-    return render_template('customer/order_detail.html',
+                menus = {menu['name']: menu for menu in get_db().menus.find({
+                    'rest_id': ObjectId(order['rest_id']),
+                    'name': {'$in': items}
+                })}
+                menu_items = [{'menu': menus[item_name], 'quantity': 1}
+                              for item_name in items if item_name in menus]
+    
+    response = render_template('customer/order_detail.html',
                          order=order,
                          restaurant=restaurant,
                          payment=payment,
                          shipper=shipper,
                          review=review,
                          menu_items=menu_items)
+    return with_validators(response, etag, last_modified) if etag else response
 
 @customer_bp.route('/order/<order_id>/confirm-received', methods=['POST'])
 @login_required
@@ -481,9 +494,8 @@ def confirm_received(order_id):
     result = Order.confirm_received(order_id, str(user['_id']))
     
     if result and result.modified_count > 0:
-        # Cập nhật tiền ship cho shipper khi khách hàng xác nhận nhận hàng
-        from app.utils.revenue import update_shipper_delivery_fee
-        update_shipper_delivery_fee(order_id)
+        # Cập nhật tiền ship cho shipper khi khách hàng xác nhận nhận hàng (chạy nền qua hàng đợi job)
+        enqueue('shipper.delivery_fee', {'order_id': order_id})
         
         flash('Cảm ơn bạn đã xác nhận nhận hàng! Bây giờ bạn có thể đánh giá đơn hàng.', 'success')
     else:
@@ -501,14 +513,14 @@ def checkout():
         return redirect(url_for('auth.login'))
     
     if request.method == 'POST':
-        cart = session.get('cart', {})
+        cart, cart_meta = cart_utils.get_cart()
         
         if not cart:
             flash('Giỏ hàng trống', 'warning')
             return redirect(url_for('customer.cart'))
         
-        # Get order data
-        rest_id = request.form.get('rest_id')
+        # Get order data (ưu tiên nhà hàng đã ghim trong giỏ hàng)
+        rest_id = cart_meta.get('rest_id') or request.form.get('rest_id')
         delivery_address = request.form.get('delivery_address')
         payment_method = request.form.get('payment_method')
         promotion_code = request.form.get('promotion_code', '')
@@ -517,22 +529,42 @@ def checkout():
             flash('Vui lòng nhập đầy đủ thông tin', 'danger')
             return redirect(url_for('customer.cart'))
         
-        # Build order items
-        items = []
-        total = 0
-        for menu_id, quantity in cart.items():
-            menu = Menu.find_by_id(menu_id)
-            if menu:
-                item_total = menu['price'] * quantity
-                items.append({
-                    'menu_id': menu_id,
-                    'name': menu['name'],
-                    'quantity': quantity,
-                    'price': menu['price']
-                })
-                total += item_total
+        # Món đã bị xóa / ngừng bán sau khi thêm vào giỏ: bỏ khỏi giỏ và cho khách xem lại trước khi đặt
+        cart, cart_meta, removed = cart_utils.prune_unavailable(str(user['_id']), cart, cart_meta)
+        if removed:
+            flash(f"Các món không còn bán đã được bỏ khỏi giỏ hàng: {', '.join(removed)}. "
+                  "Vui lòng kiểm tra lại giỏ hàng trước khi đặt.", 'warning')
+            return redirect(url_for('customer.cart'))
+        
+        # Build order items từ giá đã chụp khi thêm vào giỏ
+        cart_items, total = cart_utils.cart_lines(cart, cart_meta)
+        items = [{
+            'menu_id': item['menu']['_id'],
+            'name': item['menu']['name'],
+            'quantity': item['quantity'],
+            'price': item['menu']['price']
+        } for item in cart_items]
+        
+        delivery_fee = DELIVERY_FEE  # Fixed delivery fee
         
-        delivery_fee = 15000  # Fixed delivery fee
+        if payment_method == 'cash':
+            # Một lần insert: order + payment nhúng + outbox (doanh thu, xóa giỏ hàng đã lưu)
+            order_id = OrderService.place(
+                user_id=str(user['_id']),
+                rest_id=rest_id,
+                items=items,
+                delivery_address=delivery_address,
+                payment_method=payment_method,
+                promotion_code=promotion_code
+            )
+            order_id_str = str(order_id)
+            # Doanh thu và giỏ hàng trong database được cập nhật bởi worker (job orders.outbox)
+            OrderService.dispatch(order_id)
+            
+            # Clear cart trong session (database được xóa qua outbox)
+            cart_utils.clear()
+            flash('Đặt hàng thành công!', 'success')
+            return redirect(url_for('customer.order_detail', order_id=order_id_str))
         
         # Create order
         order_data = {
@@ -555,30 +587,19 @@ def checkout():
             'order_id': order_id_str,
             'method': payment_method,
             'amount': total + delivery_fee,
-            'status': 'pending' if payment_method != 'cash' else 'success',
+            'status': 'pending',
             'paid_at': None
         }
         
-        if payment_method == 'cash':
-            payment_data['paid_at'] = datetime.now()
-            Payment.create(payment_data)
-            
-            # Tính và cập nhật doanh thu cho admin (5%) và restaurant (95%)
-            from app.utils.revenue import calculate_and_update_revenue
-            calculate_and_update_revenue(order_id_str)
-            
-            # Clear cart (cả session và database)
-            user = get_current_user()
-            session['cart'] = {}
-            session.modified = True
-            User.save_cart(str(user['_id']), {})
-            flash('Đặt hàng thành công!', 'success')
-            return redirect(url_for('customer.order_detail', order_id=order_id_str))
-        
-        elif payment_method == 'vnpay':
+        if payment_method == 'vnpay':
             try:
-                # Tạo payment record trước
-                payment_id = Payment.create(payment_data)
+                # Tạo TxnRef trước và lưu cùng payment record (một lần insert)
+                # để callback VnPay tìm lại payment qua unique index payments.txn_ref
+                txn_ref = VnPay.make_txn_ref(order_id_str)
+                payment_data['txn_ref'] = txn_ref
+                # Lưu vnp_CreateDate để job đối soát truy vấn trạng thái giao dịch (querydr)
+                payment_data['vnp_create_date'] = datetime.now().strftime('%Y%m%d%H%M%S')
+                Payment.create(payment_data)
                 
                 # Kiểm tra xem có cấu hình VnPay chưa
                 from flask import current_app
@@ -591,28 +612,17 @@ def checkout():
                     return redirect(url_for('customer.checkout'))
                 
                 # Sử dụng VnPay thật
-                vnpay = VnPay()
+                vnpay = get_vnpay()
                 # Tạo order_info ngắn gọn, không có ký tự đặc biệt
                 order_info = f"Don hang {order_id_str[:8]}"
                 
-                # Lưu mapping order_id -> TxnRef sẽ được tạo (để tìm lại order sau)
-                # Tạo TxnRef trước để lưu vào payment
-                import time
-                timestamp = int(time.time() * 1000) % 100000000
-                order_id_clean = str(order_id_str).replace('-', '').replace('ObjectId', '')[:20]
-                txn_ref = f"{timestamp}{order_id_clean}"[:36]
-                
-                # Lưu TxnRef vào payment để có thể tìm lại order
-                get_db().payments.update_one(
-                    {'_id': payment_id},
-                    {'$set': {'txn_ref': txn_ref}}
-                )
-                
                 try:
                     payment_url = vnpay.create_payment_url(
                         order_id=order_id_str,
                         amount=total + delivery_fee,
-                        order_info=order_info
+                        order_info=order_info,
+                        txn_ref=txn_ref,
+                        create_date=payment_data['vnp_create_date']
                     )
                 except Exception as e:
                     flash(f'Lỗi khi tạo URL thanh toán: {str(e)}', 'danger')
@@ -648,31 +658,19 @@ def checkout():
             return redirect(url_for('customer.checkout'))
     
     # GET request - show checkout form
-    cart = session.get('cart', {})
+    cart, cart_meta = cart_utils.get_cart()
     if not cart:
         flash('Giỏ hàng trống', 'warning')
         return redirect(url_for('customer.cart'))
     
-    # Get restaurant from first item
-    first_menu_id = list(cart.keys())[0]
-    first_menu = Menu.find_by_id(first_menu_id)
-    restaurant = Restaurant.find_by_id(str(first_menu['rest_id'])) if first_menu else None
+    # Get restaurant from pinned rest_id
+    rest_id = cart_meta.get('rest_id')
+    restaurant = Restaurant.find_by_id(rest_id) if rest_id else None
     
     # Build cart items for display
-    cart_items = []
-    subtotal = 0
-    for menu_id, quantity in cart.items():
-        menu = Menu.find_by_id(menu_id)
-        if menu:
-            item_total = menu['price'] * quantity
-            cart_items.append({
-                'menu': menu,
-                'quantity': quantity,
-                'total': item_total
-            })
-            subtotal += item_total
-    
-    delivery_fee = 15000
+    cart_items, subtotal = cart_utils.cart_lines(cart, cart_meta)
+    
+    delivery_fee = DELIVERY_FEE
     total = subtotal + delivery_fee
     
     return render_template('customer/checkout.html', 
@@ -686,99 +684,72 @@ def checkout():
 @login_required
 def vnpay_return():
     """Xử lý callback từ VnPay sau khi thanh toán"""
-    vnpay = VnPay()
+    vnpay = get_vnpay()
     
     # Lấy dữ liệu từ VnPay
     vnpay_data = request.args.to_dict()
     
-    # Debug: Log dữ liệu nhận được (chỉ trong development)
-    import logging
-    logging.basicConfig(level=logging.DEBUG)
-    logger = logging.getLogger(__name__)
-    logger.debug(f"VnPay return data: {vnpay_data}")
+    # Log debug (theo mẫu LOG_DEBUG_SAMPLE_RATE): chỉ các trường cần để đối chiếu, không gồm chữ ký
+    logger.debug("VnPay return", extra={
+        'txn_ref': vnpay_data.get('vnp_TxnRef'),
+        'response_code': vnpay_data.get('vnp_ResponseCode'),
+        'transaction_status': vnpay_data.get('vnp_TransactionStatus'),
+        'amount': vnpay_data.get('vnp_Amount')
+    })
     
     # Xác thực thanh toán
     result = vnpay.verify_payment(vnpay_data)
+    txn_ref = result.get('txn_ref')
     
     if result['success']:
         # Thanh toán thành công
-        # Tìm order_id từ session (cách đơn giản nhất)
-        order_id = None
+        # Chuyển payment pending -> success (no-op nếu IPN đã xử lý trước)
+        payment = Payment.settle_pending(txn_ref, 'success', {
+            'paid_at': datetime.now(),
+            'transaction_id': result.get('transaction_id'),
+            'bank_code': result.get('bank_code')
+        }, amount=result.get('amount'))
+        if payment:
+            # Tính và cập nhật doanh thu cho admin (5%) và restaurant (95%) (chạy nền qua hàng đợi job)
+            enqueue('revenue.update', {'order_id': str(payment['order_id'])})
+        else:
+            # IPN đã cập nhật trước: tìm payment qua unique index txn_ref
+            payment = Payment.find_by_txn_ref(txn_ref) if txn_ref else None
+            # Payment vẫn pending nghĩa là số tiền VnPay báo về không khớp
+            if payment and payment.get('status') == 'pending':
+                flash('Số tiền thanh toán không khớp với đơn hàng', 'danger')
+                return redirect(url_for('customer.orders'))
+            # IPN đã xác nhận giao dịch thất bại: không báo thành công theo query string của return URL
+            if payment and payment.get('status') != 'success':
+                flash('Thanh toán thất bại', 'danger')
+                return redirect(url_for('customer.orders'))
         
-        # Cách 1: Tìm từ session
-        if 'pending_order_id' in session:
+        # Tìm order_id từ payment, nếu không có thì lấy từ session
+        if payment:
+            order_id = str(payment['order_id'])
+        else:
             order_id = session.get('pending_order_id')
         
-        # Cách 2: Nếu không có trong session, thử tìm từ TxnRef
-        if not order_id:
-            txn_ref = result.get('txn_ref') or result.get('order_id')
-            if txn_ref:
-                # Tìm payment với txn_ref
-                payment = get_db().payments.find_one({'txn_ref': txn_ref})
-                if payment:
-                    order_id = str(payment['order_id'])
-        
         if not order_id:
             flash('Không tìm thấy đơn hàng', 'danger')
             return redirect(url_for('customer.orders'))
         
-        order = Order.find_by_id(order_id)
+        # Clear pending order from session
+        if 'pending_order_id' in session:
+            del session['pending_order_id']
+            session.modified = True
         
-        if order:
-            # Cập nhật payment
-            payment = Payment.find_by_order(order_id)
-            if payment:
-                # Cập nhật payment status và thông tin
-                get_db().payments.update_one(
-                    {'_id': payment['_id']},
-                    {'$set': {
-                        'status': 'success',
-                        'paid_at': datetime.now(),
-                        'transaction_id': result.get('transaction_id'),
-                        'bank_code': result.get('bank_code'),
-                        'updated_at': datetime.now()
-                    }}
-                )
-                
-                # Tính và cập nhật doanh thu cho admin (5%) và restaurant (95%)
-                from app.utils.revenue import calculate_and_update_revenue
-                calculate_and_update_revenue(order_id)
-            
-            # Clear pending order from session
-            if 'pending_order_id' in session:
-                del session['pending_order_id']
-                session.modified = True
-            
-            # Clear cart (cả session và database)
-            user = get_current_user()
-            if user:
-                session['cart'] = {}
-                session.modified = True
-                User.save_cart(str(user['_id']), {})
-            else:
-                # Nếu session bị mất, chỉ clear session cart
-                session['cart'] = {}
-                session.modified = True
-            
-            flash('Thanh toán thành công!', 'success')
-            return redirect(url_for('customer.order_detail', order_id=order_id))
-        else:
-            flash('Không tìm thấy đơn hàng', 'danger')
-            return redirect(url_for('customer.orders'))
+        # Clear cart (cả session và database)
+        user = get_current_user()
+        # Nếu session bị mất, chỉ clear session cart
+        cart_utils.clear(str(user['_id']) if user else None)
+        
+        flash('Thanh toán thành công!', 'success')
+        return redirect(url_for('customer.order_detail', order_id=order_id))
     else:
-        # Thanh toán thất bại
-        order_id = result.get('order_id')
-        if order_id:
-            # Cập nhật payment status
-            payment = Payment.find_by_order(order_id)
-            if payment:
-                get_db().payments.update_one(
-                    {'_id': payment['_id']},
-                    {'$set': {
-                        'status': 'failed',
-                        'updated_at': datetime.now()
-                    }}
-                )
+        # Thanh toán thất bại - chỉ cập nhật khi chữ ký hợp lệ, số tiền đọc được và payment còn pending
+        if result.get('signature_valid') and not result.get('invalid_amount') and txn_ref:
+            Payment.settle_pending(txn_ref, 'failed')
         
         flash(f'Thanh toán thất bại: {result.get("message", "Lỗi không xác định")}', 'danger')
         return redirect(url_for('customer.orders'))
@@ -789,8 +760,10 @@ def vnpay_ipn():
     IPN URL - VnPay gửi thông báo kết quả thanh toán
     Theo tài liệu: https://sandbox.vnpayment.vn/apis/docs/thanh-toan-pay/pay.html
     IPN URL được gọi bởi VnPay server, không cần authentication
+    Mỗi callback là một lệnh find_one_and_update có điều kiện (pending -> success/failed),
+    VnPay gửi lại nhiều lần cũng chỉ cập nhật một lần
     """
-    vnpay = VnPay()
+    vnpay = get_vnpay()
     
     # Lấy dữ liệu từ VnPay (có thể là POST hoặc GET)
     if request.method == 'POST':
@@ -801,88 +774,55 @@ def vnpay_ipn():
     # Xác thực thanh toán
     result = vnpay.verify_payment(vnpay_data)
     
+    if not result.get('signature_valid'):
+        return jsonify({'RspCode': '97', 'Message': 'Invalid signature'}), 200
+    if result.get('invalid_amount'):
+        return jsonify({'RspCode': '04', 'Message': 'Invalid amount'}), 200
+    
+    txn_ref = result.get('txn_ref')
     if result['success']:
-        # Thanh toán thành công - cập nhật payment
-        order_id = result['order_id']
-        payment = Payment.find_by_order(order_id)
-        
-        if payment:
-            # Kiểm tra xem đã cập nhật chưa (tránh duplicate)
-            if payment.get('status') != 'success':
-                get_db().payments.update_one(
-                    {'_id': payment['_id']},
-                    {'$set': {
-                        'status': 'success',
-                        'paid_at': datetime.now(),
-                        'transaction_id': result.get('transaction_id'),
-                        'bank_code': result.get('bank_code'),
-                        'updated_at': datetime.now()
-                    }}
-                )
-                
-                # Tính và cập nhật doanh thu cho admin (5%) và restaurant (95%)
-                from app.utils.revenue import calculate_and_update_revenue
-                calculate_and_update_revenue(order_id)
-        
-        # Trả về response cho VnPay (theo tài liệu)
-        return jsonify({'RspCode': '00', 'Message': 'Success'}), 200
+        payment = Payment.settle_pending(txn_ref, 'success', {
+            'paid_at': datetime.now(),
+            'transaction_id': result.get('transaction_id'),
+            'bank_code': result.get('bank_code')
+        }, amount=result.get('amount'))
     else:
-        # Thanh toán thất bại
-        order_id = result.get('order_id')
-        if order_id:
-            payment = Payment.find_by_order(order_id)
-            if payment and payment.get('status') != 'failed':
-                get_db().payments.update_one(
-                    {'_id': payment['_id']},
-                    {'$set': {
-                        'status': 'failed',
-                        'updated_at': datetime.now()
-                    }}
-                )
-        
-        # Trả về response cho VnPay
-        return jsonify({'RspCode': '00', 'Message': 'Confirm'}), 200
+        payment = Payment.settle_pending(txn_ref, 'failed', {
+            'transaction_id': result.get('transaction_id')
+        }, amount=result.get('amount'))
+    
+    if payment:
+        if result['success']:
+            # Tính và cập nhật doanh thu cho admin (5%) và restaurant (95%) (chạy nền qua hàng đợi job)
+            enqueue('revenue.update', {'order_id': str(payment['order_id'])})
+        # Trả về response cho VnPay (theo tài liệu)
+        return jsonify({'RspCode': '00', 'Message': 'Confirm Success'}), 200
+    
+    # Không có payment pending khớp: phân biệt để trả đúng mã cho VnPay (chỉ xảy ra khi gửi lại)
+    existing = Payment.find_by_txn_ref(txn_ref) if txn_ref else None
+    if not existing:
+        return jsonify({'RspCode': '01', 'Message': 'Order not found'}), 200
+    if existing.get('status') != 'pending':
+        return jsonify({'RspCode': '02', 'Message': 'Order already confirmed'}), 200
+    return jsonify({'RspCode': '04', 'Message': 'Invalid amount'}), 200
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in current_app.config.get('ALLOWED_EXTENSIONS', {'png', 'jpg', 'jpeg', 'gif', 'webp'})
 
-def save_review_image(file, user_id):
-    """Save a single review image and return filename"""
+def save_review_image(file):
+    """Save a single review image and return its URL"""
     if file and file.filename:
-        upload_folder = current_app.config.get('UPLOAD_FOLDER', 'static/uploads')
-        review_folder = os.path.join(upload_folder, 'reviews')
-        os.makedirs(review_folder, exist_ok=True)
-        
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-        filename = f"{timestamp}{user_id}_{filename}"
-        
-        filepath = os.path.join(review_folder, filename)
-        file.save(filepath)
-        return filename
+        return save_upload(file, 'reviews')
     return None
 
 def save_review_images(files):
     """Save uploaded review images and return URLs"""
     image_urls = []
-    if files:
-        upload_folder = current_app.config.get('UPLOAD_FOLDER', 'static/uploads')
-        review_folder = os.path.join(upload_folder, 'reviews')
-        os.makedirs(review_folder, exist_ok=True)
-        
-        for file in files:
-            if file and file.filename:
-                filename = secure_filename(file.filename)
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-                filename = timestamp + filename
-                
-                filepath = os.path.join(review_folder, filename)
-                file.save(filepath)
-                
-                image_url = flask_url_for('static', filename=f'uploads/reviews/{filename}')
-                image_urls.append(image_url)
+    for file in files or []:
+        if file and file.filename and allowed_file(file.filename):
+            image_urls.append(save_upload(file, 'reviews'))
     
     return image_urls
 
@@ -987,17 +927,16 @@ def create_review(order_id):
         review_data['driver_rating'] = driver_rating
         review_data['driver_comment'] = driver_comment
     
-    Review.create(review_data)
+    review_id = Review.create(review_data)
     
-    # Cập nhật rating của nhà hàng
-    new_rating = Review.calculate_restaurant_rating(str(order['rest_id']))
-    Restaurant.update(str(order['rest_id']), {'rating': new_rating})
+    # Tạo bản thu nhỏ cho ảnh đánh giá (chạy nền qua hàng đợi job)
+    if image_urls:
+        enqueue('images.review', {'review_id': str(review_id), 'images': image_urls})
     
-    # Cập nhật rating của shipper
+    # Cập nhật rating của nhà hàng và shipper (chạy nền qua hàng đợi job)
+    enqueue('ratings.restaurant', {'rest_id': str(order['rest_id'])})
     if order.get('shipper_id'):
-        shipper_id = str(order['shipper_id'])
-        new_shipper_rating = Review.calculate_shipper_rating(shipper_id)
-        User.update(shipper_id, {'delivery_stats.avg_rating': new_shipper_rating})
+        enqueue('ratings.shipper', {'shipper_id': str(order['shipper_id'])})
     
     flash('Cảm ơn bạn đã đánh giá!', 'success')
     return redirect(url_for('customer.order_detail', order_id=order_id))
@@ -1,12 +1,20 @@
-from flask import Blueprint, render_template, url_for
-from app.models import Menu, Restaurant
+from flask import Blueprint, render_template, url_for, request, current_app, abort, Response
+from app.models import Restaurant
 from app.database import get_db
+from app.utils.fragment_cache import get_fragment_cache, catalog_version
+from app.utils.conditional import page_etag, not_modified, with_validators
+from app.utils.catalog_snapshot import get_catalog_snapshot
+from app.utils import metrics as app_metrics
 from bson import ObjectId
 from collections import defaultdict
-import random
+import hmac
+import zlib
 
 main_bp = Blueprint('main', __name__)
 
+# Địa chỉ được đọc /metrics khi không đặt METRICS_TOKEN
+LOOPBACK = ('127.0.0.1', '::1')
+
 # Danh sách hình ảnh có sẵn (trừ logo)
 AVAILABLE_IMAGES = [
     'bg3.webp',
@@ -32,7 +40,8 @@ CATEGORY_IMAGE_MAP = {
 }
 
 def get_menu_image(menu):
-    """Lấy hình ảnh cho món ăn - ưu tiên image_url, sau đó map theo category"""
+    """Lấy hình ảnh cho món ăn - ưu tiên image_url, sau đó map theo category
+    Ảnh theo category được chọn cố định theo ID món ăn (cùng món luôn cùng URL, trình duyệt dùng lại cache)"""
     # Nếu đã có image_url từ user upload, dùng luôn
     if menu.get('image_url'):
         return menu.get('image_url')
@@ -40,28 +49,52 @@ def get_menu_image(menu):
     # Nếu không có, map theo category
     category = menu.get('cat', 'other').lower()
     
-    # Tìm hình ảnh phù hợp với category
-    if category in CATEGORY_IMAGE_MAP:
-        image_file = random.choice(CATEGORY_IMAGE_MAP[category])
-    else:
-        # Nếu category không có trong map, dùng random từ tất cả ảnh
-        image_file = random.choice(AVAILABLE_IMAGES)
+    # Tìm hình ảnh phù hợp với category (nếu category không có trong map thì chọn từ tất cả ảnh)
+    images = CATEGORY_IMAGE_MAP.get(category, AVAILABLE_IMAGES)
+    key = str(menu.get('_id') or menu.get('name', ''))
+    image_file = images[zlib.crc32(key.encode('utf-8')) % len(images)]
     
     return url_for('static', filename=f'img/{image_file}')
 
 @main_bp.route('/')
 def index():
     """Home page with menu items by category"""
-    # Lấy tất cả món ăn từ các nhà hàng đã được duyệt
-    approved_restaurants = Restaurant.find_all({'status': 'approved'})
-    restaurant_ids = [str(r['_id']) for r in approved_restaurants]
+    # Catalog chưa đổi kể từ lần xem trước: trả 304, không render lại
+    etag = page_etag('home', catalog_version())
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    # Khối catalog giống nhau với mọi người xem: lấy HTML từ cache, chỉ truy vấn + render khi catalog thay đổi
+    catalog_html = get_fragment_cache().get_or_render(('home',), render_home_catalog)
+    return with_validators(render_template('main/index.html', catalog_html=catalog_html), etag)
+
+def render_home_catalog():
+    """Render khối món ăn theo danh mục của trang chủ"""
+    # Snapshot catalog khớp version hiện tại: đọc từ file mmap, không truy vấn database
+    snapshot = get_catalog_snapshot()
+    if snapshot is not None:
+        approved_restaurants = snapshot.restaurants()
+    else:
+        # Lấy tất cả món ăn từ các nhà hàng đã được duyệt
+        approved_restaurants = Restaurant.find_all({'status': 'approved'})
+    
+    # Không có snapshot: lấy món available của mọi nhà hàng bằng một truy vấn rồi nhóm theo rest_id
+    menus_by_restaurant = defaultdict(list)
+    if snapshot is None and approved_restaurants:
+        for menu in get_db().menus.find({'rest_id': {'$in': [r['_id'] for r in approved_restaurants]},
+                                         'status': 'available'}):
+            menus_by_restaurant[str(menu['rest_id'])].append(menu)
     
     # Lấy tất cả món ăn available
     all_menus = []
-    for rest_id in restaurant_ids:
-        menus = Menu.find_by_restaurant(rest_id, {'status': 'available'})
+    for restaurant in approved_restaurants:
+        rest_id = str(restaurant['_id'])
+        if snapshot is not None:
+            menus = snapshot.menus(rest_id)
+        else:
+            menus = menus_by_restaurant[rest_id]
         for menu in menus:
-            menu['restaurant'] = Restaurant.find_by_id(rest_id)
+            menu['restaurant'] = restaurant
             # Gán hình ảnh cho món ăn
             menu['display_image'] = get_menu_image(menu)
             all_menus.append(menu)
@@ -75,10 +108,26 @@ def index():
     # Chuyển thành dict thông thường và sắp xếp
     categories = dict(sorted(menus_by_category.items()))
     
-    return render_template('main/index.html', categories=categories, menus_by_category=menus_by_category)
+    return render_template('main/_catalog.html', categories=categories)
 
 @main_bp.route('/about')
 def about():
     """About page"""
     return render_template('main/about.html')
 
+def metrics_allowed():
+    """Bearer METRICS_TOKEN if configured, otherwise only direct (non-proxied) requests from localhost"""
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        supplied = request.headers.get('Authorization', '')
+        return hmac.compare_digest(supplied.encode('utf-8'), f"Bearer {token}".encode('utf-8'))
+    # Request qua reverse proxy ở cùng máy cũng có remote_addr 127.0.0.1: có header X-Forwarded-For thì từ chối
+    return request.remote_addr in LOOPBACK and 'X-Forwarded-For' not in request.headers
+
+@main_bp.route('/metrics')
+def metrics():
+    """Prometheus metrics"""
+    # Metrics có tên endpoint, địa chỉ MongoDB (nhãn pool), lưu lượng: không công khai
+    if not metrics_allowed():
+        abort(403)
+    return Response(app_metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
@@ -1,7 +1,9 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, url_for
 from app.models import Restaurant, Menu, Order, Review, User
 from app.utils.auth import login_required, get_current_user
-from app.utils.helpers import to_object_id
+from app.utils.helpers import to_object_id, find_by_ids
+from app.utils.uploads import save_upload, url_to_path
+from app.utils.jobs import enqueue
 from app.database import get_db
 from datetime import datetime
 from bson import ObjectId
@@ -16,22 +18,9 @@ def allowed_file(filename):
            filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
 
 def save_uploaded_file(file):
-    """Save uploaded file and return URL"""
+    """Save uploaded file and return URL (thumbnails are generated by the job worker)"""
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        # Add timestamp to avoid conflicts
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-        filename = timestamp + filename
-        
-        upload_folder = current_app.config['UPLOAD_FOLDER']
-        # Create directory if not exists
-        os.makedirs(upload_folder, exist_ok=True)
-        
-        filepath = os.path.join(upload_folder, filename)
-        file.save(filepath)
-        
-        # Return URL path (relative to static)
-        return url_for('static', filename=f'uploads/menus/{filename}')
+        return save_upload(file, 'menus')
     return None
 
 @restaurant_bp.route('/dashboard')
@@ -244,7 +233,10 @@ def add_menu():
             'status': 'available'
         }
         
-        Menu.create(menu_data)
+        menu_id = Menu.create(menu_data)
+        # Ảnh upload: tạo bản thu nhỏ WebP/JPEG ở worker
+        if url_to_path(image_url):
+            enqueue('images.menu', {'menu_id': str(menu_id), 'image_url': image_url})
         flash('Đã thêm món ăn thành công', 'success')
         return redirect(url_for('restaurant.menus'))
     
@@ -301,7 +293,14 @@ def edit_menu(menu_id):
             'status': status
         }
         
+        # Đổi ảnh: bỏ bản thu nhỏ của ảnh cũ, worker tạo lại cho ảnh mới
+        image_changed = image_url != menu.get('image_url', '')
+        if image_changed:
+            update_data['image_variants'] = None
+        
         Menu.update(menu_id, update_data)
+        if image_changed and url_to_path(image_url):
+            enqueue('images.menu', {'menu_id': menu_id, 'image_url': image_url})
         flash('Đã cập nhật món ăn thành công', 'success')
         return redirect(url_for('restaurant.menus'))
     
@@ -363,9 +362,13 @@ def reviews():
                 continue
                 
             review['restaurant'] = restaurant
-            review['customer'] = User.find_by_id(str(review.get('user_id')))
             all_reviews.append(review)
     
+    # Lấy thông tin khách hàng của tất cả review bằng một truy vấn $in
+    customers = find_by_ids(get_db().users, [r['user_id'] for r in all_reviews if r.get('user_id')])
+    for review in all_reviews:
+        review['customer'] = customers.get(str(review.get('user_id')))
+    
     # Sắp xếp theo ngày mới nhất
     all_reviews.sort(key=lambda x: x.get('created_at', datetime.min), reverse=True)
     
@@ -1,7 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from app.models import Order, User, Restaurant, Review
 from app.utils.auth import login_required, get_current_user
-from app.utils.helpers import to_object_id
+from app.utils.helpers import to_object_id, find_by_ids
 from app.database import get_db
 from datetime import datetime
 from bson import ObjectId
@@ -182,14 +182,18 @@ def reviews():
     # Lấy tất cả reviews của shipper này
     reviews_list = Review.find_by_shipper(str(user['_id']))
     
-    # Lấy thông tin khách hàng và nhà hàng cho mỗi review
+    # Lấy thông tin khách hàng, nhà hàng và đơn hàng của các review (mỗi collection một truy vấn $in)
+    db = get_db()
+    customers = find_by_ids(db.users, [r['user_id'] for r in reviews_list if r.get('user_id')])
+    restaurants = find_by_ids(db.restaurants, [r['restaurant_id'] for r in reviews_list if r.get('restaurant_id')])
+    orders = find_by_ids(db.orders, [r['order_id'] for r in reviews_list if r.get('order_id')])
     for review in reviews_list:
         if review.get('user_id'):
-            review['customer'] = User.find_by_id(str(review['user_id']))
+            review['customer'] = customers.get(str(review['user_id']))
         if review.get('restaurant_id'):
-            review['restaurant'] = Restaurant.find_by_id(str(review['restaurant_id']))
+            review['restaurant'] = restaurants.get(str(review['restaurant_id']))
         if review.get('order_id'):
-            review['order'] = Order.find_by_id(str(review['order_id']))
+            review['order'] = orders.get(str(review['order_id']))
     
     # Tính toán thống kê
     total_reviews = len(reviews_list)
@@ -0,0 +1,158 @@
+# Manifest file tĩnh: URL có hash nội dung (cache vĩnh viễn) + bản nén sẵn .gz/.br
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+# Import các hàm Flask để trả file tĩnh
+from flask import current_app, request, send_from_directory
+# Import NotFound để trả 404 khi không có file
+from werkzeug.exceptions import NotFound
+
+# Brotli là dependency tùy chọn: không có thì chỉ tạo bản .gz
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# Các loại file nén được (ảnh webp/jpg đã nén sẵn, nén lại không nhỏ hơn)
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map', '.ico'}
+# File upload đã được lưu theo hash nội dung (xem app/utils/uploads.py), không đưa vào manifest
+EXCLUDED_DIRS = {'uploads'}
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Tên file có hash: style.3f2a1b9c0d.css
+HASHED_NAME = re.compile(r'^(.+)\.[0-9a-f]{10}(\.[^./]+)$')
+
+class AssetManifest:
+    """
+    Ánh xạ 'css/style.css' <-> 'css/style.3f2a1b9c0d.css'
+    Được tạo một lần khi khởi động app; ở chế độ debug, file sửa đổi được băm lại khi tạo URL
+    """
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self.hashed = {}       # tên gốc -> tên có hash
+        self.originals = {}    # tên có hash -> tên gốc
+        self.mtimes = {}       # tên gốc -> mtime lúc băm
+        self.encodings = {}    # tên gốc -> các bản nén có sẵn {'br': 'css/style.css.br', ...}
+
+    def build(self):
+        """Quét thư mục static, băm từng file và tạo bản nén còn thiếu"""
+        if not self.static_folder or not os.path.isdir(self.static_folder):
+            return self
+        for root, dirs, files in os.walk(self.static_folder):
+            if root == self.static_folder:
+                dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRS]
+            for name in files:
+                if name.endswith(('.gz', '.br')) or name.startswith('.'):
+                    continue
+                relative = os.path.relpath(os.path.join(root, name), self.static_folder).replace(os.sep, '/')
+                self.add(relative)
+        return self
+
+    def add(self, filename):
+        """Băm một file và cập nhật manifest"""
+        path = os.path.join(self.static_folder, filename)
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()[:10]
+        stem, ext = os.path.splitext(filename)
+        hashed = f"{stem}.{digest}{ext}"
+
+        old = self.hashed.get(filename)
+        if old:
+            self.originals.pop(old, None)
+        self.hashed[filename] = hashed
+        self.originals[hashed] = filename
+        self.mtimes[filename] = os.path.getmtime(path)
+        self.encodings[filename] = self.precompress(filename, data) if ext.lower() in COMPRESSIBLE else {}
+
+    def precompress(self, filename, data):
+        """
+        Tạo file nén cạnh file gốc (style.css.gz, style.css.br) nếu chưa có hoặc cũ hơn file gốc
+        Trả về: Dict encoding -> tên file nén (bỏ qua nếu thư mục không ghi được)
+        """
+        path = os.path.join(self.static_folder, filename)
+        source_mtime = os.path.getmtime(path)
+        compressors = {'gzip': ('.gz', lambda d: gzip.compress(d, 9, mtime=0))}
+        if brotli is not None:
+            compressors['br'] = ('.br', lambda d: brotli.compress(d, quality=11))
+
+        available = {}
+        for encoding, (suffix, compress) in compressors.items():
+            target = path + suffix
+            try:
+                if not os.path.exists(target) or os.path.getmtime(target) < source_mtime:
+                    compressed = compress(data)
+                    # Nén không nhỏ hơn đáng kể thì không dùng
+                    if len(compressed) >= len(data) * 0.9:
+                        continue
+                    tmp = f"{target}.tmp{os.getpid()}"
+                    with open(tmp, 'wb') as f:
+                        f.write(compressed)
+                    os.replace(tmp, target)
+                available[encoding] = filename + suffix
+            except OSError:
+                continue
+        return available
+
+    def lookup(self, filename):
+        """Tên có hash của file (ở chế độ debug băm lại nếu file đã bị sửa)"""
+        if filename not in self.hashed:
+            return filename
+        if current_app.debug:
+            path = os.path.join(self.static_folder, filename)
+            try:
+                if os.path.getmtime(path) != self.mtimes[filename]:
+                    self.add(filename)
+            except OSError:
+                return filename
+        return self.hashed[filename]
+
+def hashed_static_url(endpoint, values):
+    """url_defaults: url_for('static', filename='css/style.css') -> /static/css/style.<hash>.css"""
+    if endpoint == 'static' and 'filename' in values:
+        manifest = current_app.extensions.get('assets')
+        if manifest is not None:
+            values['filename'] = manifest.lookup(values['filename'])
+
+def send_static(filename):
+    """
+    Thay view 'static' mặc định: trả file gốc cho URL có hash (kèm header cache vĩnh viễn)
+    và chọn bản nén sẵn theo Accept-Encoding
+    """
+    manifest = current_app.extensions['assets']
+    original = manifest.originals.get(filename)
+    name = original or filename
+    if original is None:
+        # Hash cũ (trang được cache từ trước khi deploy): trả bản hiện tại nhưng không cache vĩnh viễn
+        match = HASHED_NAME.match(filename)
+        if match and match.group(1) + match.group(2) in manifest.hashed:
+            name = match.group(1) + match.group(2)
+
+    encodings = manifest.encodings.get(name) or {}
+    response = None
+    for encoding in ('br', 'gzip'):
+        if encoding in encodings and request.accept_encodings[encoding]:
+            mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            try:
+                response = send_from_directory(manifest.static_folder, encodings[encoding], mimetype=mimetype)
+            except NotFound:
+                # File nén bị xóa sau khi khởi động: trả file gốc
+                continue
+            response.headers['Content-Encoding'] = encoding
+            break
+    if response is None:
+        response = send_from_directory(manifest.static_folder, name)
+
+    if encodings:
+        response.vary.add('Accept-Encoding')
+    if original:
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+def init_app(app):
+    """Tạo manifest, đăng ký url_defaults cho url_for và thay view trả file tĩnh"""
+    app.extensions['assets'] = AssetManifest(app.static_folder).build()
+    app.url_defaults(hashed_static_url)
+    app.view_functions['static'] = send_static
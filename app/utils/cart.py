@@ -0,0 +1,220 @@
+# Import session từ Flask để đọc/ghi giỏ hàng của người dùng hiện tại
+from flask import session
+# Import get_db để truy vấn menu khi cần bổ sung metadata cho giỏ hàng cũ
+from app.database import get_db
+# Import User model để lưu giỏ hàng vào database
+from app.models import User
+# Import hàm chuyển string sang ObjectId
+from app.utils.helpers import to_object_id
+
+# Giỏ hàng gồm 2 phần:
+#   - session['cart']      : {menu_id: quantity} (giữ nguyên format cũ, base.html dùng để đếm số món)
+#   - session['cart_meta'] : {'rest_id': str, 'items': {menu_id: {'name', 'price', 'cat'}}}
+# cart_meta được ghi ở lần thêm món đầu tiên nên việc kiểm tra "chỉ một nhà hàng"
+# và tính tiền giỏ hàng không cần đọc lại collection menus.
+
+def empty_meta():
+    """Tạo metadata rỗng cho giỏ hàng"""
+    return {'rest_id': None, 'items': {}}
+
+def snapshot_menu(menu):
+    """
+    Tạo bản chụp giá/tên của một món ăn để lưu vào giỏ hàng
+    Tham số: menu (dict) - Document menu
+    Trả về: Dictionary chứa name, price, cat
+    """
+    return {
+        'name': menu.get('name', 'N/A'),
+        'price': menu.get('price', 0),
+        'cat': menu.get('cat', '')
+    }
+
+def build_meta(cart):
+    """
+    Tạo metadata cho giỏ hàng cũ (chỉ có {menu_id: quantity}) bằng một truy vấn $in duy nhất
+    Tham số: cart (dict) - Giỏ hàng {menu_id: quantity}
+    Trả về: Dictionary metadata (rest_id lấy từ món đầu tiên còn tồn tại)
+    """
+    meta = empty_meta()
+    object_ids = [oid for oid in (to_object_id(menu_id) for menu_id in cart) if oid]
+    if not object_ids:
+        return meta
+
+    menus = get_db().menus.find(
+        {'_id': {'$in': object_ids}},
+        {'name': 1, 'price': 1, 'cat': 1, 'rest_id': 1}
+    )
+    menus_by_id = {str(menu['_id']): menu for menu in menus}
+
+    # Giữ thứ tự món trong giỏ để rest_id được lấy từ món thêm đầu tiên (giống logic cũ)
+    for menu_id in cart:
+        menu = menus_by_id.get(menu_id)
+        if not menu:
+            continue
+        if meta['rest_id'] is None:
+            meta['rest_id'] = str(menu.get('rest_id'))
+        meta['items'][menu_id] = snapshot_menu(menu)
+    return meta
+
+def ensure_meta(cart, meta):
+    """
+    Đảm bảo metadata đầy đủ cho mọi món trong giỏ (đường migration cho giỏ hàng cũ)
+    Tham số:
+        cart (dict) - Giỏ hàng {menu_id: quantity}
+        meta (dict hoặc None) - Metadata hiện có
+    Trả về: Metadata đã được bổ sung (chỉ truy vấn DB khi thiếu)
+    """
+    if not cart:
+        return empty_meta()
+    if meta and meta.get('rest_id') and all(menu_id in meta.get('items', {}) for menu_id in cart):
+        return meta
+    return build_meta(cart)
+
+def get_cart():
+    """
+    Lấy giỏ hàng và metadata từ session, tự migrate nếu session có giỏ hàng format cũ
+    Trả về: Tuple (cart, meta)
+    """
+    cart = session.get('cart', {})
+    meta = session.get('cart_meta')
+    if not cart:
+        return cart, meta or empty_meta()
+    fixed_meta = ensure_meta(cart, meta)
+    if fixed_meta is not meta:
+        # Bỏ các món không còn tồn tại để lần sau không phải migrate lại
+        cart = {menu_id: qty for menu_id, qty in cart.items() if menu_id in fixed_meta['items']}
+        session['cart'] = cart
+        session['cart_meta'] = fixed_meta
+        session.modified = True
+    return cart, fixed_meta
+
+def add_item(user_id, menu, quantity):
+    """
+    Thêm món vào giỏ hàng, ghim rest_id ở lần thêm đầu tiên
+    Tham số:
+        user_id (string) - ID của khách hàng (để lưu giỏ hàng vào database)
+        menu (dict) - Document menu cần thêm
+        quantity (int) - Số lượng thêm vào
+    Trả về: True nếu thêm thành công, False nếu giỏ hàng đang có món của nhà hàng khác
+    """
+    cart, meta = get_cart()
+    menu_id = str(menu['_id'])
+    rest_id = str(menu.get('rest_id'))
+
+    # Kiểm tra giỏ hàng hiện tại có món từ nhà hàng khác không (không cần truy vấn DB)
+    if cart and meta.get('rest_id') and meta['rest_id'] != rest_id:
+        return False
+
+    cart = dict(cart)
+    cart[menu_id] = cart.get(menu_id, 0) + quantity
+    meta = {'rest_id': rest_id, 'items': dict(meta.get('items', {}))}
+    meta['items'][menu_id] = snapshot_menu(menu)
+
+    _store(user_id, cart, meta)
+    return True
+
+def set_quantity(user_id, menu_id, quantity):
+    """
+    Cập nhật số lượng của một món đã có trong giỏ hàng
+    Trả về: True nếu món có trong giỏ, False nếu không
+    """
+    cart, meta = get_cart()
+    if menu_id not in cart:
+        return False
+    cart = dict(cart)
+    cart[menu_id] = quantity
+    _store(user_id, cart, meta)
+    return True
+
+def remove_item(user_id, menu_id):
+    """Xóa một món khỏi giỏ hàng, bỏ ghim nhà hàng nếu giỏ hàng trống"""
+    cart, meta = get_cart()
+    if menu_id not in cart:
+        return
+    cart = dict(cart)
+    del cart[menu_id]
+    items = {k: v for k, v in meta.get('items', {}).items() if k != menu_id}
+    meta = {'rest_id': meta.get('rest_id') if cart else None, 'items': items}
+    _store(user_id, cart, meta)
+
+def clear(user_id=None):
+    """Xóa giỏ hàng (cả session và database nếu có user_id)"""
+    _store(user_id, {}, empty_meta())
+
+def cart_lines(cart, meta):
+    """
+    Tạo danh sách dòng giỏ hàng từ giá đã chụp (không đọc collection menus)
+    Tham số:
+        cart (dict) - Giỏ hàng {menu_id: quantity}
+        meta (dict) - Metadata của giỏ hàng
+    Trả về: Tuple (cart_items, subtotal) - cart_items có 'menu', 'quantity', 'total'
+    """
+    cart_items = []
+    subtotal = 0
+    items_meta = meta.get('items', {})
+    for menu_id, quantity in cart.items():
+        line = items_meta.get(menu_id)
+        if not line:
+            continue
+        item_total = line['price'] * quantity
+        cart_items.append({
+            'menu': dict(line, _id=menu_id),
+            'quantity': quantity,
+            'total': item_total
+        })
+        subtotal += item_total
+    return cart_items, subtotal
+
+def prune_unavailable(user_id, cart, meta):
+    """
+    Bỏ khỏi giỏ hàng các món đã bị xóa, không còn bán hoặc không thuộc nhà hàng đã ghim
+    Dùng khi đặt hàng: giá vẫn lấy từ bản chụp, chỉ kiểm tra món còn bán bằng một truy vấn $in
+    Tham số:
+        user_id (string) - ID của khách hàng (lưu lại giỏ hàng đã bỏ món)
+        cart (dict) - Giỏ hàng {menu_id: quantity}
+        meta (dict) - Metadata của giỏ hàng
+    Trả về: Tuple (cart, meta, removed) - removed là list tên các món đã bỏ
+    """
+    object_ids = [oid for oid in (to_object_id(menu_id) for menu_id in cart) if oid]
+    query = {'_id': {'$in': object_ids}, 'status': 'available'}
+    rest_oid = to_object_id(meta['rest_id']) if meta.get('rest_id') else None
+    if rest_oid:
+        query['rest_id'] = rest_oid
+    available = {str(menu['_id']) for menu in get_db().menus.find(query, {'_id': 1})} if object_ids else set()
+
+    removed = [menu_id for menu_id in cart if menu_id not in available]
+    if not removed:
+        return cart, meta, []
+    names = [meta.get('items', {}).get(menu_id, {}).get('name', 'N/A') for menu_id in removed]
+    cart = {menu_id: qty for menu_id, qty in cart.items() if menu_id in available}
+    items = {k: v for k, v in meta.get('items', {}).items() if k in available}
+    meta = {'rest_id': meta.get('rest_id') if cart else None, 'items': items}
+    _store(user_id, cart, meta)
+    return cart, meta, names
+
+def load_user_cart(user):
+    """
+    Nạp giỏ hàng đã lưu trong users.cart vào session khi đăng nhập
+    Giỏ hàng cũ chưa có cart_meta sẽ được bổ sung metadata và lưu lại
+    Tham số: user (dict) - Document user vừa đăng nhập
+    """
+    cart = user.get('cart') or {}
+    if not cart:
+        return
+    meta = user.get('cart_meta')
+    fixed_meta = ensure_meta(cart, meta)
+    if fixed_meta is not meta:
+        cart = {menu_id: qty for menu_id, qty in cart.items() if menu_id in fixed_meta['items']}
+    session['cart'] = cart
+    session['cart_meta'] = fixed_meta
+    session.modified = True
+    if fixed_meta is not meta:
+        User.save_cart(str(user['_id']), cart, fixed_meta)
+
+def _store(user_id, cart, meta):
+    """Ghi giỏ hàng vào session và database"""
+    session['cart'] = cart
+    session['cart_meta'] = meta
+    session.modified = True
+    if user_id:
+        User.save_cart(user_id, cart, meta)
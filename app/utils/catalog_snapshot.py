@@ -0,0 +1,249 @@
+# Snapshot catalog (nhà hàng đã duyệt + món đang bán) ghi ra file nhị phân, các worker mmap chỉ đọc
+# Mọi process trên máy dùng chung một bản trong page cache của hệ điều hành, trang chủ/trang nhà hàng/tìm kiếm
+# không cần truy vấn database khi snapshot khớp version catalog hiện tại
+#
+# Cấu trúc file catalog-<version>.bin (little-endian):
+#   header        8s magic, q version, I số nhà hàng, I số món
+#   cột id        12 byte ObjectId mỗi nhà hàng, sắp xếp tăng dần (tìm nhị phân)
+#   cột nhà hàng  (Q offset, I độ dài) của document BSON mỗi nhà hàng
+#   cột khoảng    (I vị trí món đầu tiên, I số món) của mỗi nhà hàng
+#   cột món       (Q offset, I độ dài) của document BSON mỗi món, nhóm theo nhà hàng
+#   dữ liệu       các document BSON nối liền
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import defaultdict
+# Import bson để mã hóa/giải mã document (cùng định dạng MongoDB dùng)
+import bson
+from bson import ObjectId
+from bson.errors import InvalidId
+# Import current_app để lấy store của app hiện tại
+from flask import current_app
+# Import get_db để lấy database instance khi dựng snapshot
+from app.database import get_db
+# Import version catalog để biết snapshot nào còn đúng
+from app.utils.fragment_cache import catalog_version, CATALOG_KEY
+# Import debug_sampled để chỉ ghi log debug ở request được lấy mẫu (đường đi nóng)
+from app.utils.logs import debug_sampled
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'FFCAT001'
+HEADER = struct.Struct('<8sqII')
+SPAN = struct.Struct('<QI')
+RANGE = struct.Struct('<II')
+ID_SIZE = 12
+# Số file snapshot cũ giữ lại (process khác có thể vẫn đang mmap)
+KEEP_FILES = 3
+# Lock dựng snapshot của process bị dừng giữa chừng: bỏ qua sau số giây này
+LOCK_TIMEOUT = 60
+# Khoảng cách tối thiểu (giây) giữa hai lần thử dựng cùng một version trong một process
+RETRY_INTERVAL = 1.0
+
+def snapshot_path(directory, version):
+    """Đường dẫn file snapshot của một version"""
+    return os.path.join(directory, f"catalog-{version}.bin")
+
+def build_snapshot(directory, version=None):
+    """
+    Đọc catalog từ database và ghi file snapshot (ghi file tạm rồi os.replace nên không ai đọc phải file dở)
+    Tham số:
+        directory (string) - Thư mục chứa snapshot
+        version (int, optional) - Version catalog; mặc định đọc từ cache_versions
+    Trả về: Đường dẫn file snapshot
+    """
+    db = get_db()
+    if version is None:
+        doc = db.cache_versions.find_one({'_id': CATALOG_KEY})
+        version = doc['version'] if doc else 0
+
+    restaurants = sorted(db.restaurants.find({'status': 'approved'}), key=lambda r: r['_id'].binary)
+    menus_by_restaurant = defaultdict(list)
+    if restaurants:
+        menus = db.menus.find({'rest_id': {'$in': [r['_id'] for r in restaurants]}, 'status': 'available'})
+        for menu in menus.sort('_id', 1):
+            menus_by_restaurant[menu['rest_id']].append(menu)
+
+    data = bytearray()
+    id_column = bytearray()
+    restaurant_spans = bytearray()
+    ranges = bytearray()
+    menu_spans = bytearray()
+    menu_count = 0
+    for restaurant in restaurants:
+        encoded = bson.encode(restaurant)
+        id_column += restaurant['_id'].binary
+        restaurant_spans += SPAN.pack(len(data), len(encoded))
+        data += encoded
+        menus = menus_by_restaurant.get(restaurant['_id'], [])
+        ranges += RANGE.pack(menu_count, len(menus))
+        for menu in menus:
+            encoded = bson.encode(menu)
+            menu_spans += SPAN.pack(len(data), len(encoded))
+            data += encoded
+        menu_count += len(menus)
+
+    os.makedirs(directory, exist_ok=True)
+    path = snapshot_path(directory, version)
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, version, len(restaurants), menu_count))
+        for column in (id_column, restaurant_spans, ranges, menu_spans, data):
+            f.write(column)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    prune(directory)
+    return path
+
+def prune(directory, keep=KEEP_FILES):
+    """Xóa các snapshot cũ, giữ lại keep file mới nhất"""
+    versions = []
+    for name in os.listdir(directory):
+        if name.startswith('catalog-') and name.endswith('.bin'):
+            try:
+                versions.append(int(name[len('catalog-'):-len('.bin')]))
+            except ValueError:
+                continue
+    for version in sorted(versions)[:-keep]:
+        try:
+            os.remove(snapshot_path(directory, version))
+        except OSError:
+            # Windows không cho xóa file đang được mmap: để lần sau
+            pass
+
+class CatalogSnapshot:
+    """Một file snapshot đã mmap (chỉ đọc); document được giải mã khi cần nên mỗi lần trả về là bản mới"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.version, self.restaurant_count, self.menu_count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a catalog snapshot: {path}")
+        self._ids_at = HEADER.size
+        self._restaurants_at = self._ids_at + ID_SIZE * self.restaurant_count
+        self._ranges_at = self._restaurants_at + SPAN.size * self.restaurant_count
+        self._menus_at = self._ranges_at + RANGE.size * self.restaurant_count
+        self._data_at = self._menus_at + SPAN.size * self.menu_count
+
+    def _decode(self, column_at, index):
+        offset, length = SPAN.unpack_from(self._mm, column_at + SPAN.size * index)
+        start = self._data_at + offset
+        return bson.decode(self._mm[start:start + length])
+
+    def _index_of(self, rest_id):
+        """Tìm nhị phân vị trí nhà hàng trong cột id, None nếu không có"""
+        try:
+            key = ObjectId(rest_id).binary
+        except (InvalidId, TypeError):
+            return None
+        lo, hi = 0, self.restaurant_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            at = self._ids_at + ID_SIZE * mid
+            current = self._mm[at:at + ID_SIZE]
+            if current < key:
+                lo = mid + 1
+            elif current > key:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def restaurant(self, rest_id):
+        """Document nhà hàng đã duyệt, None nếu không có trong snapshot"""
+        index = self._index_of(rest_id)
+        return None if index is None else self._decode(self._restaurants_at, index)
+
+    def restaurants(self):
+        """Tất cả nhà hàng đã duyệt (thứ tự _id)"""
+        return [self._decode(self._restaurants_at, i) for i in range(self.restaurant_count)]
+
+    def menus(self, rest_id):
+        """Các món đang bán của nhà hàng (thứ tự _id), list rỗng nếu nhà hàng không có trong snapshot"""
+        index = self._index_of(rest_id)
+        if index is None:
+            return []
+        first, count = RANGE.unpack_from(self._mm, self._ranges_at + RANGE.size * index)
+        return [self._decode(self._menus_at, first + i) for i in range(count)]
+
+class SnapshotStore:
+    """
+    Giữ snapshot đang dùng của process; khi version catalog đổi thì mở file mới và đổi tham chiếu
+    (request đang đọc bản cũ vẫn giữ tham chiếu của nó). Chưa có file cho version mới thì dựng ở thread nền
+    và trả về None để route đọc database như trước, tránh phục vụ nội dung cũ dưới version mới
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.current = None
+        self._building = set()
+        self._attempted = {}
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Snapshot khớp version catalog hiện tại, None nếu chưa có"""
+        version = catalog_version()
+        snapshot = self.current
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        path = snapshot_path(self.directory, version)
+        if os.path.exists(path):
+            try:
+                snapshot = CatalogSnapshot(path)
+            except (OSError, ValueError):
+                return None
+            self.current = snapshot
+            return snapshot
+        if debug_sampled():
+            logger.debug("Catalog snapshot %s not built yet, reading database", version)
+        self._build_async(version)
+        return None
+
+    def _build_async(self, version):
+        """Dựng snapshot ở thread nền; lock file để chỉ một process dựng mỗi version"""
+        now = time.monotonic()
+        with self._lock:
+            if version in self._building or now - self._attempted.get(version, -RETRY_INTERVAL) < RETRY_INTERVAL:
+                return
+            self._building.add(version)
+            self._attempted = {version: now}
+        threading.Thread(target=self._build, args=(version,), name='catalog-snapshot', daemon=True).start()
+
+    def _build(self, version):
+        lock_path = snapshot_path(self.directory, version) + '.lock'
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                # Process khác đang dựng; lock quá cũ thì coi như process đó đã dừng
+                if time.time() - os.path.getmtime(lock_path) < LOCK_TIMEOUT:
+                    return
+                os.remove(lock_path)
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.close(fd)
+            try:
+                build_snapshot(self.directory, version)
+            finally:
+                os.remove(lock_path)
+        except Exception as e:
+            logger.warning("Could not build catalog snapshot %s: %s", version, e)
+        finally:
+            with self._lock:
+                self._building.discard(version)
+
+def get_catalog_snapshot():
+    """Snapshot catalog của app hiện tại (None nếu tắt hoặc chưa dựng xong version hiện tại)"""
+    store = current_app.extensions.get('catalog_snapshot')
+    return store.get() if store is not None else None
+
+def init_app(app):
+    """Tạo store với thư mục CATALOG_SNAPSHOT_DIR (để trống để tắt)"""
+    directory = app.config.get('CATALOG_SNAPSHOT_DIR')
+    if directory:
+        app.extensions['catalog_snapshot'] = SnapshotStore(directory)
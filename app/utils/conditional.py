@@ -0,0 +1,67 @@
+# HTTP conditional GET: ETag / Last-Modified để trình duyệt nhận 304 thay vì cả trang
+import hashlib
+import os
+# Import các đối tượng Flask để đọc request/session và tạo response
+from flask import current_app, request, session, make_response
+
+# Các giá trị trong session mà base.html hiển thị (thanh điều hướng): khác người xem thì khác ETag
+SESSION_KEYS = ('user_id', 'user_role', 'user_name')
+
+def page_etag(*parts):
+    """
+    Tạo ETag (weak) cho một trang từ version các document mà trang phụ thuộc
+    Kèm thông tin người xem trong session và salt của bản build (template thay đổi thì ETag đổi)
+    Tham số: *parts - Các giá trị version (updated_at, version catalog, ID...)
+    Trả về: Chuỗi ETag (không có dấu ngoặc kép)
+    """
+    viewer = [session.get(key) for key in SESSION_KEYS]
+    viewer.append(len(session.get('cart') or {}))
+    raw = repr((current_app.extensions.get('etag_salt'), viewer, parts))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def not_modified(etag, last_modified=None):
+    """
+    Kiểm tra If-None-Match / If-Modified-Since trước khi truy vấn và render
+    Tham số:
+        etag (string) - ETag hiện tại của trang
+        last_modified (datetime, optional) - Thời điểm thay đổi cuối của dữ liệu
+    Trả về: Response 304 nếu trình duyệt đã có bản mới nhất, None nếu cần render
+    """
+    # Có flash message đang chờ hiển thị thì phải render lại
+    if session.get('_flashes'):
+        return None
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
+    elif last_modified and request.if_modified_since:
+        fresh = last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    else:
+        fresh = False
+    if not fresh:
+        return None
+    response = current_app.response_class(status=304)
+    return with_validators(response, etag, last_modified)
+
+def with_validators(response, etag, last_modified=None):
+    """
+    Gắn ETag / Last-Modified vào response đã render
+    Cache-Control private, no-cache: trình duyệt giữ bản sao nhưng phải hỏi lại server mỗi lần
+    """
+    response = make_response(response)
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def template_salt(template_folder):
+    """Salt của bản build: mtime + kích thước các file template"""
+    digest = hashlib.sha1()
+    for root, _, files in os.walk(template_folder or ''):
+        for name in sorted(files):
+            stat = os.stat(os.path.join(root, name))
+            digest.update(f"{name}:{stat.st_mtime_ns}:{stat.st_size};".encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+def init_app(app):
+    """Tính salt của template một lần khi khởi động"""
+    app.extensions['etag_salt'] = template_salt(app.template_folder)
@@ -0,0 +1,184 @@
+# Cache đọc xuyên (read-through) trong process cho document nhà hàng / món ăn
+import copy
+import threading
+import time
+from collections import OrderedDict
+# Import BSON để ước lượng bộ nhớ của document (kích thước khi mã hóa)
+import bson
+# Import subscribe để nhận thay đổi do process khác ghi (bus xóa cache)
+from app.utils.invalidation import subscribe
+
+class DocumentCache:
+    """
+    Cache LRU có TTL cho kết quả truy vấn theo key
+    Mỗi entry thuộc một nhóm (ví dụ ID nhà hàng) để xóa cùng lúc các danh sách liên quan khi có thay đổi
+    Trả về bản sao (deepcopy) để route gán thêm trường (menu['restaurant'], display_image...) không làm bẩn cache
+    """
+
+    def __init__(self, max_entries=2048, ttl=30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()   # key -> (hết hạn lúc, giá trị, kích thước bytes, nhóm)
+        self._groups = {}               # nhóm -> set các key
+        self._lock = threading.Lock()
+        # Tăng mỗi lần xóa: kết quả truy vấn bắt đầu trước một lần ghi không được lưu vào cache
+        self._generation = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key, loader, group=None):
+        """
+        Lấy giá trị từ cache hoặc gọi loader (truy vấn database) rồi lưu lại
+        Tham số:
+            key (tuple) - Key của truy vấn, ví dụ ('menu', menu_id)
+            loader (callable) - Hàm không tham số trả về document / list document (None không được cache)
+            group (string, optional) - Nhóm của entry để xóa theo nhóm
+        Trả về: Bản sao của giá trị
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return copy.deepcopy(entry[1])
+                self._remove(key)
+                self.expirations += 1
+            self.misses += 1
+            generation = self._generation
+
+        value = loader()
+        if value is None or self.max_entries <= 0:
+            return value
+        size = document_size(value)
+        with self._lock:
+            if generation != self._generation:
+                # Có ghi trong lúc đang truy vấn: giá trị có thể đã cũ
+                return value
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (now + self.ttl, value, size, group)
+            self.bytes += size
+            if group is not None:
+                self._groups.setdefault(group, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return copy.deepcopy(value)
+
+    def invalidate(self, *keys):
+        """Xóa các key (gọi sau khi ghi database)"""
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def invalidate_group(self, group):
+        """Xóa mọi entry thuộc nhóm"""
+        with self._lock:
+            self._generation += 1
+            for key in list(self._groups.get(group, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def invalidate_kind(self, kind):
+        """Xóa mọi entry có key bắt đầu bằng kind (ví dụ 'menus' khi không biết món thuộc nhà hàng nào)"""
+        with self._lock:
+            self._generation += 1
+            for key in [k for k in self._entries if k[0] == kind]:
+                self._remove(key)
+                self.invalidations += 1
+
+    def _remove(self, key):
+        """Xóa một entry (đã giữ lock)"""
+        _, _, size, group = self._entries.pop(key)
+        self.bytes -= size
+        if group is not None:
+            keys = self._groups.get(group)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._groups[group]
+
+    def clear(self):
+        """Xóa toàn bộ cache"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._groups.clear()
+            self.bytes = 0
+
+    def configure(self, max_entries, ttl):
+        """Đặt lại kích thước và TTL (từ cấu hình app), xóa entry cũ"""
+        with self._lock:
+            self.max_entries = max_entries
+            self.ttl = ttl
+        self.clear()
+
+    def stats(self):
+        """Số liệu của cache (dùng cho giám sát)"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+def document_size(value):
+    """Ước lượng bộ nhớ của document hoặc list document bằng kích thước BSON"""
+    if isinstance(value, list):
+        return sum(document_size(item) for item in value)
+    if isinstance(value, dict):
+        try:
+            return len(bson.encode(value))
+        except Exception:
+            return 0
+    return 0
+
+# Một cache cho mỗi process, dùng chung bởi Restaurant và Menu trong models.py
+catalog_cache = DocumentCache()
+
+def on_restaurant_change(doc_id, operation, document=None):
+    """Bus: nhà hàng thay đổi ở process khác"""
+    if doc_id is None:
+        catalog_cache.clear()
+        return
+    catalog_cache.invalidate(('restaurant', str(doc_id)))
+
+def on_menu_change(doc_id, operation, document=None):
+    """
+    Bus: món ăn thay đổi ở process khác
+    document là event do models.Menu.invalidate gửi ({'rest_ids': [...]}) hoặc fullDocument của change stream
+    """
+    if doc_id is None:
+        catalog_cache.clear()
+        return
+    catalog_cache.invalidate(('menu', str(doc_id)))
+    document = document or {}
+    rest_ids = document.get('rest_ids') or ([document['rest_id']] if document.get('rest_id') else [])
+    if not rest_ids:
+        # Món đã bị xóa (change stream không còn document): không biết nhà hàng nào
+        catalog_cache.invalidate_kind('menus')
+    for rest_id in rest_ids:
+        catalog_cache.invalidate_group(str(rest_id))
+
+subscribe('restaurants', on_restaurant_change)
+subscribe('menus', on_menu_change)
+
+def init_app(app):
+    """Cấu hình kích thước/TTL từ MODEL_CACHE_SIZE, MODEL_CACHE_TTL"""
+    catalog_cache.configure(app.config.get('MODEL_CACHE_SIZE', 2048), app.config.get('MODEL_CACHE_TTL', 30.0))
+    app.extensions['catalog_cache'] = catalog_cache
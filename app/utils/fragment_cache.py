@@ -0,0 +1,148 @@
+# Cache HTML đã render của các khối catalog (trang chủ, menu nhà hàng)
+import logging
+import threading
+import time
+from collections import OrderedDict
+# Import ReturnDocument để lấy version sau khi tăng
+from pymongo import ReturnDocument
+# Import current_app để lấy cache của app hiện tại
+from flask import current_app
+# Import Markup để chèn HTML đã render vào template mà không bị escape
+from markupsafe import Markup
+# Import get_db để lấy database instance
+from app.database import get_db
+# Import subscribe để nhận version mới ngay khi process khác tăng (chế độ change stream)
+from app.utils.invalidation import subscribe
+# Import debug_sampled để chỉ ghi log debug ở request được lấy mẫu (đường đi nóng)
+from app.utils.logs import debug_sampled
+
+logger = logging.getLogger(__name__)
+
+# Version catalog lưu trong collection cache_versions để mọi process (web, worker) dùng chung:
+#   - mỗi lần sửa menu/nhà hàng tăng version -> key cache cũ không còn được dùng, bị LRU đẩy ra dần
+#   - mỗi process chỉ đọc lại version sau CATALOG_VERSION_TTL giây
+CATALOG_KEY = 'catalog'
+_version = {'value': None, 'checked_at': 0.0}
+_version_lock = threading.Lock()
+
+def catalog_version():
+    """Version catalog hiện tại (đọc lại từ database tối đa mỗi CATALOG_VERSION_TTL giây)"""
+    ttl = current_app.config.get('CATALOG_VERSION_TTL', 1.0)
+    now = time.monotonic()
+    if _version['value'] is not None and now - _version['checked_at'] < ttl:
+        return _version['value']
+    doc = get_db().cache_versions.find_one({'_id': CATALOG_KEY})
+    with _version_lock:
+        _version['value'] = doc['version'] if doc else 0
+        _version['checked_at'] = now
+    return _version['value']
+
+def bump_catalog_version():
+    """
+    Tăng version catalog (gọi sau khi sửa menu/nhà hàng)
+    Trả về: Version mới
+    """
+    doc = get_db().cache_versions.find_one_and_update(
+        {'_id': CATALOG_KEY},
+        {'$inc': {'version': 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    with _version_lock:
+        _version['value'] = doc['version']
+        _version['checked_at'] = time.monotonic()
+    return doc['version']
+
+def on_version_change(doc_id, operation, document=None):
+    """Bus: version catalog đổi ở process khác thì dùng ngay, không chờ hết CATALOG_VERSION_TTL"""
+    if doc_id is None:
+        # Mất dấu event: đọc lại version ở lần gọi tới
+        _version['checked_at'] = 0.0
+    elif doc_id == CATALOG_KEY and document and 'version' in document:
+        with _version_lock:
+            _version['value'] = document['version']
+            _version['checked_at'] = time.monotonic()
+
+subscribe('cache_versions', on_version_change)
+
+class FragmentCache:
+    """
+    Cache LRU cho HTML đã render, key gồm version catalog
+    Nhiều request cùng miss một key chỉ render một lần (single-flight): request đầu render,
+    các request khác chờ và dùng lại kết quả
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+        self.evictions = 0
+
+    def get_or_render(self, key, render):
+        """
+        Lấy HTML từ cache hoặc render
+        Tham số:
+            key (tuple) - Key của khối (ví dụ ('home',) hoặc ('restaurant', rest_id))
+            render (callable) - Hàm không tham số trả về HTML (string)
+        Trả về: Markup
+        """
+        full_key = (catalog_version(), key)
+        with self._lock:
+            html = self._entries.get(full_key)
+            if html is not None:
+                self._entries.move_to_end(full_key)
+                self.hits += 1
+                return html
+            flight = self._inflight.get(full_key)
+            leader = flight is None
+            if leader:
+                self.misses += 1
+                flight = self._inflight[full_key] = {'event': threading.Event(), 'html': None}
+            else:
+                # Đang có request khác render key này
+                self.collapsed += 1
+
+        if debug_sampled():
+            logger.debug("Fragment cache miss", extra={'key': repr(key), 'collapsed': not leader})
+        if not leader:
+            flight['event'].wait()
+            if flight['html'] is not None:
+                return flight['html']
+            # Request render trước bị lỗi: tự render
+            return Markup(render())
+
+        try:
+            html = flight['html'] = Markup(render())
+            with self._lock:
+                self._entries[full_key] = html
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            return html
+        finally:
+            with self._lock:
+                self._inflight.pop(full_key, None)
+            flight['event'].set()
+
+    def clear(self):
+        """Xóa toàn bộ cache"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Số liệu của cache (dùng cho giám sát)"""
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'collapsed': self.collapsed, 'evictions': self.evictions}
+
+def get_fragment_cache():
+    """Lấy FragmentCache của app hiện tại"""
+    return current_app.extensions['fragment_cache']
+
+def init_app(app):
+    """Tạo FragmentCache cho app với kích thước từ FRAGMENT_CACHE_SIZE"""
+    app.extensions['fragment_cache'] = FragmentCache(app.config.get('FRAGMENT_CACHE_SIZE', 256))
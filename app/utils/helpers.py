@@ -8,6 +8,14 @@ def to_object_id(id_string):
     except:
         return None
 
+def find_by_ids(collection, ids, projection=None):
+    """Fetch documents by _id with a single $in query, returned as {str(_id): document}"""
+    object_ids = {to_object_id(str(i)) for i in ids}
+    object_ids.discard(None)
+    if not object_ids:
+        return {}
+    return {str(doc['_id']): doc for doc in collection.find({'_id': {'$in': list(object_ids)}}, projection)}
+
 def format_currency(amount):
     """Format number as Vietnamese currency"""
     return f"{amount:,.0f} đ".replace(',', '.')
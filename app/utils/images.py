@@ -0,0 +1,123 @@
+# Lưu ảnh upload (món ăn, đánh giá) và tạo các bản thu nhỏ WebP/JPEG trong worker
+import os
+# Import url_to_path để tìm file ảnh gốc từ URL, write_atomic để không để lộ bản thu nhỏ đang ghi dở
+from app.utils.uploads import url_to_path, write_atomic
+
+# Pillow là dependency tùy chọn: thiếu thì vẫn lưu ảnh gốc, chỉ không tạo bản thu nhỏ
+# Chỉ import khi tạo ảnh (trong worker) để web server và các script khởi động nhanh hơn
+_pil = {}
+
+def _pillow():
+    """Import Pillow lần đầu cần dùng; trả về (Image, ImageOps) hoặc None nếu chưa cài"""
+    if 'modules' not in _pil:
+        try:
+            from PIL import Image, ImageOps
+            _pil['modules'] = (Image, ImageOps)
+        except ImportError:  # pragma: no cover
+            _pil['modules'] = None
+    return _pil['modules']
+
+# Các kích thước ảnh: tên -> chiều rộng tối đa (px)
+VARIANTS = {
+    'thumb': 160,
+    'card': 480,
+    'full': 1200,
+}
+
+# Chất lượng nén cho từng định dạng
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+def make_variants(url):
+    """
+    Tạo các bản thu nhỏ WebP + JPEG cho ảnh upload (bỏ EXIF/metadata, xoay theo EXIF trước khi bỏ)
+    Tham số: url (string) - URL ảnh gốc do uploads.save_upload trả về
+    Trả về: Dict {'thumb': {'width', 'webp', 'jpeg'}, 'card': ..., 'full': ...},
+            None nếu không có Pillow, không phải ảnh upload hoặc file không đọc được
+    """
+    path = url_to_path(url)
+    pil = _pillow()
+    if pil is None or path is None or not os.path.exists(path):
+        return None
+    Image, ImageOps = pil
+
+    stem, _ = os.path.splitext(path)
+    url_stem, _ = os.path.splitext(url)
+
+    # Ảnh trùng nội dung (cùng hash) đã được xử lý trước đó: dùng lại bản thu nhỏ đã có
+    existing = reuse_variants(stem, url_stem)
+    if existing:
+        return existing
+
+    variants = {}
+    try:
+        original = Image.open(path)
+    except OSError:
+        # File không phải ảnh (UnidentifiedImageError): giữ ảnh gốc, không thử lại
+        return None
+    with original:
+        # Ảnh JPEG lớn được giải mã ở độ phân giải giảm sẵn (nhanh hơn nhiều so với giải mã đủ rồi thu nhỏ)
+        largest = max(VARIANTS.values())
+        original.draft('RGB', (largest, largest))
+        # Ảnh chụp điện thoại lưu hướng xoay trong EXIF: áp dụng trước khi bỏ metadata
+        image = ImageOps.exif_transpose(original)
+        # JPEG không có kênh alpha: nền trong suốt đổi thành trắng
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        for name, width in VARIANTS.items():
+            resized = image.copy()
+            # Chỉ thu nhỏ, không phóng to ảnh nhỏ hơn kích thước variant
+            resized.thumbnail((width, width * 4), Image.LANCZOS)
+            # Không truyền exif/icc_profile khi lưu nên metadata bị loại bỏ
+            # File được cache vĩnh viễn (immutable) và reuse_variants dùng lại file có sẵn:
+            # ghi qua file tạm để worker bị dừng giữa chừng không để lại file hỏng ở tên cuối
+            write_atomic(f"{stem}_{name}.webp",
+                         lambda out: resized.save(out, 'WEBP', quality=WEBP_QUALITY, method=4))
+            write_atomic(f"{stem}_{name}.jpg",
+                         lambda out: resized.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True))
+            variants[name] = {
+                'width': resized.width,
+                'webp': f"{url_stem}_{name}.webp",
+                'jpeg': f"{url_stem}_{name}.jpg",
+            }
+    return variants
+
+def reuse_variants(stem, url_stem):
+    """Trả về variants nếu tất cả file bản thu nhỏ đã tồn tại (chỉ đọc header để lấy chiều rộng)"""
+    Image, _ = _pillow()
+    variants = {}
+    for name in VARIANTS:
+        webp_path = f"{stem}_{name}.webp"
+        if not (os.path.exists(webp_path) and os.path.exists(f"{stem}_{name}.jpg")):
+            return None
+        with Image.open(webp_path) as variant:
+            width = variant.width
+        variants[name] = {'width': width, 'webp': f"{url_stem}_{name}.webp", 'jpeg': f"{url_stem}_{name}.jpg"}
+    return variants
+
+def variant_url(variants, name='card', fallback=None, fmt='jpeg'):
+    """Template filter: URL của một variant, fallback nếu ảnh chưa được xử lý"""
+    if variants and name in variants:
+        return variants[name][fmt]
+    return fallback
+
+def srcset(variants, fmt='webp'):
+    """Template filter: giá trị thuộc tính srcset ('url 160w, url 480w, ...')"""
+    if not variants:
+        return ''
+    # Ảnh gốc nhỏ thì nhiều variant có cùng chiều rộng: mỗi chiều rộng chỉ giữ một URL
+    by_width = {}
+    for variant in variants.values():
+        by_width.setdefault(variant['width'], variant[fmt])
+    return ', '.join(f"{url} {width}w" for width, url in sorted(by_width.items()))
+
+def init_app(app):
+    """Đăng ký template filter dùng trong template"""
+    app.add_template_filter(variant_url, 'variant')
+    app.add_template_filter(srcset, 'srcset')
@@ -0,0 +1,270 @@
+# Import dữ liệu JSON / NDJSON lớn vào MongoDB: đọc file từng document (không nạp cả file vào bộ nhớ),
+# đổi ID tượng trưng (REST_ID_0, CUST1_ID...) thành ObjectId và ghi bằng insert_many(ordered=False)
+# qua nhiều thread song song
+#
+# ID tượng trưng có hai loại:
+#   - theo vị trí: <tiền tố>_<số thứ tự> (REST_ID_3 = document thứ 4 của file restaurants), document không có _id
+#     được gán ObjectId tính từ vị trí nên không cần lưu bảng ánh xạ (kể cả với hàng triệu đơn hàng)
+#   - đặt tên: khai báo trong file symbols.json, ví dụ {"CUST1_ID": {"collection": "users", "match": {"phone": "0901000001"}}};
+#     lượt ánh xạ (mapping pass) đọc trước các collection được khai báo để tìm document khớp
+# Phần thời gian của ObjectId theo vị trí (epoch) được lưu trong db.migrations ở lần import đầu tiên và dùng lại
+# ở các lần sau: REST_ID_0 luôn là cùng một ObjectId, import orders/payments ở lần chạy riêng vẫn tham chiếu đúng
+# nhà hàng/đơn hàng, và import lại một file sau khi lỗi được đếm là trùng thay vì thêm bản sao
+import json
+import re
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+# Import json_util để đọc Extended JSON ({"$date": ...}, {"$oid": ...}) như mongoexport/mongoimport
+from bson import ObjectId, json_util
+# Import ReturnDocument để đọc epoch sau khi upsert
+from pymongo import ReturnDocument
+# Import BulkWriteError để đếm document trùng _id (import lại cùng file) thay vì dừng
+from pymongo.errors import BulkWriteError
+
+# Thứ tự import mặc định (collection sau tham chiếu đến collection trước)
+COLLECTIONS = ('users', 'restaurants', 'menus', 'orders', 'payments', 'reviews')
+# Tiền tố ID theo vị trí của từng collection
+PREFIXES = {
+    'users': 'USER_ID',
+    'restaurants': 'REST_ID',
+    'menus': 'MENU_ID',
+    'orders': 'ORDER_ID',
+    'payments': 'PAYMENT_ID',
+    'reviews': 'REVIEW_ID',
+}
+POSITIONAL = re.compile(r'^(' + '|'.join(PREFIXES.values()) + r')_(\d+)$')
+# Chuỗi có dạng ID tượng trưng (dùng để báo các ID không đổi được)
+SYMBOL = re.compile(r'^[A-Z][A-Z0-9]*(?:_[A-Z0-9]+)*_ID(?:_\d+)?$')
+EXTENSIONS = ('.ndjson', '.jsonl', '.json')
+# _id của document lưu epoch trong collection migrations
+EPOCH_ID = 'import_data'
+# Kích thước mỗi lần đọc file, và kích thước tối đa của một document chưa đọc xong (giới hạn BSON là 16MB)
+CHUNK_SIZE = 1 << 20
+MAX_DOCUMENT = 32 << 20
+# Ký tự giữa các document: khoảng trắng, dấu phẩy và ngoặc của mảng JSON
+SEPARATORS = ' \t\r\n,[]'
+
+def positional_epoch(db, epoch=None):
+    """
+    Epoch của ObjectId theo vị trí: giá trị đã lưu ở lần import trước, hoặc lưu giá trị mới (epoch / thời gian hiện tại)
+    Tham số:
+        db - Database đích
+        epoch (int, optional) - Ghi đè giá trị đã lưu (import vào database khác nhưng cần cùng ObjectId)
+    Trả về: Epoch (int, giây)
+    """
+    if epoch is not None:
+        db.migrations.update_one({'_id': EPOCH_ID}, {'$set': {'epoch': int(epoch)}}, upsert=True)
+        return int(epoch)
+    state = db.migrations.find_one_and_update(
+        {'_id': EPOCH_ID},
+        {'$setOnInsert': {'epoch': int(time.time())}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return state['epoch']
+
+def iter_documents(path):
+    """
+    Đọc lần lượt từng document của file JSON array, NDJSON hoặc nhiều object nối tiếp (mongoexport)
+    Tham số: path (string) - Đường dẫn file
+    Trả về: Generator các dictionary (Extended JSON đã đổi sang datetime, ObjectId...)
+    """
+    decoder = json.JSONDecoder(object_hook=json_util.object_hook)
+    with open(path, encoding='utf-8') as f:
+        buffer, pos, eof = '', 0, False
+        while True:
+            while pos < len(buffer) and buffer[pos] in SEPARATORS:
+                pos += 1
+            if pos == len(buffer):
+                if eof:
+                    return
+                buffer, pos = f.read(CHUNK_SIZE), 0
+                eof = not buffer
+                continue
+            try:
+                document, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Document bị cắt ở cuối buffer: đọc thêm rồi thử lại
+                if eof or len(buffer) - pos > MAX_DOCUMENT:
+                    raise
+                chunk = f.read(CHUNK_SIZE)
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            if not isinstance(document, dict):
+                raise ValueError(f"{path}: phần tử không phải object JSON: {str(document)[:80]}")
+            pos = end
+            yield document
+
+class SymbolTable:
+    """Đổi ID tượng trưng thành ObjectId: theo vị trí (tính toán) hoặc theo tên (bảng ánh xạ)"""
+
+    def __init__(self, aliases=None, epoch=None):
+        # Phần thời gian của các ObjectId sinh ra trong lần import này
+        self.epoch = int(epoch if epoch is not None else time.time())
+        # Tên -> {'collection', 'match'} và tên -> ObjectId (sau lượt ánh xạ)
+        self.aliases = aliases or {}
+        self.bound = {}
+        self.unresolved = {}
+
+    def positional_id(self, collection, index):
+        """ObjectId của document thứ index trong collection: 4 byte thời gian, 1 byte collection, 7 byte số thứ tự"""
+        kind = COLLECTIONS.index(collection) + 1 if collection in COLLECTIONS else 0
+        return ObjectId(struct.pack('>IB', self.epoch, kind) + index.to_bytes(7, 'big'))
+
+    def pending(self, collection):
+        """Các tên chưa tìm được document khớp trong collection"""
+        return {name: rule['match'] for name, rule in self.aliases.items()
+                if rule['collection'] == collection and name not in self.bound}
+
+    def bind_matches(self, collection, documents):
+        """
+        Lượt ánh xạ: duyệt documents (theo thứ tự trong file) và gán tên cho document đầu tiên khớp
+        Dừng đọc khi mọi tên của collection đã được gán
+        """
+        pending = self.pending(collection)
+        for index, document in enumerate(documents):
+            if not pending:
+                return
+            for name, match in list(pending.items()):
+                if all(document.get(field) == value for field, value in match.items()):
+                    self.bound[name] = document.get('_id') or self.positional_id(collection, index)
+                    del pending[name]
+
+    def resolve(self, value):
+        """ObjectId của một ID tượng trưng, None nếu không phải / không đổi được"""
+        if value in self.bound:
+            return self.bound[value]
+        positional = POSITIONAL.match(value)
+        if positional:
+            collection = next(name for name, prefix in PREFIXES.items() if prefix == positional.group(1))
+            return self.positional_id(collection, int(positional.group(2)))
+        return None
+
+    def replace(self, value):
+        """Đổi mọi ID tượng trưng trong value (dict, list lồng nhau)"""
+        if isinstance(value, str):
+            if '_ID' in value and SYMBOL.match(value):
+                resolved = self.resolve(value)
+                if resolved is not None:
+                    return resolved
+                self.unresolved[value] = self.unresolved.get(value, 0) + 1
+            return value
+        if isinstance(value, dict):
+            return {key: self.replace(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.replace(item) for item in value]
+        return value
+
+class BatchWriter:
+    """
+    Ghi các lô insert_many(ordered=False) bằng pool thread; số lô đang chờ ghi bị giới hạn
+    nên bộ nhớ không tăng theo kích thước file khi đọc nhanh hơn ghi
+    Document trùng _id (import lại) được đếm là duplicates, lỗi khác được ghi lại và báo khi kết thúc
+    """
+
+    def __init__(self, db, workers=4):
+        self.db = db
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='import-writer')
+        self._slots = threading.BoundedSemaphore(workers * 2)
+        self._lock = threading.Lock()
+        self.counts = {}
+        self.errors = []
+
+    def submit(self, collection, batch):
+        """Đưa một lô vào hàng đợi ghi (chờ nếu đã đủ số lô đang chờ)"""
+        self._slots.acquire()
+        future = self._pool.submit(self._write, collection, batch)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _write(self, collection, batch):
+        duplicates, errors = 0, []
+        try:
+            inserted = len(self.db[collection].insert_many(batch, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            inserted = e.details.get('nInserted', 0)
+            for error in e.details.get('writeErrors', []):
+                if error.get('code') == 11000:
+                    duplicates += 1
+                else:
+                    errors.append(error.get('errmsg', str(error)))
+        with self._lock:
+            counts = self.counts.setdefault(collection, {'inserted': 0, 'duplicates': 0, 'errors': 0})
+            counts['inserted'] += inserted
+            counts['duplicates'] += duplicates
+            counts['errors'] += len(errors)
+            if len(self.errors) < 5:
+                self.errors.extend(errors[:5 - len(self.errors)])
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+def import_file(writer, symbols, collection, path, batch_size=1000):
+    """
+    Import một file vào collection (chờ đến khi mọi lô của file đã ghi xong)
+    Trả về: Dictionary: collection, path, read, inserted, duplicates, errors, seconds, docs_per_sec, plain_passwords
+    """
+    start = time.perf_counter()
+    before = dict(writer.counts.get(collection, {'inserted': 0, 'duplicates': 0, 'errors': 0}))
+    futures, batch, read, plain_passwords = [], [], 0, 0
+    for index, document in enumerate(iter_documents(path)):
+        if '_id' not in document:
+            document['_id'] = symbols.positional_id(collection, index)
+        document = symbols.replace(document)
+        if collection == 'users' and document.get('password') and not str(document['password']).startswith('$2'):
+            plain_passwords += 1
+        batch.append(document)
+        read += 1
+        if len(batch) >= batch_size:
+            futures.append(writer.submit(collection, batch))
+            batch = []
+    if batch:
+        futures.append(writer.submit(collection, batch))
+    wait(futures)
+    for future in futures:
+        # Lỗi kết nối / quyền: dừng import
+        future.result()
+    seconds = time.perf_counter() - start
+    after = writer.counts.get(collection, before)
+    return {
+        'collection': collection,
+        'path': path,
+        'read': read,
+        'inserted': after['inserted'] - before['inserted'],
+        'duplicates': after['duplicates'] - before['duplicates'],
+        'errors': after['errors'] - before['errors'],
+        'seconds': round(seconds, 3),
+        'docs_per_sec': round(read / seconds) if seconds > 0 else read,
+        'plain_passwords': plain_passwords,
+    }
+
+def run_import(db, files, aliases=None, batch_size=1000, workers=4, report=print, epoch=None):
+    """
+    Import các file theo thứ tự: lượt ánh xạ cho các collection có ID đặt tên, rồi đọc và ghi từng file
+    Tham số:
+        db - Database đích
+        files (list) - List tuple (collection, đường dẫn file) theo thứ tự import
+        aliases (dict, optional) - ID đặt tên: {tên: {'collection': ..., 'match': {...}}}
+        batch_size (int) - Số document mỗi lệnh insert_many
+        workers (int) - Số thread ghi song song
+        report (callable) - Hàm nhận kết quả của từng file (in tiến độ)
+        epoch (int, optional) - Epoch của ObjectId theo vị trí, mặc định giá trị lưu trong db.migrations
+    Trả về: Tuple (list kết quả từng file, SymbolTable, list tối đa 5 lỗi ghi không phải trùng _id)
+    """
+    symbols = SymbolTable(aliases, positional_epoch(db, epoch))
+    for collection, path in files:
+        if symbols.pending(collection):
+            symbols.bind_matches(collection, iter_documents(path))
+    writer = BatchWriter(db, workers)
+    results = []
+    try:
+        for collection, path in files:
+            result = import_file(writer, symbols, collection, path, batch_size)
+            results.append(result)
+            report(result)
+    finally:
+        writer.close()
+    return results, symbols, writer.errors
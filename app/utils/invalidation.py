@@ -0,0 +1,199 @@
+# Bus xóa cache giữa các process: mỗi process web có một thread nhận thay đổi của menus/restaurants/cache_versions
+# và xóa các key tương ứng trong cache cục bộ (doc_cache, fragment_cache)
+#   - change_stream: theo dõi change stream của database (cần replica set, kể cả replica set một node)
+#   - poll: MongoDB standalone không có change stream; process ghi dữ liệu cấp số thứ tự tăng dần trong
+#     cache_versions và ghi event vào cache_invalidations, các process khác đọc số thứ tự mỗi giây
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+# Import các lỗi của pymongo để chuyển sang chế độ poll / kết nối lại
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure, PyMongoError
+# Import get_db để lấy database instance
+from app.database import get_db
+
+logger = logging.getLogger(__name__)
+
+# Các collection có cache cục bộ phụ thuộc (chỉ những collection có handler: change stream của users
+# sẽ đọc lại toàn bộ document user sau mỗi lần lưu giỏ hàng / cộng doanh thu mà không ai dùng)
+WATCHED = ('menus', 'restaurants', 'cache_versions')
+# Document trong cache_versions giữ số thứ tự event mới nhất (chế độ poll)
+SEQ_KEY = 'invalidation'
+# Số thứ tự đã cấp nhưng chưa thấy event (process ghi đang chậm hoặc bị lỗi): bỏ qua sau số giây này
+MISSING_TIMEOUT = 10.0
+# Bị tụt lại quá nhiều event (process treo lâu): xóa toàn bộ cache thay vì đọc từng event
+MAX_BACKLOG = 10000
+
+# collection -> các hàm handler(doc_id, operation, document); doc_id None nghĩa là xóa toàn bộ
+_handlers = {}
+_settings = {'mode': 'auto', 'poll_interval': 1.0, 'resolved': None}
+
+def subscribe(collection, handler):
+    """
+    Đăng ký hàm xóa cache khi collection thay đổi
+    Tham số:
+        collection (string) - Tên collection (một trong WATCHED)
+        handler (callable) - handler(doc_id, operation, document): doc_id None = mất dấu event, xóa hết
+    """
+    _handlers.setdefault(collection, []).append(handler)
+
+def dispatch(collection, doc_id, operation, document=None):
+    """Gọi các handler đã đăng ký cho collection"""
+    for handler in _handlers.get(collection, ()):
+        handler(doc_id, operation, document)
+
+def reset_all():
+    """Gọi mọi handler với doc_id None (sau khi mất kết nối có thể đã bỏ lỡ event)"""
+    for collection in WATCHED:
+        dispatch(collection, None, 'invalidate')
+
+def resolve_mode():
+    """
+    Chế độ của bus: cấu hình CACHE_BUS_MODE, 'auto' thì chọn change_stream nếu MongoDB là replica set/mongos
+    Trả về: 'change_stream', 'poll' hoặc 'off'
+    """
+    if _settings['mode'] != 'auto':
+        return _settings['mode']
+    if _settings['resolved'] is None:
+        hello = get_db().client.admin.command('hello')
+        replicated = 'setName' in hello or hello.get('msg') == 'isdbgrid'
+        _settings['resolved'] = 'change_stream' if replicated else 'poll'
+    return _settings['resolved']
+
+def publish(collection, doc_id, document=None):
+    """
+    Thông báo cho các process khác sau khi ghi (chỉ cần ở chế độ poll; change stream tự thấy thay đổi)
+    Tham số:
+        collection (string) - Tên collection vừa ghi
+        doc_id - _id của document
+        document (dict, optional) - Các trường handler cần (ví dụ rest_id của menu)
+    """
+    try:
+        if resolve_mode() != 'poll':
+            return
+        counter = get_db().cache_versions.find_one_and_update(
+            {'_id': SEQ_KEY},
+            {'$inc': {'seq': 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        get_db().cache_invalidations.insert_one({
+            'seq': counter['seq'],
+            'coll': collection,
+            'doc_id': doc_id,
+            'doc': document or {},
+            'at': datetime.now()
+        })
+    except PyMongoError as e:
+        # Process khác vẫn tự làm mới sau MODEL_CACHE_TTL
+        logger.warning("Could not publish cache invalidation for %s/%s: %s", collection, doc_id, e)
+
+class InvalidationBus:
+    """Thread nền nhận thay đổi và gọi dispatch(); mỗi process một thread (khởi động lại sau fork)"""
+
+    def __init__(self):
+        self.pid = None
+        self.thread = None
+        self.lock = threading.Lock()
+        # Chế độ poll: số thứ tự đã xử lý và các số thứ tự đang chờ event
+        self.high = None
+        self.missing = {}
+
+    def ensure_started(self):
+        """Khởi động thread nếu process hiện tại chưa có (gọi ở mỗi request, rất rẻ khi đã chạy)"""
+        if self.pid == os.getpid() or _settings['mode'] == 'off':
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.high = None
+            self.missing = {}
+            self.thread = threading.Thread(target=self.run, name='cache-invalidation', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        """Vòng lặp chính: theo dõi change stream hoặc poll, tự kết nối lại khi lỗi"""
+        while True:
+            try:
+                if resolve_mode() == 'off':
+                    # Bus bị tắt (init_app gọi lại với CACHE_BUS_MODE=off): dừng thread, ensure_started chạy lại sau
+                    self.pid = None
+                    return
+                if resolve_mode() == 'change_stream':
+                    self.watch()
+                else:
+                    self.poll_forever()
+            except OperationFailure as e:
+                # Change stream không dùng được (ví dụ thiếu quyền): chuyển sang poll
+                logger.warning("Change stream unavailable, polling cache_versions instead: %s", e)
+                _settings['resolved'] = 'poll'
+            except PyMongoError as e:
+                logger.warning("Cache invalidation bus error, retrying: %s", e)
+                time.sleep(_settings['poll_interval'])
+            # Có thể đã bỏ lỡ event trong lúc lỗi
+            reset_all()
+
+    def watch(self):
+        """Theo dõi change stream của database (insert/update/replace/delete trên WATCHED)"""
+        pipeline = [{'$match': {
+            'ns.coll': {'$in': list(WATCHED)},
+            'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}
+        }}]
+        with get_db().watch(pipeline, full_document='updateLookup') as stream:
+            for change in stream:
+                dispatch(change['ns']['coll'], change['documentKey']['_id'],
+                         change['operationType'], change.get('fullDocument'))
+
+    def poll_forever(self):
+        """Chế độ poll: đọc số thứ tự mỗi CACHE_BUS_POLL_INTERVAL giây"""
+        while resolve_mode() == 'poll':
+            self.poll_once()
+            time.sleep(_settings['poll_interval'])
+
+    def poll_once(self):
+        """
+        Đọc số thứ tự hiện tại; nếu tăng thì lấy các event mới theo số thứ tự
+        Số thứ tự được cấp trước khi event được ghi, nên số chưa thấy event được thử lại đến MISSING_TIMEOUT
+        """
+        db = get_db()
+        counter = db.cache_versions.find_one({'_id': SEQ_KEY})
+        seq = counter['seq'] if counter else 0
+        now = time.monotonic()
+        if self.high is None:
+            # Lần đầu: bỏ qua lịch sử, cache của process mới đang trống
+            self.high = seq
+            return
+        if seq - self.high > MAX_BACKLOG:
+            self.high = seq
+            self.missing = {}
+            reset_all()
+            return
+        for number in range(self.high + 1, seq + 1):
+            self.missing[number] = now
+        self.high = max(self.high, seq)
+        if not self.missing:
+            return
+        for event in db.cache_invalidations.find({'seq': {'$in': list(self.missing)}}).sort('seq', 1):
+            self.missing.pop(event['seq'], None)
+            dispatch(event['coll'], event['doc_id'], 'update', event.get('doc'))
+        for number, since in list(self.missing.items()):
+            if now - since > MISSING_TIMEOUT:
+                del self.missing[number]
+
+# Một bus cho mỗi process
+bus = InvalidationBus()
+
+def init_app(app, listen=True):
+    """
+    Đọc cấu hình CACHE_BUS_MODE / CACHE_BUS_POLL_INTERVAL
+    listen=True (web): thread nhận thay đổi được khởi động ở request đầu tiên của mỗi process,
+    nên vẫn đúng khi gunicorn preload rồi fork
+    """
+    _settings['mode'] = app.config.get('CACHE_BUS_MODE', 'auto')
+    _settings['poll_interval'] = app.config.get('CACHE_BUS_POLL_INTERVAL', 1.0)
+    _settings['resolved'] = None
+    if listen and _settings['mode'] != 'off':
+        app.before_request(bus.ensure_started)
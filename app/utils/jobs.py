@@ -0,0 +1,242 @@
+# Import các module chuẩn cho worker nhiều thread
+import logging
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+# Import ReturnDocument để lấy document sau khi cập nhật
+from pymongo import ReturnDocument, ASCENDING
+# Import current_app để đọc cấu hình hàng đợi
+from flask import current_app
+# Import get_db để lấy database instance
+from app.database import get_db
+
+logger = logging.getLogger(__name__)
+
+# Hàng đợi công việc nền lưu trong collection jobs:
+#   - enqueue() chỉ insert một document (request không phải chờ tác vụ phụ)
+#   - worker nhận job bằng find_one_and_update (lease), job bị giữ quá visibility timeout
+#     sẽ được worker khác nhận lại
+#   - job lỗi được thử lại với backoff, quá số lần thử thì chuyển sang collection jobs_dead
+
+# Registry tên job -> hàm xử lý, đăng ký bằng decorator @job_handler
+JOB_HANDLERS = {}
+
+def job_handler(name):
+    """Decorator đăng ký hàm xử lý cho một loại job"""
+    def decorator(f):
+        JOB_HANDLERS[name] = f
+        return f
+    return decorator
+
+def enqueue(name, payload=None, delay=0, max_attempts=None):
+    """
+    Thêm job vào hàng đợi
+    Tham số:
+        name (string) - Tên job đã đăng ký bằng @job_handler
+        payload (dict, optional) - Tham số truyền cho hàm xử lý (chỉ dùng kiểu dữ liệu BSON)
+        delay (int) - Số giây trì hoãn trước khi job được chạy
+        max_attempts (int, optional) - Số lần thử tối đa, mặc định lấy từ JOB_MAX_ATTEMPTS
+    Trả về: ID của job vừa tạo (None nếu chạy inline)
+    """
+    payload = payload or {}
+    # Khi phát triển không chạy worker.py: chạy job ngay trong request
+    if current_app.config.get('JOB_RUN_INLINE'):
+        _load_handlers()
+        JOB_HANDLERS[name](**payload)
+        return None
+
+    now = datetime.now()
+    result = get_db().jobs.insert_one({
+        'name': name,
+        'payload': payload,
+        'status': 'queued',
+        'attempts': 0,
+        'max_attempts': max_attempts or current_app.config.get('JOB_MAX_ATTEMPTS', 5),
+        'run_at': now + timedelta(seconds=delay),
+        'created_at': now
+    })
+    return result.inserted_id
+
+def enqueue_many(name, payloads, max_attempts=None):
+    """
+    Thêm nhiều job cùng loại bằng một lệnh insert_many
+    Tham số:
+        name (string) - Tên job đã đăng ký bằng @job_handler
+        payloads (list) - Danh sách payload, mỗi payload tạo một job
+        max_attempts (int, optional) - Số lần thử tối đa
+    Trả về: Số job đã thêm
+    """
+    if not payloads:
+        return 0
+    if current_app.config.get('JOB_RUN_INLINE'):
+        for payload in payloads:
+            enqueue(name, payload)
+        return len(payloads)
+
+    now = datetime.now()
+    max_attempts = max_attempts or current_app.config.get('JOB_MAX_ATTEMPTS', 5)
+    get_db().jobs.insert_many([{
+        'name': name,
+        'payload': payload,
+        'status': 'queued',
+        'attempts': 0,
+        'max_attempts': max_attempts,
+        'run_at': now,
+        'created_at': now
+    } for payload in payloads], ordered=False)
+    return len(payloads)
+
+def lease(worker_id, visibility_timeout):
+    """
+    Nhận một job sẵn sàng chạy: job đang chờ đã tới run_at, hoặc job đã hết hạn lease còn lượt thử
+    Job hết hạn lease đã dùng hết số lần thử (làm worker bị dừng mỗi lần chạy) được chuyển sang jobs_dead
+    Tham số:
+        worker_id (string) - Định danh worker (ghi vào job để tiện theo dõi)
+        visibility_timeout (int) - Số giây giữ job trước khi job được trả lại hàng đợi
+    Trả về: Document job đã nhận, None nếu hàng đợi trống
+    """
+    now = datetime.now()
+    expired = {'status': 'leased', 'lease_expires_at': {'$lte': now}}
+    _bury(dict(expired, **{'$expr': {'$gte': ['$attempts', '$max_attempts']}}),
+          'Lease expired after the last attempt (worker stopped while running the job)')
+    return get_db().jobs.find_one_and_update(
+        {'$or': [
+            {'status': 'queued', 'run_at': {'$lte': now}},
+            dict(expired, **{'$expr': {'$lt': ['$attempts', '$max_attempts']}})
+        ]},
+        {
+            '$set': {
+                'status': 'leased',
+                'leased_by': worker_id,
+                'lease_expires_at': now + timedelta(seconds=visibility_timeout)
+            },
+            '$inc': {'attempts': 1}
+        },
+        sort=[('run_at', ASCENDING)],
+        return_document=ReturnDocument.AFTER
+    )
+
+def complete(job):
+    """Đánh dấu job đã xong (được TTL index tự xóa sau một ngày)"""
+    get_db().jobs.update_one(
+        {'_id': job['_id'], 'leased_by': job['leased_by']},
+        {'$set': {'status': 'done', 'finished_at': datetime.now()},
+         '$unset': {'lease_expires_at': ''}}
+    )
+
+def fail(job, error):
+    """
+    Ghi nhận job lỗi: thử lại với backoff lũy thừa, hoặc chuyển sang jobs_dead khi hết số lần thử
+    Tham số:
+        job (dict) - Document job đang xử lý
+        error (string) - Thông tin lỗi
+    """
+    if job['attempts'] >= job.get('max_attempts', 5):
+        _bury({'_id': job['_id'], 'leased_by': job['leased_by']}, error)
+        return
+
+    backoff = min(2 ** job['attempts'], 300)
+    get_db().jobs.update_one(
+        {'_id': job['_id'], 'leased_by': job['leased_by']},
+        {'$set': {
+            'status': 'queued',
+            'run_at': datetime.now() + timedelta(seconds=backoff),
+            'last_error': error
+        }, '$unset': {'lease_expires_at': '', 'leased_by': ''}}
+    )
+
+def _bury(query, error):
+    """
+    Chuyển một job khớp query sang collection jobs_dead
+    Đánh dấu status 'dead' trước (chỉ một worker làm được, job đã bị worker khác nhận lại thì không khớp query),
+    rồi chép sang jobs_dead và xóa khỏi jobs
+    """
+    db = get_db()
+    job = db.jobs.find_one_and_update(
+        query,
+        {'$set': {'status': 'dead', 'last_error': error, 'failed_at': datetime.now()},
+         '$unset': {'lease_expires_at': ''}},
+        return_document=ReturnDocument.AFTER
+    )
+    if job is None:
+        return
+    logger.warning("Job %s (%s) moved to jobs_dead after %s attempt(s)", job['_id'], job['name'], job['attempts'])
+    db.jobs_dead.insert_one(job)
+    db.jobs.delete_one({'_id': job['_id']})
+
+def run_job(job):
+    """Chạy một job đã nhận và cập nhật trạng thái; trả về True nếu thành công"""
+    handler = JOB_HANDLERS.get(job['name'])
+    if handler is None:
+        fail(job, f"Unknown job: {job['name']}")
+        return False
+    try:
+        handler(**job.get('payload', {}))
+    except Exception:
+        fail(job, traceback.format_exc(limit=5))
+        return False
+    complete(job)
+    return True
+
+def run_worker(app, threads=None, stop_event=None, periodic=None):
+    """
+    Chạy worker xử lý hàng đợi với nhiều thread (chặn cho đến khi stop_event được set)
+    Tham số:
+        app (Flask) - Ứng dụng Flask (để đọc cấu hình và tạo app context cho mỗi thread)
+        threads (int, optional) - Số thread, mặc định JOB_WORKER_THREADS
+        stop_event (threading.Event, optional) - Event để dừng worker
+        periodic (list, optional) - Danh sách (hàm, chu kỳ giây) chạy định kỳ trong worker
+    """
+    _load_handlers()
+    threads = threads or app.config.get('JOB_WORKER_THREADS', 4)
+    visibility_timeout = app.config.get('JOB_VISIBILITY_TIMEOUT', 60)
+    poll_interval = app.config.get('JOB_POLL_INTERVAL', 1.0)
+    stop_event = stop_event or threading.Event()
+    base_id = f"{socket.gethostname()}:{threading.get_native_id()}"
+
+    def work(index):
+        worker_id = f"{base_id}:{index}"
+        with app.app_context():
+            while not stop_event.is_set():
+                try:
+                    job = lease(worker_id, visibility_timeout)
+                except Exception as e:
+                    logger.warning("Could not lease job: %s", e)
+                    job = None
+                if job is None:
+                    stop_event.wait(poll_interval)
+                    continue
+                run_job(job)
+
+    def tick():
+        last_run = {}
+        with app.app_context():
+            while not stop_event.is_set():
+                for func, interval in periodic or []:
+                    if time.monotonic() - last_run.get(func, 0) >= interval:
+                        last_run[func] = time.monotonic()
+                        try:
+                            func()
+                        except Exception as e:
+                            logger.exception("Periodic task %s failed: %s", func.__name__, e)
+                stop_event.wait(1)
+
+    workers = [threading.Thread(target=work, args=(i,), name=f'job-worker-{i}', daemon=True)
+               for i in range(threads)]
+    if periodic:
+        workers.append(threading.Thread(target=tick, name='job-periodic', daemon=True))
+    for t in workers:
+        t.start()
+    try:
+        while not stop_event.is_set():
+            stop_event.wait(1)
+    except KeyboardInterrupt:
+        stop_event.set()
+    for t in workers:
+        t.join(timeout=visibility_timeout)
+
+def _load_handlers():
+    """Import module chứa các hàm xử lý job để chúng được đăng ký vào JOB_HANDLERS"""
+    import app.utils.tasks  # noqa: F401
@@ -0,0 +1,172 @@
+# Cấu hình logging một lần khi tạo app: mọi logger ghi qua QueueHandler (chỉ đưa record vào hàng đợi),
+# một thread QueueListener định dạng và ghi ra stderr, nên thread xử lý request không bao giờ chờ I/O
+# Mỗi dòng log là một object JSON (hoặc text khi LOG_FORMAT=text) có request_id của request đang xử lý
+#
+# Log debug trên đường đi nóng được lấy mẫu theo request: LOG_DEBUG_SAMPLE_RATE phần request được chọn
+# và ghi đầy đủ log debug của request đó, các request khác không tạo record debug nào:
+#     if debug_sampled():
+#         logger.debug("cache miss", extra={'key': key})
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+# Import các đối tượng Flask để gắn request id vào request/response
+from flask import g, request
+
+# Request id của request đang xử lý và request có được chọn để ghi log debug không
+_request_id = ContextVar('request_id', default=None)
+_sampled = ContextVar('debug_sampled', default=False)
+# Request id nhận từ proxy (X-Request-ID) chỉ được dùng nếu đúng dạng này
+REQUEST_ID = re.compile(r'^[\w.-]{1,64}$')
+# Các thuộc tính có sẵn của LogRecord (phần còn lại là extra={...} do người gọi truyền vào)
+STANDARD_ATTRS = set(logging.LogRecord('', 0, '', 0, '', None, None).__dict__) | {'message', 'asctime'}
+
+_settings = {'sample_rate': 0.0}
+_state = {'handler': None, 'listener': None, 'outputs': None}
+
+class JsonFormatter(logging.Formatter):
+    """Định dạng record thành một dòng JSON: ts, level, logger, message, request_id, pid và các trường extra"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'pid': record.process,
+        }
+        for key, value in record.__dict__.items():
+            if key not in STANDARD_ATTRS and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class LocalQueueHandler(QueueHandler):
+    """
+    QueueHandler chỉ ghép message và traceback trên thread gọi log (args/exc_info có thể thay đổi sau đó),
+    việc định dạng JSON và ghi ra stream để cho thread QueueListener
+    """
+
+    def prepare(self, record):
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class ContextFilter(logging.Filter):
+    """
+    Chạy trên thread gọi log (trước khi record vào hàng đợi): gắn request_id,
+    bỏ record debug của request không được lấy mẫu
+    """
+
+    def __init__(self, level):
+        super().__init__()
+        self.level = level
+
+    def filter(self, record):
+        if record.levelno < self.level and not _sampled.get():
+            return False
+        record.request_id = _request_id.get()
+        return True
+
+def current_request_id():
+    """Request id của request đang xử lý (None ngoài request)"""
+    return _request_id.get()
+
+def debug_sampled():
+    """Request hiện tại được chọn để ghi log debug (dùng trước logger.debug trên đường đi nóng)"""
+    return _sampled.get()
+
+def start_request():
+    """before_request: lấy X-Request-ID từ proxy hoặc tạo mới, quyết định lấy mẫu log debug"""
+    incoming = request.headers.get('X-Request-ID', '')
+    request_id = incoming if REQUEST_ID.match(incoming) else uuid.uuid4().hex
+    rate = _settings['sample_rate']
+    g._log_tokens = (_request_id.set(request_id), _sampled.set(rate > 0 and random.random() < rate))
+
+def add_request_id(response):
+    """after_request: trả request id về cho client/proxy để đối chiếu log"""
+    request_id = _request_id.get()
+    if request_id:
+        response.headers['X-Request-ID'] = request_id
+    return response
+
+def finish_request(exc=None):
+    """teardown_request: xóa request id khỏi context của thread"""
+    tokens = g.pop('_log_tokens', None)
+    if tokens is not None:
+        _request_id.reset(tokens[0])
+        _sampled.reset(tokens[1])
+
+def _start_listener():
+    """Tạo hàng đợi và thread ghi log mới (lần đầu, và trong process con sau fork)"""
+    log_queue = queue.SimpleQueue()
+    _state['handler'].queue = log_queue
+    listener = QueueListener(log_queue, *_state['outputs'], respect_handler_level=True)
+    listener.start()
+    _state['listener'] = listener
+
+def _stop_listener():
+    """Ghi hết record còn trong hàng đợi khi process thoát"""
+    if _state['listener'] is not None:
+        _state['listener'].stop()
+        _state['listener'] = None
+
+def _after_fork():
+    # Thread ghi log không tồn tại trong process con
+    _state['listener'] = None
+    _start_listener()
+
+def init_app(app, web=True):
+    """
+    Cấu hình root logger (một lần mỗi process) theo LOG_LEVEL, LOG_FORMAT, LOG_DEBUG_SAMPLE_RATE
+    web=True: đăng ký request id cho mỗi request
+    """
+    level = logging.getLevelName(str(app.config.get('LOG_LEVEL', 'INFO')).upper())
+    if not isinstance(level, int):
+        level = logging.INFO
+    _settings['sample_rate'] = app.config.get('LOG_DEBUG_SAMPLE_RATE', 0.0)
+
+    if _state['handler'] is None:
+        output = logging.StreamHandler(sys.stderr)
+        if app.config.get('LOG_FORMAT', 'json') == 'json':
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(logging.Formatter(
+                '%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s'))
+        _state['outputs'] = (output,)
+        _state['handler'] = LocalQueueHandler(queue.SimpleQueue())
+        root = logging.getLogger()
+        # Thay handler mặc định (basicConfig, handler của Flask) bằng hàng đợi
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_state['handler'])
+        _start_listener()
+        atexit.register(_stop_listener)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=_after_fork)
+
+    _state['handler'].filters = [ContextFilter(level)]
+    logging.getLogger().setLevel(level)
+    # Log debug của code trong app (logger 'app.*') được tạo khi request được lấy mẫu;
+    # thư viện (pymongo, werkzeug) vẫn theo LOG_LEVEL
+    logging.getLogger('app').setLevel(logging.DEBUG if _settings['sample_rate'] > 0 else level)
+
+    if web:
+        app.before_request(start_request)
+        app.after_request(add_request_id)
+        app.teardown_request(finish_request)
@@ -0,0 +1,336 @@
+# Metrics dạng Prometheus: thời gian request theo endpoint, request đang xử lý, thời gian lệnh MongoDB,
+# pool kết nối MongoDB và hit/miss của các cache; xuất ở route /metrics
+#
+# Nhiều worker (gunicorn): đặt METRICS_MULTIPROC_DIR, mỗi process định kỳ ghi số liệu của mình ra
+# metrics-<pid>.json trong thư mục đó, /metrics cộng dồn tất cả file (counter/histogram của worker đã dừng
+# vẫn được cộng, gauge chỉ lấy từ process còn ghi file gần đây)
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+# Import monitoring để theo dõi pool kết nối MongoDB
+from pymongo import monitoring
+# Import các đối tượng Flask để đo request
+from flask import g, request
+# Import add_observer để nhận mọi lệnh MongoDB đã chạy xong
+from app.utils.query_stats import add_observer
+
+logger = logging.getLogger(__name__)
+
+# Mốc histogram (giây)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# Tên metric -> (loại, mô tả, mốc histogram)
+METRICS = {
+    'http_requests_total': ('counter', 'HTTP requests by endpoint, method and status', None),
+    'http_request_duration_seconds': ('histogram', 'HTTP request latency by endpoint', REQUEST_BUCKETS),
+    'http_requests_in_flight': ('gauge', 'HTTP requests currently being served', None),
+    'mongodb_commands_total': ('counter', 'MongoDB commands by collection, command and outcome', None),
+    'mongodb_command_duration_seconds': ('histogram', 'MongoDB command latency by collection and command',
+                                         MONGO_BUCKETS),
+    'mongodb_pool_connections': ('gauge', 'Open MongoDB connections per server', None),
+    'mongodb_pool_checked_out': ('gauge', 'MongoDB connections checked out per server', None),
+    'mongodb_pool_checkout_failures_total': ('counter', 'Failed MongoDB connection checkouts per server', None),
+    'cache_hits_total': ('counter', 'Cache hits by cache', None),
+    'cache_misses_total': ('counter', 'Cache misses by cache', None),
+    'cache_evictions_total': ('counter', 'Cache evictions by cache', None),
+    'cache_entries': ('gauge', 'Cache entries by cache', None),
+}
+
+class Registry:
+    """
+    Số liệu của một process; key là (tên metric, tuple nhãn)
+    Histogram lưu [số mẫu theo từng mốc, tổng]; số mẫu <= mốc được cộng dồn khi xuất
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.gauges = {}
+            self.histograms = {}
+
+    def inc(self, name, labels, amount=1):
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def add_gauge(self, name, labels, amount):
+        key = (name, labels)
+        with self._lock:
+            self.gauges[key] = self.gauges.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        index = bisect_left(buckets, value)
+        key = (name, labels)
+        with self._lock:
+            entry = self.histograms.get(key)
+            if entry is None:
+                entry = self.histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def request_finished(self, endpoint, method, status, duration):
+        """Ghi một request xong (một lần giữ lock thay vì ba: gauge, histogram, counter)"""
+        labels = (('endpoint', endpoint),)
+        index = bisect_left(REQUEST_BUCKETS, duration)
+        counter_key = ('http_requests_total', (('endpoint', endpoint), ('method', method), ('status', status)))
+        histogram_key = ('http_request_duration_seconds', labels)
+        gauge_key = ('http_requests_in_flight', labels)
+        with self._lock:
+            entry = self.histograms.get(histogram_key)
+            if entry is None:
+                entry = self.histograms[histogram_key] = [[0] * (len(REQUEST_BUCKETS) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += duration
+            self.counters[counter_key] = self.counters.get(counter_key, 0) + 1
+            self.gauges[gauge_key] = self.gauges.get(gauge_key, 0) - 1
+
+    def dump(self):
+        """Bản sao số liệu dạng JSON được (ghi file cho chế độ nhiều process)"""
+        with self._lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'gauges': [[name, labels, value] for (name, labels), value in self.gauges.items()],
+                'histograms': [[name, labels, counts[:], total]
+                               for (name, labels), (counts, total) in self.histograms.items()],
+            }
+
+registry = Registry()
+_state = {'pid': None, 'app': None, 'directory': None, 'interval': 5.0, 'thread': None}
+_lock = threading.Lock()
+
+def ensure_process():
+    """
+    Khởi động thread ghi file số liệu của process (chế độ nhiều process)
+    Gọi ở mỗi request, rất rẻ khi đã chạy; worker sau fork có pid mới nên tự khởi động thread của mình
+    """
+    if _state['pid'] == os.getpid():
+        return
+    with _lock:
+        if _state['pid'] == os.getpid():
+            return
+        _state['pid'] = os.getpid()
+        if _state['directory']:
+            thread = threading.Thread(target=_flush_forever, name='metrics-flush', daemon=True)
+            _state['thread'] = thread
+            thread.start()
+
+def _after_fork():
+    """Process con không thừa hưởng số liệu của process cha (tránh mỗi worker cộng lại một lần)"""
+    registry.reset()
+
+def start_request():
+    """before_request: ghi thời điểm bắt đầu, tăng số request đang xử lý"""
+    if _state['pid'] != os.getpid():
+        ensure_process()
+    endpoint = request.endpoint or 'unmatched'
+    g._metrics = (time.perf_counter(), endpoint, request.method)
+    registry.add_gauge('http_requests_in_flight', (('endpoint', endpoint),), 1)
+
+def finish_request(response):
+    """after_request: ghi thời gian và trạng thái của request"""
+    started = g.pop('_metrics', None)
+    if started is not None:
+        start, endpoint, method = started
+        registry.request_finished(endpoint, method, str(response.status_code), time.perf_counter() - start)
+    return response
+
+def observe_command(record):
+    """query_stats observer: thời gian lệnh MongoDB theo collection/lệnh"""
+    labels = (('collection', record.collection), ('command', record.name))
+    registry.observe('mongodb_command_duration_seconds', labels, record.duration_ms / 1000)
+    registry.inc('mongodb_commands_total', labels + (('outcome', 'ok' if record.ok else 'error'),))
+
+def _address(event):
+    host, port = event.address
+    return (('address', f"{host}:{port}"),)
+
+class PoolListener(monitoring.ConnectionPoolListener):
+    """Theo dõi số kết nối đang mở / đang được dùng trong pool của mỗi server MongoDB"""
+
+    def connection_created(self, event):
+        registry.add_gauge('mongodb_pool_connections', _address(event), 1)
+
+    def connection_closed(self, event):
+        registry.add_gauge('mongodb_pool_connections', _address(event), -1)
+
+    def connection_checked_out(self, event):
+        registry.add_gauge('mongodb_pool_checked_out', _address(event), 1)
+
+    def connection_checked_in(self, event):
+        registry.add_gauge('mongodb_pool_checked_out', _address(event), -1)
+
+    def connection_check_out_failed(self, event):
+        registry.inc('mongodb_pool_checkout_failures_total', _address(event))
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+def cache_samples():
+    """Số liệu các cache của process (đọc lúc xuất, không tốn gì trên đường đi của request)"""
+    from app.utils.doc_cache import catalog_cache
+    caches = {'catalog': catalog_cache.stats()}
+    app = _state['app']
+    if app is not None and app.extensions.get('fragment_cache') is not None:
+        caches['fragment'] = app.extensions['fragment_cache'].stats()
+    counters, gauges = [], []
+    for cache, stats in caches.items():
+        labels = [['cache', cache]]
+        counters.append(['cache_hits_total', labels, stats.get('hits', 0)])
+        counters.append(['cache_misses_total', labels, stats.get('misses', 0)])
+        counters.append(['cache_evictions_total', labels, stats.get('evictions', 0)])
+        gauges.append(['cache_entries', labels, stats.get('entries', 0)])
+    return counters, gauges
+
+def process_snapshot():
+    """Số liệu đầy đủ của process hiện tại (registry + cache)"""
+    data = registry.dump()
+    counters, gauges = cache_samples()
+    data['counters'].extend(counters)
+    data['gauges'].extend(gauges)
+    data['pid'] = os.getpid()
+    return data
+
+def write_process_file():
+    """Ghi số liệu của process ra METRICS_MULTIPROC_DIR (file tạm rồi os.replace)"""
+    directory = _state['directory']
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"metrics-{os.getpid()}.json")
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(process_snapshot(), f)
+    os.replace(tmp, path)
+
+def _flush_forever():
+    pid = os.getpid()
+    while _state['pid'] == pid:
+        try:
+            write_process_file()
+        except OSError as e:
+            logger.warning("Could not write metrics file: %s", e)
+        time.sleep(_state['interval'])
+
+def clear_directory(directory):
+    """Xóa file số liệu cũ (gọi khi khởi động server, trước khi fork worker)"""
+    if not directory or not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.startswith('metrics-') and name.endswith(('.json', '.tmp')):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+def collect():
+    """
+    Gộp số liệu: một process, hoặc mọi file trong METRICS_MULTIPROC_DIR
+    Trả về: List các snapshot (dict counters/gauges/histograms)
+    """
+    if not _state['directory']:
+        return [process_snapshot()]
+    write_process_file()
+    snapshots = []
+    live_after = time.time() - 3 * _state['interval']
+    for name in os.listdir(_state['directory']):
+        if not (name.startswith('metrics-') and name.endswith('.json')):
+            continue
+        path = os.path.join(_state['directory'], name)
+        try:
+            modified = os.path.getmtime(path)
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if modified < live_after:
+            # Process đã dừng: gauge (request đang xử lý, kết nối đang mở) không còn đúng
+            data['gauges'] = []
+        snapshots.append(data)
+    return snapshots
+
+def _label_text(labels, extra=None):
+    pairs = [tuple(pair) for pair in labels]
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+def render():
+    """Xuất số liệu theo định dạng text của Prometheus (version 0.0.4)"""
+    scalars = {}
+    histograms = {}
+    for snapshot in collect():
+        for kind in ('counters', 'gauges'):
+            for name, labels, value in snapshot[kind]:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                scalars[key] = scalars.get(key, 0) + value
+        for name, labels, counts, total in snapshot['histograms']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            entry = histograms.get(key)
+            if entry is None:
+                histograms[key] = [list(counts), total]
+            else:
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+
+    lines = []
+    for name, (kind, description, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == 'histogram':
+            for (metric, labels), (counts, total) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"{name}_bucket{_label_text(labels, ('le', le))} {cumulative}")
+                lines.append(f"{name}_sum{_label_text(labels)} {total}")
+                lines.append(f"{name}_count{_label_text(labels)} {cumulative}")
+        else:
+            for (metric, labels), value in sorted(scalars.items()):
+                if metric == name:
+                    lines.append(f"{name}{_label_text(labels)} {value}")
+    return '\n'.join(lines) + '\n'
+
+def init_app(app):
+    """
+    Đăng ký đo request và listener pool kết nối (gọi trước khi tạo MongoClient)
+    METRICS_MULTIPROC_DIR: thư mục dùng chung giữa các worker (để trống = chỉ số liệu của process phục vụ /metrics)
+    """
+    _state['app'] = app
+    _state['directory'] = app.config.get('METRICS_MULTIPROC_DIR') or None
+    _state['interval'] = app.config.get('METRICS_FLUSH_INTERVAL', 5.0)
+    if not _state.get('registered'):
+        _state['registered'] = True
+        monitoring.register(PoolListener())
+        add_observer(observe_command)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=_after_fork)
+    app.before_request(start_request)
+    app.after_request(finish_request)
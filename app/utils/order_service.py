@@ -0,0 +1,182 @@
+# Import logging để ghi lại tác vụ outbox bị lỗi
+import logging
+# Import datetime/timedelta để ghi thời gian và tính thời hạn xử lý outbox
+from datetime import datetime, timedelta
+# Import ObjectId để chuyển đổi string ID sang ObjectId
+from bson import ObjectId
+# Import ReturnDocument để lấy document sau khi cập nhật
+from pymongo import ReturnDocument
+# Import get_db để lấy database instance
+from app.database import get_db
+# Import enqueue để giao outbox cho worker (hàng đợi job, xem app/utils/jobs.py)
+from app.utils.jobs import enqueue
+# Import hàm cập nhật doanh thu
+from app.utils.revenue import calculate_and_update_revenue
+
+logger = logging.getLogger(__name__)
+
+# Phí ship cố định cho mỗi đơn hàng
+DELIVERY_FEE = 15000
+
+# Thời gian giữ một tác vụ outbox đã nhận trước khi coi như worker bị lỗi và trả lại hàng đợi
+# Tác vụ bị trả lại có thể chạy lần hai (worker chậm chứ chưa chết) nên mọi hàm trong OUTBOX_EFFECTS
+# phải chạy lại được: doanh thu cộng tối đa một lần mỗi đơn (revenue_credits), xóa giỏ hàng có điều kiện cart_updated_at
+OUTBOX_LEASE = timedelta(minutes=5)
+
+def _clear_cart(order):
+    """Xóa giỏ hàng đã lưu của khách (bỏ qua nếu khách đã cập nhật giỏ hàng sau khi đặt đơn)"""
+    get_db().users.update_one(
+        {
+            '_id': order['user_id'],
+            '$or': [
+                {'cart_updated_at': {'$lte': order['created_at']}},
+                {'cart_updated_at': {'$exists': False}}
+            ]
+        },
+        {'$set': {'cart': {}, 'cart_meta': {'rest_id': None, 'items': {}}, 'cart_updated_at': datetime.now()}}
+    )
+
+def _update_revenue(order):
+    """Cập nhật doanh thu admin/nhà hàng cho đơn hàng (chạy lại không cộng trùng, xem revenue._credit_once)"""
+    calculate_and_update_revenue(str(order['_id']), order)
+
+# Các tác vụ phụ có thể đặt trong outbox của đơn hàng: tên -> hàm xử lý nhận document order
+OUTBOX_EFFECTS = {
+    'revenue': _update_revenue,
+    'clear_cart': _clear_cart,
+}
+
+class OrderService:
+    """Class OrderService - Đặt đơn hàng bằng một lần ghi duy nhất, tác vụ phụ xử lý qua outbox"""
+
+    @staticmethod
+    def place(user_id, rest_id, items, delivery_address, payment_method, promotion_code=None):
+        """
+        Tạo đơn hàng kèm payment nhúng và outbox tác vụ phụ trong một lần insert
+        Tham số:
+            user_id (string) - ID của khách hàng
+            rest_id (string) - ID của nhà hàng
+            items (list) - Danh sách món [{menu_id, name, quantity, price}]
+            delivery_address (string) - Địa chỉ giao hàng
+            payment_method (string) - Phương thức thanh toán (hiện dùng cho 'cash')
+            promotion_code (string, optional) - Mã khuyến mãi
+        Trả về: ID của order vừa được tạo
+        """
+        now = datetime.now()
+        subtotal = sum(item['price'] * item['quantity'] for item in items)
+        total = subtotal + DELIVERY_FEE
+
+        order = {
+            'user_id': ObjectId(user_id),
+            'rest_id': ObjectId(rest_id),
+            'items': items,
+            'total': total,
+            'delivery_fee': DELIVERY_FEE,
+            'delivery_address': delivery_address,
+            'promotion_code': promotion_code if promotion_code else None,
+            'status': 'pending',
+            'shipper_id': None,
+            # Payment nhúng trong order: trang chi tiết đơn không cần đọc collection payments
+            'payment': {
+                'method': payment_method,
+                'amount': total,
+                'status': 'success',
+                'paid_at': now
+            },
+            # Outbox: các tác vụ phụ được ghi cùng lúc với đơn hàng nên không bị mất khi process lỗi
+            'outbox': ['revenue', 'clear_cart'],
+            'created_at': now
+        }
+        result = get_db().orders.insert_one(order)
+        return result.inserted_id
+
+    @staticmethod
+    def process_outbox(order_id):
+        """
+        Thực hiện các tác vụ phụ còn trong outbox của đơn hàng
+        Mỗi tác vụ được nhận bằng find_one_and_update nên hai worker không xử lý trùng
+        Tham số: order_id (string hoặc ObjectId) - ID của đơn hàng
+        Trả về: Số tác vụ đã xử lý
+        """
+        orders = get_db().orders
+        order_oid = ObjectId(order_id)
+        processed = 0
+
+        for effect, handler in OUTBOX_EFFECTS.items():
+            # Chuyển tác vụ từ outbox sang outbox_claims (kèm thời gian nhận)
+            order = orders.find_one_and_update(
+                {'_id': order_oid, 'outbox': effect},
+                {
+                    '$pull': {'outbox': effect},
+                    '$push': {'outbox_claims': {'effect': effect, 'at': datetime.now()}}
+                },
+                return_document=ReturnDocument.AFTER
+            )
+            if not order:
+                continue
+
+            try:
+                handler(order)
+            except Exception as e:
+                logger.warning("Outbox effect %s of order %s failed, returned to outbox: %s", effect, order_oid, e)
+                # Trả tác vụ lại outbox ngay để job chạy lại (với backoff) làm tiếp, không chờ hết OUTBOX_LEASE
+                orders.update_one(
+                    {'_id': order_oid},
+                    {'$pull': {'outbox_claims': {'effect': effect}}, '$addToSet': {'outbox': effect}}
+                )
+                raise
+
+            # Xử lý xong thì xóa claim
+            orders.update_one(
+                {'_id': order_oid},
+                {'$pull': {'outbox_claims': {'effect': effect}}}
+            )
+            processed += 1
+
+        return processed
+
+    @staticmethod
+    def dispatch(order_id):
+        """
+        Đưa job orders.outbox vào hàng đợi để worker xử lý outbox (request không phải chờ)
+        Dùng chung hàng đợi job với các tác vụ nền khác: lỗi được thử lại với backoff, quá số lần thì vào jobs_dead.
+        Nếu process dừng giữa lúc insert đơn hàng và enqueue, process_pending() trong worker.py sẽ xử lý lại
+        """
+        enqueue('orders.outbox', {'order_id': str(order_id)})
+
+    @staticmethod
+    def process_pending(limit=500, grace=timedelta(seconds=30)):
+        """
+        Quét và xử lý các đơn hàng còn tác vụ trong outbox (dùng cho script chạy định kỳ)
+        Tham số:
+            limit (int) - Số đơn hàng tối đa xử lý mỗi lần
+            grace (timedelta) - Bỏ qua đơn vừa tạo (job orders.outbox của đơn đang chờ worker)
+        Trả về: Số tác vụ đã xử lý
+        """
+        orders = get_db().orders
+        now = datetime.now()
+
+        # Trả lại hàng đợi các tác vụ đã nhận quá lâu (worker bị dừng giữa chừng)
+        stale_orders = orders.find(
+            {'outbox_claims.at': {'$lt': now - OUTBOX_LEASE}},
+            {'outbox_claims': 1}
+        )
+        for order in stale_orders:
+            for claim in order.get('outbox_claims', []):
+                if claim['at'] < now - OUTBOX_LEASE:
+                    orders.update_one(
+                        {'_id': order['_id']},
+                        {
+                            '$pull': {'outbox_claims': {'effect': claim['effect']}},
+                            '$addToSet': {'outbox': claim['effect']}
+                        }
+                    )
+
+        processed = 0
+        pending = orders.find(
+            {'outbox': {'$in': list(OUTBOX_EFFECTS)}, 'created_at': {'$lt': now - grace}},
+            {'_id': 1}
+        ).limit(limit)
+        for order in pending:
+            processed += OrderService.process_outbox(order['_id'])
+        return processed
@@ -0,0 +1,150 @@
+# Hash lại password dạng plain text của users bằng bcrypt: đọc user theo từng lô (_id tăng dần),
+# hash song song bằng process pool (bcrypt tốn CPU, thread bị GIL giới hạn), ghi mỗi lô bằng một lệnh bulk_write
+# và lưu _id cuối cùng đã xử lý vào collection migrations để chạy tiếp khi bị dừng giữa chừng
+import hashlib
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+# Import bcrypt trực tiếp (không qua flask_bcrypt) để hàm hash chạy được trong process con
+import bcrypt
+# Import UpdateOne để cập nhật hàng loạt bằng bulk_write
+from pymongo import ReturnDocument, UpdateOne
+# Import get_db để lấy database instance
+from app.database import get_db
+
+MIGRATION_ID = 'hash_passwords'
+# Password đã là bcrypt hash ($2a$, $2b$, $2y$) thì bỏ qua
+HASHED = re.compile(r'^\$2[aby]\$')
+# Số _id lỗi được lưu lại trong document migration để kiểm tra sau
+MAX_FAILED_IDS = 100
+
+def hash_settings(config):
+    """Tham số hash giống flask_bcrypt (BCRYPT_LOG_ROUNDS, BCRYPT_HASH_PREFIX, BCRYPT_HANDLE_LONG_PASSWORDS)"""
+    return {
+        'rounds': config.get('BCRYPT_LOG_ROUNDS', 12),
+        'prefix': config.get('BCRYPT_HASH_PREFIX', '2b'),
+        'handle_long': config.get('BCRYPT_HANDLE_LONG_PASSWORDS', False),
+    }
+
+def hash_chunk(passwords, settings):
+    """
+    Hash một nhóm password (chạy trong process con)
+    Trả về: List hash (string), hoặc Exception với password không hash được (ví dụ dài hơn 72 byte)
+    """
+    results = []
+    for password in passwords:
+        try:
+            value = password.encode('utf-8')
+            if settings['handle_long']:
+                value = hashlib.sha256(value).hexdigest().encode('utf-8')
+            salt = bcrypt.gensalt(rounds=settings['rounds'], prefix=settings['prefix'].encode('utf-8'))
+            results.append(bcrypt.hashpw(value, salt).decode('utf-8'))
+        except Exception as e:
+            results.append(e)
+    return results
+
+def load_checkpoint(db, restart=False):
+    """
+    Đọc trạng thái migration: chạy tiếp từ _id đã lưu nếu lần trước chưa xong, ngược lại bắt đầu lại
+    Trả về: Dictionary trạng thái (document trong collection migrations)
+    """
+    state = None if restart else db.migrations.find_one({'_id': MIGRATION_ID})
+    if state and not state.get('done'):
+        return state
+    state = {
+        '_id': MIGRATION_ID,
+        'last_id': None,
+        'done': False,
+        'hashed': 0,
+        'changed': 0,
+        'errors': 0,
+        'failed_ids': [],
+        'started_at': datetime.now(),
+        'updated_at': datetime.now(),
+    }
+    db.migrations.replace_one({'_id': MIGRATION_ID}, state, upsert=True)
+    return state
+
+def hash_passwords(config, batch_size=1000, workers=None, restart=False, limit=None, report=None):
+    """
+    Hash password plain text của mọi user, có thể dừng (Ctrl+C, mất kết nối) và chạy tiếp
+    Lô tiếp theo được đọc và hash trong khi lô trước đang ghi; mỗi UpdateOne có điều kiện password chưa đổi
+    nên không đè password user vừa đổi trong lúc migration chạy
+    Tham số:
+        config (dict) - Cấu hình Flask (tham số bcrypt)
+        batch_size (int) - Số user mỗi lô
+        workers (int, optional) - Số process hash, mặc định số CPU
+        restart (bool) - Bỏ qua checkpoint, quét lại từ đầu
+        limit (int, optional) - Số user tối đa xử lý trong lần chạy
+        report (callable, optional) - Hàm nhận trạng thái sau mỗi lô (in tiến độ)
+    Trả về: Dictionary thống kê của lần chạy (scanned, hashed, changed, errors, seconds, per_sec, resumed_from, done)
+    """
+    db = get_db()
+    settings = hash_settings(config)
+    workers = workers or os.cpu_count() or 1
+    state = load_checkpoint(db, restart)
+    stats = {'scanned': 0, 'hashed': 0, 'changed': 0, 'errors': 0, 'resumed_from': state['last_id']}
+    query = {'password': {'$type': 'string', '$ne': '', '$not': HASHED}}
+    start = time.perf_counter()
+
+    def fetch(after):
+        size = batch_size if limit is None else min(batch_size, limit - stats['scanned'])
+        if size <= 0:
+            return []
+        criteria = dict(query, _id={'$gt': after}) if after is not None else query
+        batch = list(db.users.find(criteria, {'password': 1}).sort('_id', 1).limit(size))
+        stats['scanned'] += len(batch)
+        return batch
+
+    def submit(pool, batch):
+        # Chia lô thành vài nhóm cho mỗi process: ít lần gửi/nhận giữa các process hơn từng password
+        size = max(1, -(-len(batch) // (workers * 2)))
+        passwords = [user['password'] for user in batch]
+        return [pool.submit(hash_chunk, passwords[i:i + size], settings) for i in range(0, len(batch), size)]
+
+    def write(batch, futures):
+        hashes = [value for future in futures for value in future.result()]
+        operations, failed = [], []
+        for user, hashed in zip(batch, hashes):
+            if isinstance(hashed, Exception):
+                failed.append(user['_id'])
+                continue
+            operations.append(UpdateOne({'_id': user['_id'], 'password': user['password']},
+                                        {'$set': {'password': hashed}}))
+        modified = db.users.bulk_write(operations, ordered=False).modified_count if operations else 0
+        stats['hashed'] += modified
+        stats['changed'] += len(operations) - modified
+        stats['errors'] += len(failed)
+        update = {
+            '$set': {'last_id': batch[-1]['_id'], 'updated_at': datetime.now()},
+            '$inc': {'hashed': modified, 'changed': len(operations) - modified, 'errors': len(failed)},
+        }
+        if failed:
+            update['$push'] = {'failed_ids': {'$each': failed, '$slice': -MAX_FAILED_IDS}}
+        return db.migrations.find_one_and_update({'_id': MIGRATION_ID}, update,
+                                                 projection={'failed_ids': 0},
+                                                 return_document=ReturnDocument.AFTER)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        batch = fetch(state['last_id'])
+        futures = submit(pool, batch)
+        while batch:
+            # Đọc và bắt đầu hash lô sau trước khi chờ kết quả lô hiện tại
+            next_batch = fetch(batch[-1]['_id'])
+            next_futures = submit(pool, next_batch)
+            checkpoint = write(batch, futures)
+            if report:
+                elapsed = time.perf_counter() - start
+                processed = stats['hashed'] + stats['changed'] + stats['errors']
+                report(dict(checkpoint, per_sec=round(processed / elapsed) if elapsed > 0 else 0))
+            batch, futures = next_batch, next_futures
+
+    stats['done'] = limit is None or stats['scanned'] < limit
+    if stats['done']:
+        db.migrations.update_one({'_id': MIGRATION_ID},
+                                 {'$set': {'done': True, 'finished_at': datetime.now()}})
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    stats['per_sec'] = round(stats['scanned'] / stats['seconds']) if stats['seconds'] > 0 else stats['scanned']
+    return stats
@@ -0,0 +1,216 @@
+# Profile một request trên production: admin thêm ?_profile=1 (cProfile, ra file .pstats) hoặc
+# ?_profile=sample (lấy mẫu stack mỗi PROFILE_SAMPLE_INTERVAL giây, ra file .folded cho flamegraph/speedscope),
+# hoặc gửi header X-Profile với cùng giá trị. Kết quả lưu trong PROFILE_DIR, xem ở /admin/profiles
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+# Import các đối tượng Flask để đọc cờ và gắn profiler vào request
+from flask import current_app, g, request, session
+# Import User để kiểm tra quyền admin (giống role_required('admin'))
+from app.models import User
+# Import current_stats để lưu kèm số lệnh MongoDB của request
+from app.utils.query_stats import current_stats
+
+# Giá trị cờ -> chế độ
+MODES = {'1': 'cprofile', 'cprofile': 'cprofile', 'sample': 'sample'}
+EXTENSIONS = {'cprofile': '.pstats', 'sample': '.folded'}
+PROFILE_ID = re.compile(r'^[\w-]+$')
+# Mỗi process chỉ profile một request tại một thời điểm (cProfile không chạy song song được từ Python 3.12)
+_busy = threading.Lock()
+
+def requested_mode():
+    """Chế độ profile mà request yêu cầu (query ?_profile= hoặc header X-Profile), None nếu không có"""
+    flag = request.args.get('_profile') or request.headers.get('X-Profile')
+    return MODES.get(flag) if flag else None
+
+def is_admin():
+    """Người dùng hiện tại là admin (đọc lại từ database như role_required)"""
+    if 'user_id' not in session:
+        return False
+    user = User.find_by_id(session['user_id'])
+    return bool(user) and user.get('role') == 'admin'
+
+class StackSampler:
+    """Thread lấy mẫu stack của một thread khác theo chu kỳ; kết quả là các stack dạng folded và số lần gặp"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+
+    def folded(self):
+        """Định dạng folded (mỗi dòng: stack số_mẫu), đọc được bằng flamegraph.pl và speedscope"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+def start_profile():
+    """before_request: bắt đầu profile nếu admin yêu cầu"""
+    mode = requested_mode()
+    if mode is None or not is_admin() or not _busy.acquire(blocking=False):
+        return
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        profiler = StackSampler(threading.get_ident(), current_app.config.get('PROFILE_SAMPLE_INTERVAL', 0.001))
+        profiler.start()
+    g._profile = (mode, profiler, time.perf_counter())
+
+def _stop(profile):
+    mode, profiler, _ = profile
+    if mode == 'cprofile':
+        profiler.disable()
+    else:
+        profiler.stop()
+
+def finish_profile(response):
+    """after_request: dừng profile, lưu kết quả và trả về ID trong header X-Profile-Id"""
+    profile = g.pop('_profile', None)
+    if profile is None:
+        return response
+    try:
+        _stop(profile)
+        mode, profiler, start = profile
+        profile_id = save_profile(mode, profiler, (time.perf_counter() - start) * 1000, response.status_code)
+        response.headers['X-Profile-Id'] = profile_id
+    finally:
+        _busy.release()
+    return response
+
+def abandon_profile(exc=None):
+    """teardown_request: request lỗi trước after_request thì chỉ dừng profiler"""
+    profile = g.pop('_profile', None)
+    if profile is not None:
+        _stop(profile)
+        _busy.release()
+
+def profile_dir():
+    """Thư mục lưu profile (PROFILE_DIR)"""
+    return current_app.config['PROFILE_DIR']
+
+def save_profile(mode, profiler, duration_ms, status):
+    """
+    Ghi kết quả profile và file .json mô tả request vào PROFILE_DIR, xóa bản cũ quá PROFILE_KEEP
+    Trả về: ID của profile (tên file không có phần mở rộng)
+    """
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    endpoint = request.endpoint or 'unmatched'
+    profile_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{os.getpid()}-{endpoint.replace('.', '_')}"
+    path = os.path.join(directory, profile_id + EXTENSIONS[mode])
+    if mode == 'cprofile':
+        profiler.dump_stats(path)
+    else:
+        with open(path, 'w') as f:
+            f.write(profiler.folded())
+    stats = current_stats()
+    meta = {
+        'id': profile_id,
+        'mode': mode,
+        'endpoint': endpoint,
+        'path': request.full_path.rstrip('?'),
+        'method': request.method,
+        'status': status,
+        'duration_ms': round(duration_ms, 3),
+        'mongo_commands': stats.count if stats is not None else None,
+        'mongo_ms': round(stats.total_ms, 3) if stats is not None else None,
+        'user': session.get('user_name'),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    with open(os.path.join(directory, profile_id + '.json'), 'w') as f:
+        json.dump(meta, f)
+    prune(directory, current_app.config.get('PROFILE_KEEP', 50))
+    return profile_id
+
+def prune(directory, keep):
+    """Chỉ giữ keep profile mới nhất"""
+    for meta in list_profiles(directory)[keep:]:
+        for extension in ('.json',) + tuple(EXTENSIONS.values()):
+            try:
+                os.remove(os.path.join(directory, meta['id'] + extension))
+            except OSError:
+                pass
+
+def list_profiles(directory=None):
+    """Danh sách mô tả các profile đã lưu, mới nhất trước"""
+    directory = directory or profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in os.listdir(directory):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    # ID bắt đầu bằng thời điểm tạo (đến micro giây)
+    profiles.sort(key=lambda meta: meta.get('id', ''), reverse=True)
+    return profiles
+
+def load_profile(profile_id):
+    """
+    Đọc một profile
+    Trả về: Tuple (mô tả, đường dẫn file kết quả, nội dung tóm tắt dạng text), None nếu không có
+    """
+    if not PROFILE_ID.match(profile_id or ''):
+        return None
+    directory = profile_dir()
+    try:
+        with open(os.path.join(directory, profile_id + '.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    path = os.path.join(directory, profile_id + EXTENSIONS.get(meta.get('mode'), '.pstats'))
+    if not os.path.exists(path):
+        return None
+    if meta['mode'] == 'cprofile':
+        output = io.StringIO()
+        stats = pstats.Stats(path, stream=output)
+        stats.strip_dirs().sort_stats('cumulative').print_stats(60)
+        summary = output.getvalue()
+    else:
+        # Thời gian riêng của từng hàm: số mẫu có hàm đó ở đỉnh stack
+        own = Counter()
+        with open(path) as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                own[stack.rsplit(';', 1)[-1]] += int(count)
+        total = sum(own.values()) or 1
+        summary = ''.join(f"{count:>7} {count * 100 / total:6.1f}%  {name}\n" for name, count in own.most_common(60))
+    return meta, path, summary
+
+def init_app(app):
+    """Đăng ký hook profile (chỉ tốn một lần đọc query/header khi không bật)"""
+    app.before_request(start_profile)
+    app.after_request(finish_profile)
+    app.teardown_request(abandon_profile)
@@ -0,0 +1,212 @@
+# Đếm lệnh MongoDB theo request: số lệnh, tổng thời gian, các lệnh cùng dạng lặp lại (N+1)
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+# Import bson để đo kích thước kết quả trả về (chỉ khi được yêu cầu)
+import bson
+# Import monitoring để đăng ký CommandListener với mọi MongoClient
+from pymongo import monitoring
+# Import các đối tượng Flask để gắn thống kê vào request
+from flask import current_app, g, request
+
+# Thống kê đang nhận lệnh trong context hiện tại (request, hoặc khối capture_queries)
+_current = ContextVar('query_stats', default=None)
+# Các hàm nhận từng lệnh đã chạy xong (metrics, slow query log...): observer(CommandRecord)
+_observers = []
+_registered = {'listener': None}
+
+def shape_of(value):
+    """
+    Dạng của filter: giữ tên trường và toán tử, thay giá trị bằng '?'
+    Ví dụ {'_id': ObjectId(...), 'status': {'$in': [...]}} -> {_id:?,status:{$in:?}}
+    """
+    if isinstance(value, dict):
+        return '{' + ','.join(f"{key}:{shape_of(item)}" for key, item in value.items()) + '}'
+    if isinstance(value, (list, tuple)) and value and all(isinstance(item, dict) for item in value):
+        return '[' + ','.join(shape_of(item) for item in value) + ']'
+    return '?'
+
+def command_filter(name, command):
+    """Lấy filter của lệnh (find, update, delete, count, aggregate...) để tính dạng truy vấn"""
+    if 'filter' in command:
+        return command['filter']
+    if name in ('update', 'delete'):
+        statements = command.get('updates' if name == 'update' else 'deletes') or []
+        return statements[0].get('q', {}) if statements else {}
+    if name == 'findAndModify':
+        return command.get('query', {})
+    if name == 'count':
+        return command.get('query', {})
+    if name == 'aggregate':
+        for stage in command.get('pipeline', []):
+            if '$match' in stage:
+                return stage['$match']
+        return {}
+    return None
+
+class CommandRecord:
+    """Một lệnh MongoDB đã chạy xong"""
+    __slots__ = ('name', 'collection', 'shape', 'duration_ms', 'ok', 'command', 'endpoint', 'database')
+
+    def __init__(self, name, collection, shape, duration_ms, ok, command, endpoint, database):
+        self.name = name
+        self.collection = collection
+        self.shape = shape
+        self.duration_ms = duration_ms
+        self.ok = ok
+        self.command = command
+        self.endpoint = endpoint
+        self.database = database
+
+class RequestStats:
+    """Thống kê lệnh MongoDB của một request (hoặc một khối capture_queries)"""
+
+    def __init__(self, endpoint=None, measure_bytes=False):
+        self.endpoint = endpoint
+        self.count = 0
+        self.total_ms = 0.0
+        # Tổng kích thước BSON của các reply; chỉ đo khi measure_bytes (encode lại reply tốn CPU)
+        self.measure_bytes = measure_bytes
+        self.bytes = 0
+        self.shapes = Counter()
+        self.commands = []
+
+    def add(self, record):
+        self.count += 1
+        self.total_ms += record.duration_ms
+        self.shapes[record.shape] += 1
+        self.commands.append((record.shape, record.duration_ms))
+
+    def merge(self, other):
+        """Cộng thống kê của request con vào (capture_queries bao quanh nhiều request)"""
+        self.count += other.count
+        self.total_ms += other.total_ms
+        self.bytes += other.bytes
+        self.shapes.update(other.shapes)
+        self.commands.extend(other.commands)
+
+    def repeated(self, threshold):
+        """
+        Các dạng lệnh chạy nhiều hơn threshold lần (dấu hiệu N+1: find_by_id trong vòng lặp)
+        Trả về: List (dạng lệnh, số lần), nhiều nhất trước
+        """
+        return [(shape, n) for shape, n in self.shapes.most_common() if n > threshold]
+
+class QueryListener(monitoring.CommandListener):
+    """
+    Nhận sự kiện lệnh từ pymongo (chạy trên thread gửi lệnh) và ghi vào thống kê của context hiện tại
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        name = event.command_name
+        command = event.command
+        collection = command.get(name)
+        if not isinstance(collection, str):
+            collection = ''
+        query = command_filter(name, command)
+        shape = f"{name} {collection} {shape_of(query)}" if query is not None else f"{name} {collection}".rstrip()
+        with self._lock:
+            self._pending[(event.request_id, event.connection_id)] = (name, collection, shape, command,
+                                                                      event.database_name)
+
+    def succeeded(self, event):
+        self._finish(event, True)
+
+    def failed(self, event):
+        self._finish(event, False)
+
+    def _finish(self, event, ok):
+        with self._lock:
+            started = self._pending.pop((event.request_id, event.connection_id), None)
+        if started is None:
+            return
+        name, collection, shape, command, database = started
+        stats = _current.get()
+        record = CommandRecord(name, collection, shape, event.duration_micros / 1000, ok, command,
+                               stats.endpoint if stats is not None else None, database)
+        if stats is not None:
+            stats.add(record)
+            if ok and stats.measure_bytes:
+                stats.bytes += len(bson.encode(event.reply))
+        for observer in _observers:
+            try:
+                observer(record)
+            except Exception:
+                pass
+
+def add_observer(observer):
+    """Đăng ký hàm nhận mọi lệnh đã chạy xong (dùng cho metrics, slow query log)"""
+    _observers.append(observer)
+
+def current_stats():
+    """Thống kê của request / khối capture_queries hiện tại, None nếu không có"""
+    return _current.get()
+
+@contextmanager
+def capture_queries(label='capture', measure_bytes=False):
+    """
+    Đếm lệnh MongoDB trong khối with (gồm cả các request qua test_client), dùng để kiểm tra số truy vấn:
+        with capture_queries(measure_bytes=True) as stats:
+            client.get('/')
+        assert stats.count <= 5 and not stats.repeated(3) and stats.bytes < 100_000
+    """
+    stats = RequestStats(label, measure_bytes)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+def start_request_stats():
+    """before_request: bắt đầu đếm lệnh cho request"""
+    parent = _current.get()
+    g._query_stats_token = _current.set(RequestStats(request.endpoint, parent is not None and parent.measure_bytes))
+
+def add_server_timing(response):
+    """after_request: ghi thống kê vào header Server-Timing (khi debug hoặc QUERY_STATS_HEADER) và cảnh báo N+1"""
+    stats = _current.get()
+    if stats is None:
+        return response
+    threshold = current_app.config.get('QUERY_N_PLUS_ONE_THRESHOLD', 5)
+    repeated = stats.repeated(threshold)
+    if repeated:
+        current_app.logger.warning("N+1 queries on %s: %s", request.endpoint,
+                                   '; '.join(f"{shape} x{n}" for shape, n in repeated[:3]))
+    if current_app.debug or current_app.config.get('QUERY_STATS_HEADER'):
+        timing = [f'mongo;dur={stats.total_ms:.1f};desc="{stats.count} commands"']
+        for index, (shape, n) in enumerate(repeated[:3]):
+            shape = shape.replace('"', "'")
+            timing.append(f'mongo-repeat-{index};desc="{shape} x{n}"')
+        response.headers.add('Server-Timing', ', '.join(timing))
+    return response
+
+def finish_request_stats(exc=None):
+    """teardown_request: kết thúc đếm, cộng vào khối capture_queries bao ngoài (nếu có)"""
+    token = g.pop('_query_stats_token', None)
+    if token is None:
+        return
+    stats = _current.get()
+    _current.reset(token)
+    parent = _current.get()
+    if parent is not None and stats is not None:
+        parent.merge(stats)
+
+def register_listener():
+    """Đăng ký listener với pymongo (một lần mỗi process, trước khi tạo MongoClient)"""
+    if _registered['listener'] is None:
+        _registered['listener'] = QueryListener()
+        monitoring.register(_registered['listener'])
+    return _registered['listener']
+
+def init_app(app, web=True):
+    """Đăng ký listener; với web: đếm theo request và thêm header Server-Timing"""
+    register_listener()
+    if web:
+        app.before_request(start_request_stats)
+        app.after_request(add_server_timing)
+        app.teardown_request(finish_request_stats)
@@ -0,0 +1,244 @@
+# Đối soát các payment VnPay bị kẹt ở trạng thái pending (không nhận được return/IPN)
+import hmac
+import http.client
+import json
+import logging
+import threading
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import islice
+# Import UpdateOne để cập nhật hàng loạt bằng bulk_write
+from pymongo import UpdateOne
+# Import get_db để lấy database instance
+from app.database import get_db
+# Import enqueue_many để đưa job cập nhật doanh thu vào hàng đợi
+from app.utils.jobs import enqueue_many
+# Import VnPaySigner để dùng lại khóa HMAC đã chuẩn bị
+from app.utils.vnpay import VnPaySigner
+
+logger = logging.getLogger(__name__)
+
+class VnPayQueryClient:
+    """
+    Client truy vấn kết quả giao dịch VnPay (API querydr)
+    Tài liệu: https://sandbox.vnpayment.vn/apis/docs/truy-van-hoan-tien/querydr&refund.html
+    Mỗi thread giữ một kết nối keep-alive riêng để truy vấn hàng chục nghìn giao dịch không phải bắt tay lại
+    """
+
+    def __init__(self, api_url, tmn_code, hash_secret, timeout=10):
+        self.api_url = api_url
+        self.tmn_code = tmn_code
+        self.signer = VnPaySigner(hash_secret)
+        self.timeout = timeout
+        parsed = urllib.parse.urlsplit(api_url)
+        self._scheme = parsed.scheme
+        self._netloc = parsed.netloc
+        self._path = parsed.path or '/'
+        self._local = threading.local()
+
+    @classmethod
+    def from_config(cls, config):
+        """Tạo client từ cấu hình Flask (app.config)"""
+        return cls(config['VNPAY_API_URL'], config['VNPAY_TMN_CODE'], config['VNPAY_HASH_SECRET'])
+
+    def _sign(self, *fields):
+        """Chữ ký HMAC SHA512 của các trường nối bằng dấu | (theo tài liệu querydr)"""
+        return self.signer.digest('|'.join(str(f) for f in fields))
+
+    def _connection(self):
+        """Lấy kết nối HTTP của thread hiện tại (tạo mới nếu chưa có)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn_class = http.client.HTTPSConnection if self._scheme == 'https' else http.client.HTTPConnection
+            conn = conn_class(self._netloc, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _post(self, body):
+        """Gửi POST JSON, thử lại một lần nếu kết nối keep-alive đã bị server đóng"""
+        payload = json.dumps(body).encode('utf-8')
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request('POST', self._path, body=payload, headers={'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                return json.loads(response.read())
+            except (http.client.HTTPException, ConnectionError):
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+
+    def query(self, payment):
+        """
+        Truy vấn trạng thái một giao dịch
+        Tham số: payment (dict) - Document payment (cần txn_ref, vnp_create_date hoặc created_at)
+        Trả về: Dict {'txn_ref', 'response_code', 'transaction_status', 'transaction_no', 'amount', 'bank_code'}
+        """
+        request_id = uuid.uuid4().hex
+        create_date = datetime.now().strftime('%Y%m%d%H%M%S')
+        transaction_date = payment.get('vnp_create_date') or payment['created_at'].strftime('%Y%m%d%H%M%S')
+        txn_ref = payment['txn_ref']
+        order_info = f"Doi soat {txn_ref}"
+        ip_addr = '127.0.0.1'
+        body = {
+            'vnp_RequestId': request_id,
+            'vnp_Version': '2.1.0',
+            'vnp_Command': 'querydr',
+            'vnp_TmnCode': self.tmn_code,
+            'vnp_TxnRef': txn_ref,
+            'vnp_OrderInfo': order_info,
+            'vnp_TransactionDate': transaction_date,
+            'vnp_CreateDate': create_date,
+            'vnp_IpAddr': ip_addr,
+        }
+        body['vnp_SecureHash'] = self._sign(request_id, '2.1.0', 'querydr', self.tmn_code, txn_ref,
+                                            transaction_date, create_date, ip_addr, order_info)
+        data = self._post(body)
+
+        # Kiểm tra chữ ký của response
+        expected = self._sign(*(data.get(k, '') for k in (
+            'vnp_ResponseId', 'vnp_Command', 'vnp_ResponseCode', 'vnp_Message', 'vnp_TmnCode', 'vnp_TxnRef',
+            'vnp_Amount', 'vnp_BankCode', 'vnp_PayDate', 'vnp_TransactionNo', 'vnp_TransactionType',
+            'vnp_TransactionStatus', 'vnp_OrderInfo', 'vnp_PromotionCode', 'vnp_PromotionAmount')))
+        if not hmac.compare_digest(str(data.get('vnp_SecureHash', '')).lower(), expected):
+            raise ValueError(f"Invalid querydr signature for {txn_ref}")
+
+        return {
+            'txn_ref': txn_ref,
+            'response_code': data.get('vnp_ResponseCode'),
+            'transaction_status': data.get('vnp_TransactionStatus'),
+            'transaction_no': data.get('vnp_TransactionNo'),
+            'amount': int(data['vnp_Amount']) / 100 if data.get('vnp_Amount') else None,
+            'bank_code': data.get('vnp_BankCode'),
+        }
+
+# Các cổng thanh toán có thể đối soát: method của payment -> class client
+GATEWAY_CLIENTS = {
+    'vnpay': VnPayQueryClient,
+}
+
+def decide(payment, result, expire_before):
+    """
+    Quyết định trạng thái mới của payment từ kết quả truy vấn
+    Tham số:
+        payment (dict) - Document payment
+        result (dict) - Kết quả từ client.query()
+        expire_before (datetime) - Payment tạo trước mốc này mà vẫn chưa thanh toán thì coi là thất bại
+    Trả về: 'success', 'failed', 'review' (cần kiểm tra thủ công) hoặc None (giữ nguyên pending)
+    """
+    if result['response_code'] == '00':
+        if result['transaction_status'] == '00':
+            # Khách đã bị trừ tiền nhưng số tiền không khớp payment: không tự đánh dấu success/failed
+            if result['amount'] is not None and result['amount'] != payment.get('amount'):
+                return 'review'
+            return 'success'
+        if result['transaction_status'] == '01':
+            # Giao dịch chưa hoàn tất: chờ đến khi quá hạn
+            return 'failed' if payment['created_at'] < expire_before else None
+        return 'failed'
+    if result['response_code'] == '91':
+        # Không tìm thấy giao dịch: khách chưa thanh toán
+        return 'failed' if payment['created_at'] < expire_before else None
+    # Lỗi khác (sai chữ ký, hệ thống bận...): để lần đối soát sau xử lý
+    return None
+
+def reconcile_pending(config, older_than_minutes=15, expire_after_minutes=60, workers=16,
+                      batch_size=500, method='vnpay', client=None, limit=None):
+    """
+    Đối soát payment pending quá older_than_minutes phút
+    Đọc payment bằng cursor theo từng lô, truy vấn song song bằng thread pool giới hạn,
+    áp dụng kết quả mỗi lô bằng một lệnh bulk_write (điều kiện status = pending nên không đè kết quả IPN)
+    Tham số:
+        config (dict) - Cấu hình Flask (dùng để tạo client nếu không truyền client)
+        older_than_minutes (int) - Chỉ đối soát payment tạo trước số phút này
+        expire_after_minutes (int) - Payment chưa thanh toán quá số phút này thì đánh dấu failed
+        workers (int) - Số thread truy vấn cổng thanh toán đồng thời
+        batch_size (int) - Số payment mỗi lô
+        method (string) - Phương thức thanh toán cần đối soát
+        client (object, optional) - Client có hàm query(payment), mặc định lấy từ GATEWAY_CLIENTS
+        limit (int, optional) - Số payment tối đa xử lý trong lần chạy
+    Trả về: Dictionary thống kê
+    """
+    db = get_db()
+    client = client or GATEWAY_CLIENTS[method].from_config(config)
+    now = datetime.now()
+    expire_before = now - timedelta(minutes=expire_after_minutes)
+    stats = {'scanned': 0, 'success': 0, 'failed': 0, 'review': 0, 'unchanged': 0, 'errors': 0, 'modified': 0}
+
+    cursor = db.payments.find(
+        {
+            'status': 'pending',
+            'created_at': {'$lt': now - timedelta(minutes=older_than_minutes)},
+            'method': method,
+            'txn_ref': {'$type': 'string'},
+            # Payment đã chờ kiểm tra thủ công thì không truy vấn lại
+            'needs_review': {'$ne': True}
+        },
+        {'txn_ref': 1, 'order_id': 1, 'amount': 1, 'created_at': 1, 'vnp_create_date': 1}
+    ).sort('created_at', 1).batch_size(batch_size)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    def safe_query(payment):
+        try:
+            return payment, client.query(payment)
+        except Exception as e:
+            return payment, e
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            batch = list(islice(cursor, batch_size))
+            if not batch:
+                break
+            stats['scanned'] += len(batch)
+
+            operations = []
+            order_ids = []
+            paid_orders = []
+            for payment, result in pool.map(safe_query, batch):
+                if isinstance(result, Exception):
+                    stats['errors'] += 1
+                    continue
+                new_status = decide(payment, result, expire_before)
+                if new_status is None:
+                    stats['unchanged'] += 1
+                    continue
+                stats[new_status] += 1
+                if new_status == 'review':
+                    # Giữ pending, lưu số tiền cổng thanh toán báo về để admin đối chiếu
+                    logger.warning("Payment amount mismatch, needs review", extra={
+                        'txn_ref': payment['txn_ref'], 'amount': payment.get('amount'),
+                        'gateway_amount': result['amount']})
+                    operations.append(UpdateOne({'_id': payment['_id'], 'status': 'pending'}, {'$set': {
+                        'needs_review': True,
+                        'review_reason': 'amount_mismatch',
+                        'gateway_amount': result['amount'],
+                        'transaction_id': result['transaction_no'],
+                        'bank_code': result['bank_code'],
+                        'reconciled_at': now
+                    }}))
+                    continue
+                update = {
+                    'status': new_status,
+                    'transaction_id': result['transaction_no'],
+                    'bank_code': result['bank_code'],
+                    'reconciled_at': now,
+                    'updated_at': now
+                }
+                if new_status == 'success':
+                    update['paid_at'] = now
+                    paid_orders.append({'order_id': str(payment['order_id'])})
+                operations.append(UpdateOne({'_id': payment['_id'], 'status': 'pending'}, {'$set': update}))
+                order_ids.append(payment['order_id'])
+
+            if operations:
+                stats['modified'] += db.payments.bulk_write(operations, ordered=False).modified_count
+                # Trang chi tiết đơn hàng dùng orders.updated_at làm ETag
+                db.orders.update_many({'_id': {'$in': order_ids}}, {'$set': {'updated_at': now}})
+            # Doanh thu được tính idempotent theo đơn hàng nên enqueue trùng với IPN cũng không sao
+            enqueue_many('revenue.update', paid_orders)
+
+    return stats
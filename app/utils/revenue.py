@@ -1,21 +1,82 @@
-# Import datetime để lấy thời gian hiện tại
-from datetime import datetime
+# Import datetime/timedelta để lấy thời gian hiện tại và tính thời hạn giữ một lần cộng tiền
+from datetime import datetime, timedelta
 # Import ObjectId để chuyển đổi string ID sang ObjectId
 from bson import ObjectId
+# Import DuplicateKeyError: đơn hàng đã có bản ghi cộng tiền cho user này
+from pymongo.errors import DuplicateKeyError
 # Import get_db để lấy database instance
 from app.database import get_db
 # Import User và Order models
 from app.models import User, Order
 
-def calculate_and_update_revenue(order_id):
+# Mỗi lần cộng tiền cho một user của một đơn là một document trong collection revenue_credits
+# (index unique order_id + user_id): job chạy lại sau lỗi, dù cách bao lâu, không cộng hai lần.
+# Trên user chỉ giữ pending_credits - các lần cộng đang dở (thường rỗng) - để lần chạy lại biết $inc đã ghi chưa.
+# Thời gian giữ một bản ghi đang cộng dở trước khi worker khác được làm tiếp (lớn hơn JOB_VISIBILITY_TIMEOUT)
+CREDIT_CLAIM = timedelta(minutes=5)
+
+class CreditInProgress(Exception):
+    """Worker khác đang cộng tiền cho đơn này: job lỗi và được thử lại sau (xem app/utils/jobs.py)"""
+
+def _credit_once(user_id, order_id, inc, now=None):
+    """
+    Cộng các trường tiền của user một lần cho mỗi đơn hàng
+    Các bước: tạo bản ghi revenue_credits (pending) -> $inc user kèm id bản ghi trong pending_credits
+    -> đánh dấu bản ghi applied -> bỏ id khỏi pending_credits. Dừng ở bước nào thì lần chạy lại làm tiếp từ đó.
+    Tham số:
+        user_id (ObjectId) - User được cộng tiền
+        order_id (ObjectId) - Đơn hàng
+        inc (dict) - Các trường cần $inc
+        now (datetime, optional) - Ghi vào updated_at nếu có
+    Trả về: True nếu lần gọi này đã cộng, False nếu đơn này đã được cộng trước đó (hoặc không có user)
+    """
+    db = get_db()
+    user_id = ObjectId(user_id)
+    claimed_at = datetime.now()
+    try:
+        credit_id = db.revenue_credits.insert_one({
+            'order_id': order_id, 'user_id': user_id, 'inc': inc,
+            'status': 'pending', 'claimed_at': claimed_at, 'created_at': claimed_at
+        }).inserted_id
+    except DuplicateKeyError:
+        credit = db.revenue_credits.find_one({'order_id': order_id, 'user_id': user_id}, {'status': 1})
+        if credit['status'] == 'applied':
+            return False
+        # Lần trước dừng giữa chừng: chỉ làm tiếp khi worker trước đã quá thời gian giữ bản ghi
+        credit = db.revenue_credits.find_one_and_update(
+            {'_id': credit['_id'], 'status': 'pending', 'claimed_at': {'$lte': claimed_at - CREDIT_CLAIM}},
+            {'$set': {'claimed_at': claimed_at}},
+            projection={'_id': 1}
+        )
+        if credit is None:
+            raise CreditInProgress(f"Credit of order {order_id} for user {user_id} is in progress")
+        credit_id = credit['_id']
+
+    # $inc chỉ chạy nếu id bản ghi chưa có trong pending_credits (lần trước đã $inc nhưng chưa đánh dấu applied)
+    update = {'$inc': inc, '$push': {'pending_credits': credit_id}}
+    if now:
+        update['$set'] = {'updated_at': now}
+    result = db.users.update_one({'_id': user_id, 'pending_credits': {'$ne': credit_id}}, update)
+    db.revenue_credits.update_one({'_id': credit_id},
+                                  {'$set': {'status': 'applied', 'applied_at': datetime.now()}})
+    db.users.update_one({'_id': user_id}, {'$pull': {'pending_credits': credit_id}})
+    return result.modified_count > 0
+
+def calculate_and_update_revenue(order_id, order=None):
     """
     Tính và cập nhật doanh thu cho admin (5%) và restaurant (95%) khi đơn hàng được thanh toán
     Chỉ tính trên tổng tiền món (không tính phí ship)
-    Tham số: order_id (string) - ID của đơn hàng
+    Chạy lại nhiều lần (callback VnPay gửi lại, job/outbox chạy lại sau lỗi) chỉ cộng doanh thu một lần
+    Tham số:
+        order_id (string) - ID của đơn hàng
+        order (dict, optional) - Document đơn hàng nếu đã có sẵn (bỏ qua bước đọc lại đơn hàng)
+    Trả về: True nếu lần gọi này đã cộng tiền cho ít nhất một user, False nếu đơn đã được cộng trước đó
     """
-    order = Order.find_by_id(order_id)
-    if not order:
+    if order is None:
+        order = Order.find_by_id(order_id)
+    if not order or order.get('revenue_applied'):
         return False
+    order_oid = ObjectId(order['_id'])
     
     # Tính tổng tiền món (không tính phí ship)
     delivery_fee = order.get('delivery_fee', 15000)
@@ -26,38 +87,40 @@ def calculate_and_update_revenue(order_id):
     admin_revenue = subtotal * 0.05  # Admin: 5%
     restaurant_revenue = subtotal * 0.95  # Restaurant: 95%
     
-    # Lấy restaurant owner
+    # Lấy restaurant owner (chỉ cần trường owner_id)
     rest_id = order.get('rest_id')
-    restaurant = get_db().restaurants.find_one({'_id': ObjectId(rest_id)}) if rest_id else None
+    restaurant = get_db().restaurants.find_one({'_id': ObjectId(rest_id)}, {'owner_id': 1}) if rest_id else None
     restaurant_owner_id = restaurant.get('owner_id') if restaurant else None
     
-    # Cập nhật doanh thu cho admin (tìm admin đầu tiên)
-    admin = get_db().users.find_one({'role': 'admin'})
+    # Cập nhật doanh thu cho admin (admin đầu tiên theo _id, chỉ đọc _id) bằng $inc
+    credited = False
+    admin = get_db().users.find_one({'role': 'admin'}, {'_id': 1}, sort=[('_id', 1)])
     if admin:
-        current_admin_revenue = admin.get('revenue', 0)
-        get_db().users.update_one(
-            {'_id': admin['_id']},
-            {'$set': {'revenue': current_admin_revenue + admin_revenue}}
-        )
+        credited = _credit_once(admin['_id'], order_oid, {'revenue': admin_revenue})
     
-    # Cập nhật doanh thu cho restaurant owner
+    # Cập nhật doanh thu cho restaurant owner bằng $inc
     if restaurant_owner_id:
-        owner = User.find_by_id(str(restaurant_owner_id))
-        if owner:
-            current_owner_revenue = owner.get('revenue', 0)
-            User.update(str(restaurant_owner_id), {
-                'revenue': current_owner_revenue + restaurant_revenue
-            })
+        credited = _credit_once(restaurant_owner_id, order_oid, {'revenue': restaurant_revenue},
+                                datetime.now()) or credited
     
-    return True
+    # Chỉ đánh dấu đơn hàng sau khi đã cộng xong: lỗi giữa chừng thì lần chạy lại cộng nốt phần còn thiếu
+    get_db().orders.update_one(
+        {'_id': order_oid, 'revenue_applied': {'$ne': True}},
+        {'$set': {'revenue_applied': True}}
+    )
+    return credited
 
 def update_shipper_delivery_fee(order_id):
     """
     Cập nhật tiền ship và stats cho shipper khi khách hàng xác nhận nhận hàng (order status = completed)
+    Chạy lại nhiều lần chỉ cộng một lần cho mỗi đơn
     Tham số: order_id (string) - ID của đơn hàng
     """
-    order = Order.find_by_id(order_id)
-    if not order or order.get('status') != 'completed':
+    order = get_db().orders.find_one(
+        {'_id': ObjectId(order_id), 'status': 'completed', 'shipper_fee_applied': {'$ne': True}},
+        {'shipper_id': 1, 'delivery_fee': 1}
+    )
+    if not order:
         return False
     
     shipper_id = order.get('shipper_id')
@@ -67,33 +130,23 @@ def update_shipper_delivery_fee(order_id):
     # Lấy phí ship (mặc định 15000)
     delivery_fee = order.get('delivery_fee', 15000)
     
-    # Lấy shipper
-    shipper = User.find_by_id(str(shipper_id))
-    if not shipper:
-        return False
-    
-    # Cập nhật tiền ship cho shipper
-    current_delivery_earnings = shipper.get('delivery_earnings', 0)
-    
-    # Cập nhật stats cho shipper (chỉ khi khách hàng xác nhận nhận hàng)
-    stats = shipper.get('delivery_stats', {})
-    stats['total_orders'] = stats.get('total_orders', 0) + 1
-    stats['completed_orders'] = stats.get('completed_orders', 0) + 1
-    
-    # Cập nhật cả tiền ship và stats
-    User.update(str(shipper_id), {
-        'delivery_earnings': current_delivery_earnings + delivery_fee,
-        'delivery_stats': stats
-    })
+    # Cập nhật cả tiền ship và stats bằng $inc (chỉ khi khách hàng xác nhận nhận hàng)
+    credited = _credit_once(shipper_id, order['_id'], {
+        'delivery_earnings': delivery_fee,
+        'delivery_stats.total_orders': 1,
+        'delivery_stats.completed_orders': 1
+    }, datetime.now())
     
-    return True
+    # Đánh dấu đơn hàng sau khi đã cộng (lần chạy sau dừng ngay ở bước tìm đơn)
+    get_db().orders.update_one({'_id': order['_id']}, {'$set': {'shipper_fee_applied': True}})
+    return credited
 
 def get_admin_revenue():
     """
     Lấy tổng doanh thu của admin
     Trả về: Số tiền doanh thu (float)
     """
-    admin = get_db().users.find_one({'role': 'admin'})
+    admin = get_db().users.find_one({'role': 'admin'}, {'revenue': 1}, sort=[('_id', 1)])
     if admin:
         return admin.get('revenue', 0)
     return 0
@@ -0,0 +1,173 @@
+# Nhật ký truy vấn chậm: lệnh MongoDB chạy lâu hơn SLOW_QUERY_MS được ghi vào capped collection slow_queries
+# cùng dạng filter, route đã gửi lệnh và kết quả explain("executionStats") lấy ở thread nền
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+# Import lỗi của pymongo (explain/ghi log lỗi không được ảnh hưởng request)
+from pymongo.errors import CollectionInvalid, PyMongoError
+# Import get_db để lấy database instance
+from app.database import get_db
+# Import add_observer để nhận mọi lệnh MongoDB đã chạy xong
+from app.utils.query_stats import add_observer
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = 'slow_queries'
+# Các lệnh explain được
+EXPLAINABLE = {'find', 'aggregate', 'count', 'distinct', 'update', 'delete', 'findAndModify'}
+# Trường của lệnh gắn với phiên/kết nối, explain không nhận
+SESSION_FIELDS = {'lsid', 'txnNumber', 'autocommit', 'startTransaction', 'writeConcern', 'readConcern',
+                  '$clusterTime', '$db', '$readPreference', 'cursor'}
+# Mỗi dạng lệnh chỉ explain lại sau số giây này (tránh explain hàng loạt khi database đang quá tải)
+EXPLAIN_INTERVAL = 60.0
+# Số lệnh chậm chờ ghi tối đa; đầy thì bỏ (không làm chậm request)
+MAX_PENDING = 1000
+# Namespace của getMore trên change stream mở ở cấp database/cluster (Database.watch của bus xóa cache)
+CHANGE_STREAM_NAMESPACE = '$cmd.aggregate'
+
+_settings = {'threshold_ms': 0, 'size': 16 * 1024 * 1024}
+_queue = queue.Queue(MAX_PENDING)
+_state = {'pid': None}
+_lock = threading.Lock()
+_explained = {}
+
+def waits_for_data(record):
+    """
+    getMore của cursor awaitData (change stream, cursor tailable): server giữ lệnh đến khi có dữ liệu mới
+    hoặc hết thời gian chờ (~1 giây), thời gian chạy là thời gian chờ chứ không phải truy vấn chậm
+    maxTimeMS chỉ được gửi kèm getMore của cursor awaitData
+    """
+    if record.name != 'getMore':
+        return False
+    return 'maxTimeMS' in record.command or record.command.get('collection') == CHANGE_STREAM_NAMESPACE
+
+def observe(record):
+    """query_stats observer: đưa lệnh chậm vào hàng đợi (request không chờ ghi log / explain)"""
+    threshold = _settings['threshold_ms']
+    if (not threshold or record.duration_ms < threshold or record.collection == COLLECTION
+            or record.name == 'explain' or waits_for_data(record)):
+        return
+    if _state['pid'] != os.getpid():
+        _start_thread()
+    try:
+        _queue.put_nowait(record)
+    except queue.Full:
+        pass
+
+def _start_thread():
+    """Thread ghi log của process (khởi động lại trong worker sau fork)"""
+    with _lock:
+        if _state['pid'] == os.getpid():
+            return
+        _state['pid'] = os.getpid()
+        threading.Thread(target=_drain, name='slow-query-log', daemon=True).start()
+
+def explain_command(record):
+    """
+    Chạy explain("executionStats") cho lệnh, bỏ các trường phiên/kết nối
+    Trả về: Dictionary tóm tắt (số document/key đã đọc, số kết quả, thời gian, stage của plan), None nếu không explain được
+    """
+    command = {key: value for key, value in record.command.items() if key not in SESSION_FIELDS}
+    if record.name == 'aggregate':
+        command['cursor'] = {}
+    result = get_db().client[record.database].command('explain', command, verbosity='executionStats')
+    stats = result.get('executionStats')
+    if stats is None and result.get('stages'):
+        # aggregate: executionStats nằm trong stage $cursor đầu tiên
+        stats = result['stages'][0].get('$cursor', {}).get('executionStats')
+    planner = result.get('queryPlanner')
+    if planner is None and result.get('stages'):
+        planner = result['stages'][0].get('$cursor', {}).get('queryPlanner')
+    stats = stats or {}
+    return {
+        'n_returned': stats.get('nReturned'),
+        'docs_examined': stats.get('totalDocsExamined'),
+        'keys_examined': stats.get('totalKeysExamined'),
+        'execution_ms': stats.get('executionTimeMillis'),
+        'plan': plan_stages((planner or {}).get('winningPlan', {})),
+    }
+
+def plan_stages(plan):
+    """Chuỗi stage của plan, ví dụ "FETCH <- IXSCAN {'rest_id': 1}" hoặc 'COLLSCAN'"""
+    stages = []
+    while plan:
+        stage = plan.get('stage', '?')
+        if plan.get('keyPattern'):
+            stage += ' ' + str(plan['keyPattern'])
+        stages.append(stage)
+        plan = plan.get('inputStage') or (plan.get('inputStages') or [None])[0] or plan.get('queryPlan')
+    return ' <- '.join(stages)
+
+def _drain():
+    pid = os.getpid()
+    while _state['pid'] == pid:
+        record = _queue.get()
+        entry = {
+            'shape': record.shape,
+            'collection': record.collection,
+            'command': record.name,
+            'endpoint': record.endpoint,
+            'duration_ms': round(record.duration_ms, 3),
+            'at': datetime.now(),
+            'explain': None,
+        }
+        now = time.monotonic()
+        if record.name in EXPLAINABLE and now - _explained.get(record.shape, -EXPLAIN_INTERVAL) >= EXPLAIN_INTERVAL:
+            _explained[record.shape] = now
+            try:
+                entry['explain'] = explain_command(record)
+            except PyMongoError as e:
+                entry['explain'] = {'error': str(e)}
+        try:
+            get_db()[COLLECTION].insert_one(entry)
+        except PyMongoError as e:
+            logger.warning("Could not write slow query log: %s", e)
+
+def create_collection(database):
+    """Tạo capped collection slow_queries (bỏ qua nếu đã có)"""
+    try:
+        database.create_collection(COLLECTION, capped=True, size=_settings['size'])
+    except CollectionInvalid:
+        pass
+    database[COLLECTION].create_index('shape')
+
+def worst_shapes(limit=50):
+    """
+    Các dạng lệnh chậm, tệ nhất trước (theo tổng thời gian)
+    Trả về: List dict: shape, collection, command, count, total_ms, avg_ms, max_ms, endpoints, last_at, explain (mới nhất)
+    """
+    pipeline = [
+        {'$sort': {'at': -1}},
+        {'$group': {
+            '_id': '$shape',
+            'collection': {'$first': '$collection'},
+            'command': {'$first': '$command'},
+            'count': {'$sum': 1},
+            'total_ms': {'$sum': '$duration_ms'},
+            'avg_ms': {'$avg': '$duration_ms'},
+            'max_ms': {'$max': '$duration_ms'},
+            'endpoints': {'$addToSet': '$endpoint'},
+            'last_at': {'$max': '$at'},
+            'explains': {'$push': '$explain'},
+        }},
+        {'$sort': {'total_ms': -1}},
+        {'$limit': limit},
+    ]
+    shapes = []
+    for group in get_db()[COLLECTION].aggregate(pipeline):
+        group['shape'] = group.pop('_id')
+        # Explain mới nhất (log được đọc từ mới đến cũ)
+        group['explain'] = next((e for e in group.pop('explains') if e), None)
+        shapes.append(group)
+    return shapes
+
+def init_app(app):
+    """Bật nhật ký với ngưỡng SLOW_QUERY_MS (0 để tắt) và kích thước SLOW_QUERY_LOG_SIZE của capped collection"""
+    _settings['threshold_ms'] = app.config.get('SLOW_QUERY_MS', 0)
+    _settings['size'] = app.config.get('SLOW_QUERY_LOG_SIZE', 16 * 1024 * 1024)
+    if not _state.get('registered'):
+        _state['registered'] = True
+        add_observer(observe)
@@ -0,0 +1,50 @@
+# Các job nền được request handler đưa vào hàng đợi (xem app/utils/jobs.py)
+# Import decorator đăng ký job
+from app.utils.jobs import job_handler
+# Import các model cần cập nhật
+from app.models import Menu, Restaurant, Review, User
+# Import hàm tạo bản thu nhỏ cho ảnh upload
+from app.utils.images import make_variants
+# Import hàm cập nhật doanh thu và tiền ship (đều an toàn khi chạy lại)
+from app.utils.revenue import calculate_and_update_revenue, update_shipper_delivery_fee
+# Import OrderService để xử lý outbox của đơn đặt tiền mặt
+from app.utils.order_service import OrderService
+
+@job_handler('orders.outbox')
+def order_outbox(order_id):
+    """Tác vụ phụ của đơn vừa đặt: cộng doanh thu, xóa giỏ hàng đã lưu (xem OrderService.place)"""
+    OrderService.process_outbox(order_id)
+
+@job_handler('revenue.update')
+def update_revenue(order_id):
+    """Cập nhật doanh thu admin/nhà hàng khi đơn hàng được thanh toán"""
+    calculate_and_update_revenue(order_id)
+
+@job_handler('shipper.delivery_fee')
+def shipper_delivery_fee(order_id):
+    """Cộng tiền ship và stats cho shipper khi khách xác nhận đã nhận hàng"""
+    update_shipper_delivery_fee(order_id)
+
+@job_handler('ratings.restaurant')
+def recompute_restaurant_rating(rest_id):
+    """Tính lại điểm đánh giá trung bình của nhà hàng"""
+    Restaurant.set_rating(rest_id, Review.calculate_restaurant_rating(rest_id))
+
+@job_handler('ratings.shipper')
+def recompute_shipper_rating(shipper_id):
+    """Tính lại điểm đánh giá trung bình của shipper"""
+    User.update(shipper_id, {'delivery_stats.avg_rating': Review.calculate_shipper_rating(shipper_id)})
+
+@job_handler('images.menu')
+def menu_image_variants(menu_id, image_url):
+    """Tạo bản thu nhỏ cho ảnh món ăn vừa upload"""
+    variants = make_variants(image_url)
+    if variants:
+        Menu.set_image_variants(menu_id, image_url, variants)
+
+@job_handler('images.review')
+def review_image_variants(review_id, images):
+    """Tạo bản thu nhỏ cho các ảnh của một đánh giá"""
+    variants = [make_variants(url) for url in images]
+    if any(variants):
+        Review.set_image_variants(review_id, images, variants)
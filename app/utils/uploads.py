@@ -0,0 +1,106 @@
+# Lưu file upload theo nội dung (content-addressed): tên file là SHA-256 của nội dung
+import hashlib
+import os
+import re
+import tempfile
+# Import current_app, request để đọc cấu hình và đường dẫn request
+from flask import current_app, request
+
+# Kích thước mỗi lần đọc khi vừa ghi vừa băm file upload
+CHUNK_SIZE = 64 * 1024
+
+# File có tên là hash nội dung (kể cả bản thu nhỏ <hash>_card.webp) không bao giờ thay đổi nội dung
+CONTENT_ADDRESSED = re.compile(r'^/static/uploads/.+/[0-9a-f]{64}(_[a-z]+)?\.[a-z0-9]+$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+def _file_mode():
+    """Quyền của file mới theo umask (như open() thường tạo), đọc một lần khi import module"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+# mkstemp tạo file quyền 0600 và os.replace giữ nguyên quyền đó: đặt lại trước khi đổi tên để
+# server tĩnh chạy bằng user khác (nginx) đọc được ảnh upload
+FILE_MODE = _file_mode()
+
+def upload_root():
+    """Thư mục static/uploads (UPLOAD_FOLDER trỏ vào static/uploads/menus)"""
+    return os.path.dirname(os.path.normpath(current_app.config.get('UPLOAD_FOLDER', 'static/uploads/menus')))
+
+def url_to_path(url):
+    """Chuyển URL /static/uploads/... thành đường dẫn file, None nếu không phải file upload"""
+    if not url or not url.startswith('/static/uploads/'):
+        return None
+    return os.path.join(upload_root(), url[len('/static/uploads/'):])
+
+def save_upload(file, subdir):
+    """
+    Lưu file upload theo hash nội dung: static/uploads/<subdir>/ab/cd/<sha256>.<ext>
+    File được đọc từng đoạn, vừa ghi ra file tạm vừa băm (không giữ cả file trong bộ nhớ);
+    nếu đã có file cùng nội dung thì bỏ file tạm và dùng lại file cũ
+    Tham số:
+        file (FileStorage) - File upload từ request.files
+        subdir (string) - Thư mục con ('menus' hoặc 'reviews')
+    Trả về: URL tĩnh của file (cùng nội dung luôn cho cùng URL)
+    """
+    folder = os.path.join(upload_root(), subdir)
+    os.makedirs(folder, exist_ok=True)
+
+    ext = os.path.splitext(file.filename or '')[1].lower().lstrip('.')
+    ext = 'jpg' if ext == 'jpeg' else ext
+
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = file.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+
+        name = digest.hexdigest()
+        relative = f"{name[:2]}/{name[2:4]}/{name}.{ext}" if ext else f"{name[:2]}/{name[2:4]}/{name}"
+        final_path = os.path.join(folder, relative)
+        if os.path.exists(final_path):
+            # Trùng nội dung: dùng lại file đã có
+            os.unlink(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.chmod(tmp_path, FILE_MODE)
+            # Đổi tên atomic: request khác cùng nội dung chỉ ghi đè bằng đúng nội dung đó
+            os.replace(tmp_path, final_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return f"/static/uploads/{subdir}/{relative}"
+
+def write_atomic(path, write):
+    """
+    Ghi file qua file tạm trong cùng thư mục rồi đổi tên: file ở đường dẫn cuối luôn là file đã ghi xong
+    Tham số:
+        path (string) - Đường dẫn file cần ghi
+        write (callable) - Hàm nhận file object (mở ở chế độ 'wb') và ghi nội dung
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            write(out)
+        os.chmod(tmp_path, FILE_MODE)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+def add_cache_headers(response):
+    """after_request: file theo hash nội dung được cache vĩnh viễn ở trình duyệt/CDN"""
+    if response.status_code in (200, 304) and CONTENT_ADDRESSED.match(request.path):
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+def init_app(app):
+    """Đăng ký header cache cho file upload"""
+    app.after_request(add_cache_headers)
@@ -1,18 +1,97 @@
 import hashlib
 import hmac
+import re
 import urllib.parse
 from datetime import datetime
 from flask import current_app
 
+# Chuỗi chỉ gồm ký tự không cần mã hóa trong query string (phần lớn tham số vnp_) thì giữ nguyên
+_UNRESERVED = re.compile(r'[A-Za-z0-9_.~-]*').fullmatch
+
+def _parse_amount(value):
+    """Số tiền từ vnp_Amount (đơn vị x100), None nếu thiếu hoặc không phải số nguyên"""
+    try:
+        return int(value) / 100
+    except (TypeError, ValueError):
+        return None
+
+def _quote(value):
+    """quote_plus nhưng bỏ qua chuỗi không có ký tự cần mã hóa"""
+    return value if _UNRESERVED(value) else urllib.parse.quote_plus(value)
+
+class VnPaySigner:
+    """
+    Bộ ký HMAC SHA512 dùng chung cho cả process
+    Khóa HMAC được chuẩn bị một lần, mỗi lần ký chỉ copy() trạng thái đã có khóa
+    (không phải băm lại secret như hmac.new), an toàn khi nhiều thread dùng chung
+    """
+
+    def __init__(self, hash_secret):
+        self._key = hmac.new(hash_secret.encode('utf-8'), digestmod=hashlib.sha512)
+
+    @staticmethod
+    def encode(vnp_params):
+        """
+        Tạo query string đã sắp xếp theo tên tham số trong một lượt (giống urlencode(sorted(...)))
+        Chuỗi này vừa dùng để ký vừa dùng làm query string của URL thanh toán
+        """
+        return '&'.join(f"{_quote(key)}={_quote(str(value))}" for key, value in sorted(vnp_params.items()))
+
+    def digest(self, data):
+        """Chữ ký hex của một chuỗi đã encode"""
+        mac = self._key.copy()
+        mac.update(data.encode('utf-8'))
+        return mac.hexdigest()
+
+    def sign(self, vnp_params):
+        """Chữ ký hex của dict tham số vnp_"""
+        return self.digest(self.encode(vnp_params))
+
+def get_vnpay():
+    """
+    Lấy đối tượng VnPay của app hiện tại (tạo một lần từ config rồi dùng lại cho mọi request)
+    Trả về: VnPay
+    """
+    vnpay = current_app.extensions.get('vnpay')
+    if vnpay is None:
+        vnpay = current_app.extensions['vnpay'] = VnPay(current_app.config)
+    return vnpay
+
 class VnPay:
-    def __init__(self):
-        # Lấy config từ Flask app context
-        self.tmn_code = current_app.config.get('VNPAY_TMN_CODE', '')
-        self.hash_secret = current_app.config.get('VNPAY_HASH_SECRET', '')
-        self.url = current_app.config.get('VNPAY_URL', 'https://sandbox.vnpayment.vn/paymentv2/vpcpay.html')
-        self.return_url = current_app.config.get('VNPAY_RETURN_URL', 'http://localhost:5000/customer/payment/vnpay_return')
+    def __init__(self, config=None):
+        # Lấy config từ Flask app context (hoặc config truyền vào)
+        config = config if config is not None else current_app.config
+        self.tmn_code = config.get('VNPAY_TMN_CODE', '')
+        self.hash_secret = config.get('VNPAY_HASH_SECRET', '')
+        self.url = config.get('VNPAY_URL', 'https://sandbox.vnpayment.vn/paymentv2/vpcpay.html')
+        self.return_url = config.get('VNPAY_RETURN_URL', 'http://localhost:5000/customer/payment/vnpay_return')
+        self.signer = VnPaySigner(self.hash_secret)
+    
+    @staticmethod
+    def make_txn_ref(order_id):
+        """
+        Tạo TxnRef từ order_id
+        VnPay yêu cầu TxnRef là số hoặc alphanumeric, tối đa 36 ký tự
+        Tạo TxnRef unique bằng cách kết hợp timestamp và order_id
+        """
+        import time
+        timestamp = int(time.time() * 1000) % 100000000  # Lấy 8 số cuối của timestamp
+        order_id_clean = str(order_id).replace('-', '').replace('ObjectId', '')[:20]  # Làm sạch ObjectId
+        return f"{timestamp}{order_id_clean}"[:36]  # Tối đa 36 ký tự
     
-    def create_payment_url(self, order_id, amount, order_info, order_type="other", bank_code=""):
+    def sign(self, vnp_params):
+        """
+        Tạo chữ ký HMAC SHA512 cho các tham số vnp_ (đã loại bỏ vnp_SecureHash)
+        Args:
+            vnp_params: Dict các tham số cần ký
+        Returns:
+            Chuỗi hex của chữ ký
+        """
+        # Sắp xếp params theo thứ tự alphabet và tạo query string (theo tài liệu)
+        return self.signer.sign(vnp_params)
+    
+    def create_payment_url(self, order_id, amount, order_info, order_type="other", bank_code="", txn_ref=None,
+                           create_date=None):
         """
         Tạo URL thanh toán VnPay
         
@@ -22,6 +101,8 @@ class VnPay:
             order_info: Thông tin đơn hàng
             order_type: Loại đơn hàng
             bank_code: Mã ngân hàng (nếu có)
+            txn_ref: TxnRef đã lưu vào payment (nếu không có sẽ tạo mới từ order_id)
+            create_date: vnp_CreateDate (yyyyMMddHHmmss) đã lưu vào payment, dùng lại khi truy vấn giao dịch
         
         Returns:
             URL thanh toán VnPay
@@ -33,13 +114,8 @@ class VnPay:
         if not self.hash_secret or self.hash_secret == 'YOUR_HASH_SECRET':
             raise ValueError("VNPAY_HASH_SECRET chưa được cấu hình. Vui lòng cấu hình trong .env hoặc config.py")
         
-        # Tạo TxnRef từ order_id
-        # VnPay yêu cầu TxnRef là số hoặc alphanumeric, tối đa 36 ký tự
-        # Tạo TxnRef unique bằng cách kết hợp timestamp và order_id
-        import time
-        timestamp = int(time.time() * 1000) % 100000000  # Lấy 8 số cuối của timestamp
-        order_id_clean = str(order_id).replace('-', '').replace('ObjectId', '')[:20]  # Làm sạch ObjectId
-        txn_ref = f"{timestamp}{order_id_clean}"[:36]  # Tối đa 36 ký tự
+        # Dùng TxnRef đã lưu trong payment để callback tìm lại đúng payment
+        txn_ref = txn_ref or self.make_txn_ref(order_id)
         
         # Lấy IP thật của user (nếu có)
         from flask import request
@@ -60,7 +136,7 @@ class VnPay:
             'vnp_Locale': 'vn',
             'vnp_ReturnUrl': self.return_url,
             'vnp_IpAddr': user_ip,
-            'vnp_CreateDate': datetime.now().strftime('%Y%m%d%H%M%S'),
+            'vnp_CreateDate': create_date or datetime.now().strftime('%Y%m%d%H%M%S'),
         }
         
         if bank_code:
@@ -69,24 +145,11 @@ class VnPay:
         # Loại bỏ các giá trị rỗng
         vnp_params = {k: v for k, v in vnp_params.items() if v}
         
-        # Sắp xếp params theo thứ tự alphabet
-        vnp_params = dict(sorted(vnp_params.items()))
-        
-        # Tạo query string (không encode vnp_SecureHash)
-        query_string = urllib.parse.urlencode(vnp_params)
-        
-        # Tạo secure hash
-        hmac_sha512 = hmac.new(
-            bytes(self.hash_secret, 'utf-8'),
-            bytes(query_string, 'utf-8'),
-            hashlib.sha512
-        ).hexdigest()
+        # Sắp xếp params theo thứ tự alphabet và encode một lần: cùng chuỗi dùng để ký và làm query string
+        query_string = self.signer.encode(vnp_params)
         
-        # Thêm secure hash vào params
-        vnp_params['vnp_SecureHash'] = hmac_sha512
-        
-        # Tạo URL thanh toán
-        payment_url = self.url + '?' + urllib.parse.urlencode(vnp_params)
+        # Tạo URL thanh toán (vnp_SecureHash đứng sau cùng)
+        payment_url = f"{self.url}?{query_string}&vnp_SecureHash={self.signer.digest(query_string)}"
         
         return payment_url
     
@@ -115,35 +178,41 @@ class VnPay:
                 else:
                     vnp_params[key] = value
         
-        # Sắp xếp params theo thứ tự alphabet (theo tài liệu)
-        vnp_params = dict(sorted(vnp_params.items()))
-        
-        # Tạo query string (không encode, theo tài liệu)
-        query_string = urllib.parse.urlencode(vnp_params)
-        
         # Tạo secure hash để so sánh (HMAC SHA512)
-        hmac_sha512 = hmac.new(
-            bytes(self.hash_secret, 'utf-8'),
-            bytes(query_string, 'utf-8'),
-            hashlib.sha512
-        ).hexdigest()
-        
-        # Kiểm tra secure hash
-        if secure_hash != hmac_sha512:
+        hmac_sha512 = self.sign(vnp_params)
+        
+        # Kiểm tra secure hash (so sánh thời gian hằng để tránh timing attack)
+        # So sánh bytes: compare_digest với str chứa ký tự non-ASCII sẽ raise TypeError
+        if not hmac.compare_digest(str(secure_hash).lower().encode('utf-8'), hmac_sha512.encode('ascii')):
             return {
                 'success': False,
+                'signature_valid': False,
                 'message': 'Invalid secure hash - Chu ky khong hop le'
             }
         
+        # Chữ ký đúng nhưng số tiền không đọc được: không cập nhật payment theo callback này
+        amount = _parse_amount(vnp_params.get('vnp_Amount'))
+        if amount is None:
+            return {
+                'success': False,
+                'signature_valid': True,
+                'invalid_amount': True,
+                'order_id': vnp_params.get('vnp_TxnRef'),
+                'txn_ref': vnp_params.get('vnp_TxnRef'),
+                'message': 'Invalid amount - So tien khong hop le'
+            }
+        
         # Kiểm tra response code
         response_code = vnp_params.get('vnp_ResponseCode', '')
         
         if response_code == '00':
             return {
                 'success': True,
+                'signature_valid': True,
                 'order_id': vnp_params.get('vnp_TxnRef'),
+                'txn_ref': vnp_params.get('vnp_TxnRef'),
                 'transaction_id': vnp_params.get('vnp_TransactionNo'),
-                'amount': int(vnp_params.get('vnp_Amount', 0)) / 100,
+                'amount': amount,
                 'bank_code': vnp_params.get('vnp_BankCode'),
                 'pay_date': vnp_params.get('vnp_PayDate'),
                 'transaction_status': vnp_params.get('vnp_TransactionStatus', ''),
@@ -152,7 +221,10 @@ class VnPay:
         else:
             return {
                 'success': False,
+                'signature_valid': True,
                 'order_id': vnp_params.get('vnp_TxnRef'),
+                'txn_ref': vnp_params.get('vnp_TxnRef'),
+                'amount': amount,
                 'response_code': response_code,
                 'transaction_id': vnp_params.get('vnp_TransactionNo'),
                 'message': self.get_response_message(response_code)
@@ -0,0 +1 @@
+# Benchmarks package - chạy bằng: python -m benchmarks.<tên_module>
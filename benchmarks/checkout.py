@@ -0,0 +1,107 @@
+"""
+Benchmark độ trễ đặt hàng thanh toán tiền mặt (p50/p99)
+So sánh chuỗi thao tác cũ (Order.create + Payment.create + cập nhật doanh thu + lưu giỏ hàng)
+với OrderService.place() (một lần insert, tác vụ phụ qua outbox), và đo cả route /customer/checkout.
+
+Chạy (cần MongoDB, mặc định dùng database riêng 'fastfood_bench'):
+    python -m benchmarks.checkout --iterations 500 --output bench_checkout.json
+Kết quả order_service_place kèm tỉ lệ p50/p99 so với legacy_cash_checkout (ghi vào doc/run.txt mục 20)
+"""
+import argparse
+import os
+
+# Dùng database riêng cho benchmark để không ghi dữ liệu giả vào database thật
+os.environ.setdefault('MONGODB_DB', 'fastfood_bench')
+
+from datetime import datetime
+from bson import ObjectId
+from app import create_app
+from app.database import get_db
+from app.models import Order, Payment, User
+from app.utils.order_service import OrderService, DELIVERY_FEE
+from benchmarks.common import timed, summarize, print_report
+
+def seed():
+    """Tạo admin, chủ nhà hàng, nhà hàng, món ăn và khách hàng dùng cho benchmark"""
+    db = get_db()
+    admin_id = db.users.insert_one({'phone': f'bench-admin-{ObjectId()}', 'role': 'admin', 'revenue': 0}).inserted_id
+    owner_id = db.users.insert_one({'phone': f'bench-owner-{ObjectId()}', 'role': 'restaurant_owner', 'revenue': 0}).inserted_id
+    rest_id = db.restaurants.insert_one({'name': 'Bench Restaurant', 'owner_id': owner_id, 'status': 'approved'}).inserted_id
+    menu_id = db.menus.insert_one({'name': 'Bench Burger', 'price': 50000, 'cat': 'burger',
+                                   'rest_id': rest_id, 'status': 'available'}).inserted_id
+    customer_id = db.users.insert_one({'phone': f'bench-customer-{ObjectId()}', 'role': 'customer',
+                                       'status': 'active'}).inserted_id
+    return {'admin_id': admin_id, 'owner_id': owner_id, 'rest_id': rest_id,
+            'menu_id': menu_id, 'customer_id': customer_id}
+
+def legacy_place(ids, items):
+    """Chuỗi thao tác đặt hàng tiền mặt trước khi có OrderService (giữ nguyên số round trip cũ)"""
+    db = get_db()
+    total = sum(i['price'] * i['quantity'] for i in items) + DELIVERY_FEE
+    order_id = Order.create({
+        'user_id': str(ids['customer_id']), 'rest_id': str(ids['rest_id']), 'items': items,
+        'total': total, 'delivery_fee': DELIVERY_FEE, 'delivery_address': 'Bench',
+        'promotion_code': None, 'status': 'pending', 'shipper_id': None
+    })
+    Payment.create({'order_id': str(order_id), 'method': 'cash', 'amount': total,
+                    'status': 'success', 'paid_at': datetime.now()})
+    # Cập nhật doanh thu theo cách cũ: đọc order, restaurant, admin, owner rồi ghi lại
+    order = Order.find_by_id(str(order_id))
+    subtotal = order['total'] - order['delivery_fee']
+    restaurant = db.restaurants.find_one({'_id': order['rest_id']})
+    admin = db.users.find_one({'role': 'admin'})
+    db.users.update_one({'_id': admin['_id']}, {'$set': {'revenue': admin.get('revenue', 0) + subtotal * 0.05}})
+    owner = User.find_by_id(str(restaurant['owner_id']))
+    User.update(str(owner['_id']), {'revenue': owner.get('revenue', 0) + subtotal * 0.95})
+    User.save_cart(str(ids['customer_id']), {})
+
+def compare_legacy(result, legacy):
+    """Thêm tỉ lệ p50/p99 của chuỗi thao tác cũ so với kịch bản mới (> 1 là nhanh hơn)"""
+    for key in ('p50_ms', 'p99_ms'):
+        result[f"legacy_{key[:3]}_x"] = round(legacy[key] / result[key], 2) if result[key] else None
+    return result
+
+def run(iterations):
+    """Chạy các kịch bản và trả về danh sách kết quả"""
+    app = create_app()
+    results = []
+    with app.app_context():
+        ids = seed()
+        items = [{'menu_id': str(ids['menu_id']), 'name': 'Bench Burger', 'quantity': 2, 'price': 50000}]
+
+        samples = [timed(legacy_place, ids, items)[1] for _ in range(iterations)]
+        results.append(summarize('legacy_cash_checkout', samples))
+
+        samples = []
+        for _ in range(iterations):
+            # Đo phần request phải chờ (insert); outbox được xử lý riêng như thread nền
+            order_id, elapsed = timed(OrderService.place, str(ids['customer_id']), str(ids['rest_id']),
+                                      items, 'Bench', 'cash')
+            samples.append(elapsed)
+            OrderService.process_outbox(order_id)
+        results.append(compare_legacy(summarize('order_service_place', samples), results[0]))
+
+        # Đo toàn bộ route checkout qua Flask test client
+        client = app.test_client()
+        cart_meta = {'rest_id': str(ids['rest_id']),
+                     'items': {str(ids['menu_id']): {'name': 'Bench Burger', 'price': 50000, 'cat': 'burger'}}}
+        samples = []
+        for _ in range(iterations):
+            with client.session_transaction() as sess:
+                sess['user_id'] = str(ids['customer_id'])
+                sess['user_role'] = 'customer'
+                sess['cart'] = {str(ids['menu_id']): 2}
+                sess['cart_meta'] = cart_meta
+            response, elapsed = timed(client.post, '/customer/checkout', data={
+                'rest_id': str(ids['rest_id']), 'delivery_address': 'Bench', 'payment_method': 'cash'
+            })
+            samples.append(elapsed)
+        results.append(summarize('checkout_route_cash', samples))
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark độ trễ checkout')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--output', default=None, help='File JSON để lưu kết quả')
+    args = parser.parse_args()
+    print_report(run(args.iterations), args.output)
@@ -0,0 +1,64 @@
+"""
+Các hàm dùng chung cho benchmark: đo thời gian, tính percentile và in/lưu kết quả
+"""
+import json
+import time
+
+def percentile(samples, p):
+    """
+    Tính percentile p (0-100) của danh sách mẫu (nội suy tuyến tính)
+    Tham số:
+        samples (list) - Danh sách giá trị đo được
+        p (float) - Percentile cần tính, ví dụ 50 hoặc 99
+    Trả về: Giá trị percentile (float), 0.0 nếu không có mẫu
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = (len(ordered) - 1) * p / 100.0
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+def timed(func, *args, **kwargs):
+    """
+    Chạy func và đo thời gian
+    Trả về: Tuple (kết quả, thời gian tính bằng mili giây)
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+def summarize(name, samples_ms):
+    """
+    Tóm tắt danh sách thời gian (ms) thành dict p50/p99/mean
+    Tham số:
+        name (string) - Tên kịch bản
+        samples_ms (list) - Thời gian mỗi lần chạy tính bằng ms
+    Trả về: Dictionary kết quả
+    """
+    count = len(samples_ms)
+    return {
+        'name': name,
+        'count': count,
+        'p50_ms': round(percentile(samples_ms, 50), 3),
+        'p99_ms': round(percentile(samples_ms, 99), 3),
+        'mean_ms': round(sum(samples_ms) / count, 3) if count else 0.0,
+    }
+
+def print_report(results, output=None):
+    """
+    In bảng kết quả và (tùy chọn) lưu ra file JSON
+    Tham số:
+        results (list) - Danh sách dict từ summarize()
+        output (string, optional) - Đường dẫn file JSON để lưu
+    """
+    for result in results:
+        extra = {k: v for k, v in result.items() if k not in ('name', 'count', 'p50_ms', 'p99_ms', 'mean_ms')}
+        extra_text = ' '.join(f"{k}={v}" for k, v in extra.items())
+        print(f"{result['name']:<32} n={result['count']:<7} p50={result['p50_ms']:>9.3f}ms "
+              f"p99={result['p99_ms']:>9.3f}ms mean={result['mean_ms']:>9.3f}ms {extra_text}")
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"Đã lưu kết quả vào {output}")
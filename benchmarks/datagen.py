@@ -0,0 +1,314 @@
+"""
+Sinh dữ liệu giả với số lượng gần thực tế để benchmark (users, restaurants, menus, orders, payments, reviews)
+Các tham chiếu luôn khớp: món thuộc nhà hàng có thật, đơn hàng lấy món của đúng nhà hàng với giá của món,
+payment VnPay trỏ đến đơn hàng, review chỉ có cho đơn đã hoàn thành và chấm điểm các món trong đơn.
+ID và nội dung được sinh từ --seed nên hai lần chạy cùng tham số cho cùng dữ liệu (báo cáo so sánh được).
+
+Quy mô --scale 1: 100k users, 5k nhà hàng, 200k món, 10M đơn hàng (mặc định --scale 0.01)
+    python -m benchmarks.datagen --scale 0.01 --drop
+    python -m benchmarks.datagen --scale 1 --workers 8 --drop
+Ghi vào database MONGODB_DB (mặc định 'fastfood_bench'). Mật khẩu mọi tài khoản: bench123
+    admin 0900000000, chủ nhà hàng 091xxxxxxx, tài xế 092xxxxxxx, khách hàng 093xxxxxxx
+Index được tạo sau khi nạp xong (nhanh hơn nhiều so với cập nhật index khi insert).
+"""
+import argparse
+import os
+import random
+import struct
+import time
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+
+# Dùng database riêng cho benchmark để không ghi dữ liệu giả vào database thật
+os.environ.setdefault('MONGODB_DB', 'fastfood_bench')
+
+import bcrypt
+from bson import ObjectId
+from pymongo import MongoClient
+
+from app.config import Config
+# Import create_indexes để tạo index sau khi nạp xong
+from app.database import create_indexes
+# Import CATALOG_KEY để tăng version catalog (cache của web server không dùng dữ liệu cũ)
+from app.utils.fragment_cache import CATALOG_KEY
+
+# Số lượng ở --scale 1
+FULL = {'users': 100_000, 'restaurants': 5_000, 'menus': 200_000, 'orders': 10_000_000}
+# Tỉ lệ vai trò trong users (còn lại là khách hàng); mỗi chủ nhà hàng có một nhà hàng
+SHIPPER_RATIO = 0.02
+BATCH = 5000
+PASSWORD = 'bench123'
+# Đơn gần nhất còn đang xử lý (pending/preparing/delivering/delivered); đơn cũ hơn đã completed hoặc cancelled
+ACTIVE_ORDERS = 2000
+# Byte thứ 5 của ObjectId: loại document (ID không trùng giữa các collection, sinh lại được từ seed)
+KINDS = {'users': 1, 'restaurants': 2, 'menus': 3, 'orders': 4, 'payments': 5, 'reviews': 6}
+
+CATEGORIES = {
+    'burger': ['Burger Bò', 'Burger Gà Giòn', 'Burger Phô Mai', 'Burger Tôm'],
+    'pizza': ['Pizza Hải Sản', 'Pizza Pepperoni', 'Pizza Rau Củ', 'Pizza Gà BBQ'],
+    'drink': ['Coca Cola', 'Trà Đào', 'Trà Sữa', 'Nước Cam', 'Cà Phê Sữa Đá'],
+    'combo': ['Combo Gia Đình', 'Combo 2 Người', 'Combo Trưa'],
+    'side': ['Khoai Tây Chiên', 'Cánh Gà Cay', 'Salad', 'Gà Viên'],
+    'phở': ['Phở Bò Tái', 'Phở Gà', 'Phở Bò Viên'],
+    'bánh mì': ['Bánh Mì Thịt', 'Bánh Mì Gà', 'Bánh Mì Ốp La'],
+    'cơm': ['Cơm Tấm Sườn', 'Cơm Gà Xối Mỡ', 'Cơm Chiên Dương Châu'],
+}
+BRANDS = ['Burger House', 'Pizza Corner', 'Phở Sài Gòn', 'Cơm Tấm Cali', 'Gà Rán 24h', 'Bánh Mì Má Hải',
+          'Trà Sữa Mây', 'Fast Bite', 'Quán Nhà Làm', 'Bếp Việt']
+STREETS = ['Lê Lợi', 'Nguyễn Huệ', 'Hai Bà Trưng', 'Điện Biên Phủ', 'Võ Văn Tần', 'Cách Mạng Tháng 8',
+           'Nguyễn Thị Minh Khai', 'Phan Xích Long', 'Lý Tự Trọng', 'Trần Hưng Đạo']
+COMMENTS = ['Ngon, giao nhanh', 'Đồ ăn nóng, đóng gói cẩn thận', 'Tạm được', 'Hơi mặn', 'Sẽ đặt lại',
+            'Giao hơi trễ', 'Rất ngon!', 'Phần ăn hơi ít']
+
+def make_id(kind, number, created_at):
+    """ObjectId sinh lại được: 4 byte thời gian tạo, 1 byte loại, 7 byte số thứ tự"""
+    return ObjectId(struct.pack('>IB', int(created_at.timestamp()), KINDS[kind]) + number.to_bytes(7, 'big'))
+
+def counts(scale):
+    """Số lượng từng collection theo scale (tối thiểu đủ để mọi kịch bản benchmark chạy được)"""
+    result = {name: max(int(full * scale), minimum) for (name, full), minimum
+              in zip(FULL.items(), (50, 3, 30, 100))}
+    result['users'] = max(result['users'], result['restaurants'] + 20)
+    return result
+
+def get_database():
+    return MongoClient(Config.MONGODB_URI)[Config.MONGODB_DB]
+
+def insert_batches(collection, documents):
+    """Insert theo lô (không theo thứ tự để server ghi song song), trả về số document đã ghi"""
+    batch, total = [], 0
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= BATCH:
+            collection.insert_many(batch, ordered=False)
+            total += len(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        total += len(batch)
+    return total
+
+def build_catalog(rng, sizes, start, password):
+    """
+    Sinh users, restaurants, menus (giữ trong bộ nhớ: cần để sinh đơn hàng)
+    Trả về: Dictionary các list document
+    """
+    users = [{'_id': make_id('users', 0, start), 'phone': '0900000000', 'name': 'Bench Admin',
+              'password': password, 'role': 'admin', 'status': 'active', 'revenue': 0, 'created_at': start}]
+    restaurants, menus = [], []
+    shipper_count = max(int(sizes['users'] * SHIPPER_RATIO), 5)
+    customer_count = sizes['users'] - 1 - sizes['restaurants'] - shipper_count
+    span = (datetime.now() - start).total_seconds()
+
+    for i in range(sizes['restaurants']):
+        created = start + timedelta(seconds=span * 0.2 * i / sizes['restaurants'])
+        owner = {'_id': make_id('users', len(users), created), 'phone': f'091{i:07d}', 'name': f'Chủ quán {i}',
+                 'password': password, 'role': 'restaurant_owner', 'status': 'active', 'revenue': 0,
+                 'created_at': created}
+        users.append(owner)
+        status = rng.choices(['approved', 'pending', 'banned'], [90, 7, 3])[0]
+        restaurants.append({
+            '_id': make_id('restaurants', i, created),
+            'name': f"{rng.choice(BRANDS)} {rng.choice(STREETS)} {i}",
+            'addr': f"{rng.randint(1, 400)} {rng.choice(STREETS)}, Q{rng.randint(1, 12)}",
+            'loc': {'type': 'Point', 'coordinates': [round(106.6 + rng.random() * 0.2, 6),
+                                                     round(10.7 + rng.random() * 0.15, 6)]},
+            'open': '08:00', 'close': '22:00',
+            'rating': round(rng.uniform(3.0, 5.0), 1),
+            'status': status,
+            'owner_id': owner['_id'],
+            'created_at': created,
+        })
+    per_restaurant = sizes['menus'] / sizes['restaurants']
+    for restaurant in restaurants:
+        for _ in range(max(1, int(rng.gauss(per_restaurant, per_restaurant / 4)))):
+            category = rng.choice(list(CATEGORIES))
+            menus.append({
+                '_id': make_id('menus', len(menus), restaurant['created_at']),
+                'rest_id': restaurant['_id'],
+                'name': rng.choice(CATEGORIES[category]),
+                'price': rng.randrange(15, 250) * 1000,
+                'cat': category,
+                'status': rng.choices(['available', 'unavailable'], [92, 8])[0],
+                'created_at': restaurant['created_at'],
+            })
+    for i in range(shipper_count):
+        created = start + timedelta(seconds=span * 0.3 * i / shipper_count)
+        users.append({'_id': make_id('users', len(users), created), 'phone': f'092{i:07d}', 'name': f'Tài xế {i}',
+                      'password': password, 'role': 'shipper', 'status': rng.choices(['active', 'pending'], [95, 5])[0],
+                      'is_online': rng.random() < 0.5, 'vehicle': 'Xe máy', 'plate': f'59-X{i % 10} {i:05d}',
+                      'delivery_fee_earned': 0, 'created_at': created})
+    for i in range(customer_count):
+        created = start + timedelta(seconds=span * 0.5 * i / customer_count)
+        users.append({'_id': make_id('users', len(users), created), 'phone': f'093{i:07d}', 'name': f'Khách hàng {i}',
+                      'password': password, 'role': 'customer', 'status': 'active',
+                      'address': f"{rng.randint(1, 400)} {rng.choice(STREETS)}", 'created_at': created})
+    return {'users': users, 'restaurants': restaurants, 'menus': menus}
+
+# Dữ liệu dùng chung cho các process sinh đơn hàng (nạp một lần bởi _init_worker)
+_catalog = {}
+
+def _init_worker(catalog):
+    _catalog.update(catalog)
+    _catalog['db'] = get_database()
+
+def order_catalog(catalog):
+    """Phần catalog cần để sinh đơn hàng: món đang bán theo nhà hàng đã duyệt, ID khách hàng và tài xế"""
+    available = {}
+    for menu in catalog['menus']:
+        if menu['status'] == 'available':
+            available.setdefault(menu['rest_id'], []).append((menu['_id'], menu['name'], menu['price']))
+    approved = [r['_id'] for r in catalog['restaurants'] if r['status'] == 'approved' and r['_id'] in available]
+    return {
+        'menus': available,
+        'restaurants': approved,
+        'customers': [u['_id'] for u in catalog['users'] if u['role'] == 'customer'],
+        'shippers': [u['_id'] for u in catalog['users'] if u['role'] == 'shipper' and u['status'] == 'active'],
+    }
+
+def generate_orders(task):
+    """
+    Sinh và insert một đoạn đơn hàng [first, last) cùng payments và reviews của chúng (chạy trong process con)
+    Trả về: Tuple (số orders, số payments, số reviews)
+    """
+    first, last, total, seed, start = task
+    rng = random.Random(seed * 1_000_003 + first)
+    db = _catalog['db']
+    span = (datetime.now() - start).total_seconds()
+    orders, payments, reviews = [], [], []
+    written = [0, 0, 0]
+
+    def flush():
+        for collection, batch, index in ((db.orders, orders, 0), (db.payments, payments, 1), (db.reviews, reviews, 2)):
+            if batch:
+                collection.insert_many(batch, ordered=False)
+                written[index] += len(batch)
+                batch.clear()
+
+    active = min(ACTIVE_ORDERS, total // 20)
+    for number in range(first, last):
+        # Đơn hàng nằm ở nửa sau khoảng thời gian: mọi khách hàng, nhà hàng, tài xế đã tồn tại
+        created = start + timedelta(seconds=span * (0.5 + 0.5 * number / total))
+        rest_id = rng.choice(_catalog['restaurants'])
+        menu_choices = _catalog['menus'][rest_id]
+        items = []
+        for menu_id, name, price in rng.sample(menu_choices, min(len(menu_choices), rng.randint(1, 4))):
+            # menu_id trong đơn là string (giống đơn tạo từ giỏ hàng)
+            items.append({'menu_id': str(menu_id), 'name': name, 'quantity': rng.randint(1, 3), 'price': price})
+        subtotal = sum(item['price'] * item['quantity'] for item in items)
+        recent = number >= total - active
+        if recent:
+            status = rng.choice(['pending', 'pending', 'preparing', 'delivering', 'delivered'])
+        else:
+            status = rng.choices(['completed', 'cancelled'], [94, 6])[0]
+        shipper_id = None
+        if status not in ('pending', 'cancelled') and _catalog['shippers']:
+            shipper_id = rng.choice(_catalog['shippers'])
+        order_id = make_id('orders', number, created)
+        order = {
+            '_id': order_id,
+            'user_id': rng.choice(_catalog['customers']),
+            'rest_id': rest_id,
+            'items': items,
+            'total': subtotal + 15000,
+            'delivery_fee': 15000,
+            'delivery_address': f"{rng.randint(1, 400)} {rng.choice(STREETS)}",
+            'promotion_code': None,
+            'status': status,
+            'shipper_id': shipper_id,
+            'created_at': created,
+            'updated_at': created + timedelta(minutes=rng.randint(1, 60)),
+        }
+        if status == 'completed':
+            order['completed_at'] = order['updated_at']
+        if rng.random() < 0.7:
+            # Thanh toán tiền mặt: payment nhúng trong đơn (OrderService.place)
+            order['payment'] = {'method': 'cash', 'amount': order['total'], 'status': 'success', 'paid_at': created}
+        else:
+            payments.append({
+                '_id': make_id('payments', number, created),
+                'order_id': order_id,
+                'method': 'vnpay',
+                'amount': order['total'],
+                'status': 'success' if status != 'cancelled' else 'failed',
+                'txn_ref': f"B{number:011d}",
+                'paid_at': created,
+                'created_at': created,
+            })
+        if status == 'completed' and rng.random() < 0.3:
+            reviews.append({
+                '_id': make_id('reviews', number, order['completed_at']),
+                'order_id': order_id,
+                'user_id': order['user_id'],
+                'restaurant_id': rest_id,
+                'shipper_id': shipper_id,
+                'restaurant_rating': rng.choices([1, 2, 3, 4, 5], [3, 5, 12, 35, 45])[0],
+                'restaurant_comment': rng.choice(COMMENTS),
+                'driver_rating': rng.choices([3, 4, 5], [10, 30, 60])[0] if shipper_id else None,
+                'driver_comment': rng.choice(COMMENTS) if shipper_id else '',
+                'menu_ratings': [{'menu_id': ObjectId(item['menu_id']), 'menu_name': item['name'],
+                                  'rating': rng.randint(3, 5), 'comment': ''} for item in items],
+                'images': [],
+                'created_at': order['completed_at'],
+            })
+        orders.append(order)
+        if len(orders) >= BATCH:
+            flush()
+    flush()
+    return tuple(written)
+
+def run(scale, seed, workers, drop, orders=None):
+    """Sinh toàn bộ dữ liệu; trả về dictionary số document mỗi collection"""
+    sizes = counts(scale)
+    if orders:
+        sizes['orders'] = orders
+    rng = random.Random(seed)
+    start = (datetime.now() - timedelta(days=365)).replace(microsecond=0)
+    db = get_database()
+    print(f"Database: {Config.MONGODB_DB}, số lượng: {sizes}")
+    if drop:
+        for name in KINDS:
+            db[name].drop()
+
+    began = time.perf_counter()
+    # Một hash bcrypt dùng cho mọi tài khoản (hash 100k lần mất hàng giờ)
+    password = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    catalog = build_catalog(rng, sizes, start, password)
+    written = {name: insert_batches(db[name], catalog[name]) for name in ('users', 'restaurants', 'menus')}
+    print(f"✅ users/restaurants/menus: {written} ({time.perf_counter() - began:.1f}s)")
+
+    shared = order_catalog(catalog)
+    del catalog
+    chunk = max(BATCH, sizes['orders'] // (workers * 8) if workers > 1 else sizes['orders'])
+    tasks = [(first, min(first + chunk, sizes['orders']), sizes['orders'], seed, start)
+             for first in range(0, sizes['orders'], chunk)]
+    totals = [0, 0, 0]
+    if workers > 1:
+        with Pool(workers, initializer=_init_worker, initargs=(shared,)) as pool:
+            for done in pool.imap_unordered(generate_orders, tasks):
+                totals = [a + b for a, b in zip(totals, done)]
+                print(f"  orders {totals[0]:,}/{sizes['orders']:,} ({time.perf_counter() - began:.0f}s)")
+    else:
+        _init_worker(shared)
+        for task in tasks:
+            totals = [a + b for a, b in zip(totals, generate_orders(task))]
+    written.update(orders=totals[0], payments=totals[1], reviews=totals[2])
+    print(f"✅ orders/payments/reviews: {totals} ({time.perf_counter() - began:.1f}s)")
+
+    # Tạo index sau khi nạp, rồi tăng version catalog để cache/snapshot của web server không dùng dữ liệu cũ
+    if not create_indexes(db):
+        print("⚠️  Chưa tạo đủ index (xem log)")
+    db.cache_versions.update_one({'_id': CATALOG_KEY}, {'$inc': {'version': 1}}, upsert=True)
+    print(f"✅ Xong sau {time.perf_counter() - began:.1f}s")
+    return written
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sinh dữ liệu giả cho benchmark')
+    parser.add_argument('--scale', type=float, default=0.01, help='1 = 100k users, 5k nhà hàng, 200k món, 10M đơn')
+    parser.add_argument('--orders', type=int, default=None, help='Ghi đè số đơn hàng')
+    parser.add_argument('--seed', type=int, default=42, help='Seed (cùng seed cho cùng dữ liệu)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Số process sinh đơn hàng')
+    parser.add_argument('--drop', action='store_true', help='Xóa dữ liệu cũ của database benchmark trước')
+    args = parser.parse_args()
+
+    run(args.scale, args.seed, args.workers, args.drop, args.orders)
@@ -0,0 +1,133 @@
+"""
+Server giả lập API querydr của VnPay để chạy đối soát (reconcile_payments.py) ở máy local và khi kiểm thử.
+Kết quả của mỗi txn_ref được quyết định cố định theo hash của txn_ref (chạy lại cho cùng kết quả),
+response được ký bằng VNPAY_HASH_SECRET giống VnPay thật.
+
+Chạy riêng:
+    python -m benchmarks.fake_vnpay --port 8089 --paid 0.7 --latency 50
+rồi đặt VNPAY_API_URL=http://127.0.0.1:8089/merchant_webapi/api/transaction
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import threading
+import time
+import zlib
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Thứ tự các trường dùng để ký response querydr
+RESPONSE_HASH_FIELDS = (
+    'vnp_ResponseId', 'vnp_Command', 'vnp_ResponseCode', 'vnp_Message', 'vnp_TmnCode', 'vnp_TxnRef',
+    'vnp_Amount', 'vnp_BankCode', 'vnp_PayDate', 'vnp_TransactionNo', 'vnp_TransactionType',
+    'vnp_TransactionStatus', 'vnp_OrderInfo', 'vnp_PromotionCode', 'vnp_PromotionAmount'
+)
+
+class FakeVnPay:
+    """
+    Cấu hình kết quả giả lập
+    Tham số:
+        hash_secret (string) - Secret dùng để ký response
+        paid (float) - Tỉ lệ giao dịch đã thanh toán thành công
+        not_found (float) - Tỉ lệ giao dịch không tồn tại (ResponseCode 91), phần còn lại đang xử lý (01)
+        amounts (dict, optional) - txn_ref -> số tiền trả về (mặc định 115000)
+        latency_ms (int) - Độ trễ giả lập mỗi request
+    """
+
+    def __init__(self, hash_secret, paid=0.7, not_found=0.2, amounts=None, latency_ms=0):
+        self.hash_secret = hash_secret
+        self.paid = paid
+        self.not_found = not_found
+        self.amounts = amounts or {}
+        self.latency_ms = latency_ms
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def outcome(self, txn_ref):
+        """Kết quả cố định theo txn_ref: 'paid', 'not_found' hoặc 'processing'"""
+        bucket = (zlib.crc32(txn_ref.encode('utf-8')) % 1000) / 1000
+        if bucket < self.paid:
+            return 'paid'
+        if bucket < self.paid + self.not_found:
+            return 'not_found'
+        return 'processing'
+
+    def respond(self, request):
+        """Tạo response đã ký cho một request querydr"""
+        with self._lock:
+            self.requests += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+        txn_ref = request.get('vnp_TxnRef', '')
+        outcome = self.outcome(txn_ref)
+        response = dict.fromkeys(RESPONSE_HASH_FIELDS, '')
+        response.update({
+            'vnp_ResponseId': request.get('vnp_RequestId', ''),
+            'vnp_Command': 'querydr',
+            'vnp_TmnCode': request.get('vnp_TmnCode', ''),
+            'vnp_TxnRef': txn_ref,
+            'vnp_OrderInfo': request.get('vnp_OrderInfo', ''),
+        })
+        if outcome == 'not_found':
+            response.update({'vnp_ResponseCode': '91', 'vnp_Message': 'Transaction not found'})
+        else:
+            response.update({
+                'vnp_ResponseCode': '00',
+                'vnp_Message': 'QueryDR Success',
+                'vnp_Amount': str(int(self.amounts.get(txn_ref, 115000) * 100)),
+                'vnp_BankCode': 'NCB',
+                'vnp_PayDate': datetime.now().strftime('%Y%m%d%H%M%S'),
+                'vnp_TransactionNo': str(zlib.crc32(txn_ref.encode('utf-8'))),
+                'vnp_TransactionType': '01',
+                'vnp_TransactionStatus': '00' if outcome == 'paid' else '01',
+            })
+        data = '|'.join(response[k] for k in RESPONSE_HASH_FIELDS)
+        response['vnp_SecureHash'] = hmac.new(self.hash_secret.encode('utf-8'), data.encode('utf-8'),
+                                              hashlib.sha512).hexdigest()
+        return response
+
+def start_server(fake, host='127.0.0.1', port=0):
+    """
+    Chạy server giả lập trong thread nền
+    Trả về: (server, api_url) - gọi server.shutdown() để dừng
+    """
+    class Handler(BaseHTTPRequestHandler):
+        # HTTP/1.1 để client giữ kết nối keep-alive
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.dumps(fake.respond(json.loads(self.rfile.read(length)))).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-vnpay', daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/merchant_webapi/api/transaction"
+
+if __name__ == '__main__':
+    from app.config import Config
+
+    parser = argparse.ArgumentParser(description='Server giả lập API querydr của VnPay')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--paid', type=float, default=0.7, help='Tỉ lệ giao dịch đã thanh toán')
+    parser.add_argument('--not-found', type=float, default=0.2, help='Tỉ lệ giao dịch không tồn tại')
+    parser.add_argument('--latency', type=int, default=0, help='Độ trễ mỗi request (ms)')
+    args = parser.parse_args()
+
+    fake = FakeVnPay(Config.VNPAY_HASH_SECRET, args.paid, args.not_found, latency_ms=args.latency)
+    server, api_url = start_server(fake, port=args.port)
+    print(f"Fake VnPay querydr: {api_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,92 @@
+"""
+Benchmark/kiểm tra bus xóa cache giữa các process (app/utils/invalidation.py)
+Đo thời gian từ lúc Menu.update ghi xong đến khi thread của bus nhận event, và kiểm tra
+cache cục bộ thật sự bị xóa khi một process khác ghi trực tiếp vào database.
+
+Chạy với replica set một node (change stream):
+    mongod --replSet rs0 --dbpath /tmp/rs0 --port 27018
+    mongosh --port 27018 --eval "rs.initiate()"
+    MONGODB_URI="mongodb://localhost:27018/?replicaSet=rs0" python -m benchmarks.invalidation_bus --iterations 200
+Chạy với MongoDB standalone (poll cache_versions):
+    python -m benchmarks.invalidation_bus --iterations 50
+Chế độ được chọn tự động; ép chế độ bằng --mode change_stream|poll.
+"""
+import argparse
+import os
+import threading
+import time
+
+# Dùng database riêng cho benchmark để không ghi dữ liệu giả vào database thật
+os.environ.setdefault('MONGODB_DB', 'fastfood_bench')
+
+from app import create_app
+from app.database import get_db
+from app.models import Menu
+from app.utils import invalidation
+from app.utils.doc_cache import catalog_cache
+from benchmarks.common import timed, summarize, print_report
+
+def run(iterations, timeout, mode=None):
+    """Chạy các kịch bản và trả về danh sách kết quả"""
+    app = create_app(lazy_db=True)
+    if mode:
+        app.config['CACHE_BUS_MODE'] = mode
+        invalidation.init_app(app, listen=False)
+    results = []
+    with app.app_context():
+        db = get_db()
+        mode = invalidation.resolve_mode()
+        print(f"Chế độ bus: {mode}")
+        rest_id = db.restaurants.insert_one({'name': 'Bench Bus Restaurant', 'status': 'approved'}).inserted_id
+        menu_id = db.menus.insert_one({'name': 'Bench Bus Menu', 'price': 1, 'rest_id': rest_id,
+                                       'status': 'available'}).inserted_id
+
+        # Handler đo thời gian: ghi nhận event của món benchmark
+        arrived = threading.Event()
+        invalidation.subscribe('menus', lambda doc_id, op, doc: str(doc_id) == str(menu_id) and arrived.set())
+        invalidation.bus.ensure_started()
+        # Chờ thread bắt đầu theo dõi (change stream mở, hoặc lần poll đầu đọc số thứ tự hiện tại)
+        time.sleep(2 * app.config['CACHE_BUS_POLL_INTERVAL'])
+
+        latencies = []
+        lost = 0
+        for i in range(iterations):
+            arrived.clear()
+            _, write_ms = timed(Menu.update, str(menu_id), {'price': i})
+            start = time.perf_counter()
+            if arrived.wait(timeout):
+                latencies.append((time.perf_counter() - start) * 1000 + write_ms)
+            else:
+                lost += 1
+        result = summarize(f'bus {mode}: write -> event', latencies)
+        result['lost'] = lost
+        results.append(result)
+
+        # Process khác ghi (mô phỏng bằng ghi trực tiếp + publish như models.Menu.invalidate):
+        # cache của process này phải bị xóa
+        stale = 0
+        for i in range(min(iterations, 50)):
+            Menu.find_by_restaurant(str(rest_id), {'status': 'available'})
+            arrived.clear()
+            db.menus.update_one({'_id': menu_id}, {'$set': {'price': 1000 + i}})
+            invalidation.publish('menus', str(menu_id), {'rest_ids': [str(rest_id)]})
+            arrived.wait(timeout)
+            menus = Menu.find_by_restaurant(str(rest_id), {'status': 'available'})
+            if menus[0]['price'] != 1000 + i:
+                stale += 1
+        print(f"Đọc cũ sau khi process khác ghi: {stale}, cache: {catalog_cache.stats()}")
+
+        db.menus.delete_one({'_id': menu_id})
+        db.restaurants.delete_one({'_id': rest_id})
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark bus xóa cache giữa các process')
+    parser.add_argument('--iterations', type=int, default=100, help='Số lần ghi')
+    parser.add_argument('--timeout', type=float, default=10.0, help='Thời gian chờ tối đa mỗi event (giây)')
+    parser.add_argument('--mode', choices=['auto', 'change_stream', 'poll'], default=None,
+                        help='Ép chế độ của bus (mặc định theo CACHE_BUS_MODE)')
+    parser.add_argument('--output', default=None, help='File JSON lưu kết quả')
+    args = parser.parse_args()
+
+    print_report(run(args.iterations, args.timeout, args.mode), args.output)
@@ -0,0 +1,127 @@
+"""
+Công cụ phát lại IPN VnPay: gửi từng đợt callback đã ký (kèm bản gửi lại trùng) tới /customer/payment/vnpay_ipn
+để đo throughput/độ trễ và kiểm tra tính idempotent (mỗi payment chỉ chuyển pending -> success một lần).
+
+Chạy trong process qua Flask test client (cần MongoDB, database mặc định 'fastfood_bench'):
+    python -m benchmarks.ipn_replay --payments 2000 --repeat 3 --concurrency 16
+Hoặc bắn vào server đang chạy (server và tool phải dùng cùng database và VNPAY_HASH_SECRET):
+    python -m benchmarks.ipn_replay --url http://localhost:5000 --payments 2000
+"""
+import argparse
+import json
+import os
+import random
+import time
+import urllib.parse
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# Dùng database riêng cho benchmark để không ghi dữ liệu giả vào database thật
+os.environ.setdefault('MONGODB_DB', 'fastfood_bench')
+
+from datetime import datetime
+from bson import ObjectId
+from app import create_app
+from app.database import get_db
+from app.utils.vnpay import VnPay
+from benchmarks.common import summarize, print_report
+
+IPN_PATH = '/customer/payment/vnpay_ipn'
+
+def seed_pending_payments(count, amount=115000):
+    """
+    Tạo count đơn hàng + payment VnPay đang pending
+    Trả về: Danh sách txn_ref
+    """
+    db = get_db()
+    now = datetime.now()
+    orders = [{'_id': ObjectId(), 'user_id': ObjectId(), 'rest_id': ObjectId(), 'items': [],
+               'total': amount, 'delivery_fee': 15000, 'status': 'pending', 'shipper_id': None,
+               'created_at': now} for _ in range(count)]
+    db.orders.insert_many(orders, ordered=False)
+    payments = []
+    for order in orders:
+        payments.append({'order_id': order['_id'], 'method': 'vnpay', 'amount': amount, 'status': 'pending',
+                         'paid_at': None, 'txn_ref': VnPay.make_txn_ref(order['_id']) + str(random.randint(0, 9)),
+                         'created_at': now})
+    db.payments.insert_many(payments, ordered=False)
+    return [p['txn_ref'] for p in payments]
+
+def signed_callback(vnpay, txn_ref, amount, response_code='00'):
+    """Tạo query string IPN đã ký giống VnPay gửi về"""
+    params = {
+        'vnp_Amount': str(int(amount * 100)),
+        'vnp_BankCode': 'NCB',
+        'vnp_OrderInfo': 'Replay',
+        'vnp_PayDate': datetime.now().strftime('%Y%m%d%H%M%S'),
+        'vnp_ResponseCode': response_code,
+        'vnp_TmnCode': vnpay.tmn_code,
+        'vnp_TransactionNo': str(random.randint(10 ** 7, 10 ** 8)),
+        'vnp_TransactionStatus': response_code,
+        'vnp_TxnRef': txn_ref,
+    }
+    params['vnp_SecureHash'] = vnpay.sign(params)
+    return urllib.parse.urlencode(params)
+
+def run(payments, repeat, concurrency, url=None):
+    """Seed dữ liệu, gửi callback theo đợt và trả về (kết quả, thống kê kiểm tra)"""
+    app = create_app()
+    with app.app_context():
+        vnpay = VnPay()
+        txn_refs = seed_pending_payments(payments)
+        jobs_before = get_db().jobs.count_documents({'name': 'revenue.update'})
+        # Mỗi payment được gửi repeat lần, xáo trộn để bản trùng đến xen kẽ như VnPay retry
+        queries = [signed_callback(vnpay, ref, 115000) for ref in txn_refs for _ in range(repeat)]
+        random.shuffle(queries)
+
+    def send_http(query):
+        start = time.perf_counter()
+        with urllib.request.urlopen(f"{url}{IPN_PATH}?{query}") as response:
+            body = json.loads(response.read())
+        return body['RspCode'], (time.perf_counter() - start) * 1000
+
+    clients = {}
+
+    def send_local(query):
+        # Mỗi thread dùng một test client riêng
+        import threading
+        client = clients.setdefault(threading.get_ident(), app.test_client())
+        start = time.perf_counter()
+        response = client.get(f"{IPN_PATH}?{query}")
+        return response.get_json()['RspCode'], (time.perf_counter() - start) * 1000
+
+    send = send_http if url else send_local
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        responses = list(pool.map(send, queries))
+    wall = time.perf_counter() - wall_start
+
+    codes = Counter(code for code, _ in responses)
+    result = summarize('vnpay_ipn_replay', [elapsed for _, elapsed in responses])
+    result['requests_per_sec'] = round(len(queries) / wall, 1)
+    result['rsp_codes'] = dict(codes)
+
+    with app.app_context():
+        db = get_db()
+        checks = {
+            'payments_success': db.payments.count_documents({'txn_ref': {'$in': txn_refs}, 'status': 'success'}),
+            'revenue_jobs_enqueued': db.jobs.count_documents({'name': 'revenue.update'}) - jobs_before,
+            'expected': payments,
+        }
+    return [result], checks
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Phát lại IPN VnPay đã ký theo đợt')
+    parser.add_argument('--payments', type=int, default=1000, help='Số payment pending cần tạo')
+    parser.add_argument('--repeat', type=int, default=3, help='Số lần gửi mỗi callback (mô phỏng VnPay retry)')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--url', default=None, help='Gửi HTTP tới server này thay vì dùng test client')
+    parser.add_argument('--output', default=None, help='File JSON để lưu kết quả')
+    args = parser.parse_args()
+
+    results, checks = run(args.payments, args.repeat, args.concurrency, args.url)
+    print_report(results, args.output)
+    print(f"Kiểm tra idempotent: {checks}")
+    if checks['payments_success'] != checks['expected']:
+        raise SystemExit('Số payment success không khớp số payment đã tạo')
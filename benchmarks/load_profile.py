@@ -0,0 +1,141 @@
+"""
+Profile tải cho server production: requests/giây theo số worker gunicorn
+Với mỗi số worker, khởi động gunicorn (gunicorn.conf.py, preload) trên một cổng riêng,
+tạo tải keep-alive lên các route công khai trong một khoảng thời gian cố định rồi dừng server.
+Kết quả mong đợi: req/s tăng gần tuyến tính đến khi số worker bằng số CPU (MongoDB chạy máy khác).
+
+Chạy (cần MongoDB và gunicorn, Linux/macOS):
+    python -m benchmarks.load_profile --workers 1,2,4,8 --duration 15 --output bench_load.json
+Bộ tạo tải dùng nhiều process (--clients) để chính nó không bị giới hạn bởi GIL;
+khi đo nên chạy bộ tạo tải trên máy khác hoặc chừa lại CPU cho nó.
+"""
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from benchmarks.common import summarize, print_report
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Các route không cần đăng nhập (trang chủ đọc catalog, form đăng nhập/đăng ký, file CSS)
+DEFAULT_ROUTES = ['/', '/login', '/register', '/static/css/style.css']
+
+def start_server(workers, threads, port):
+    """Khởi động gunicorn với số worker cho trước, chờ đến khi nhận request"""
+    env = dict(os.environ, WEB_WORKERS=str(workers), WEB_THREADS=str(threads),
+               WEB_BIND=f'127.0.0.1:{port}')
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                               cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('gunicorn dừng khi khởi động (kiểm tra MongoDB và gunicorn.conf.py)')
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/login')
+            conn.getresponse().read()
+            conn.close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('gunicorn không sẵn sàng sau 60 giây')
+
+def client_process(port, routes, connections, duration):
+    """
+    Một process tạo tải: mỗi thread giữ một kết nối keep-alive và lần lượt gọi các route
+    Trả về: Tuple (danh sách thời gian ms, số lỗi)
+    """
+    samples = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def loop(offset):
+        local = []
+        failed = 0
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        i = offset
+        while time.monotonic() < stop_at:
+            path = routes[i % len(routes)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 500:
+                    failed += 1
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                continue
+            local.append((time.perf_counter() - start) * 1000)
+        conn.close()
+        with lock:
+            samples.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=loop, args=(n,)) for n in range(connections)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples, errors[0]
+
+def run_load(port, routes, concurrency, clients, duration):
+    """Chạy tải từ nhiều process, trả về (tất cả mẫu thời gian, số lỗi, thời gian thực)"""
+    per_client = max(1, concurrency // clients)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=clients) as pool:
+        futures = [pool.submit(client_process, port, routes, per_client, duration) for _ in range(clients)]
+        results = [f.result() for f in futures]
+    elapsed = time.perf_counter() - start
+    samples = [ms for part, _ in results for ms in part]
+    return samples, sum(errors for _, errors in results), elapsed
+
+def run(worker_counts, threads, routes, concurrency, clients, duration, port):
+    """Đo lần lượt từng số worker và trả về danh sách kết quả"""
+    results = []
+    for workers in worker_counts:
+        process = start_server(workers, threads, port)
+        try:
+            # Làm nóng: fragment cache, manifest, kết nối MongoDB của mọi worker
+            run_load(port, routes, concurrency, clients, 2)
+            samples, errors, elapsed = run_load(port, routes, concurrency, clients, duration)
+        finally:
+            process.terminate()
+            process.wait(timeout=60)
+        result = summarize(f'gunicorn workers={workers}', samples)
+        result['rps'] = round(len(samples) / elapsed, 1)
+        result['errors'] = errors
+        results.append(result)
+    # Hệ số tăng so với cấu hình đầu tiên (thường là 1 worker)
+    base = results[0]['rps'] if results else 0
+    for result in results:
+        result['speedup'] = round(result['rps'] / base, 2) if base else 0.0
+    return results
+
+if __name__ == '__main__':
+    cpus = os.cpu_count() or 1
+    default_workers = sorted({1, 2, 4, cpus} & set(range(1, cpus + 1)))
+    parser = argparse.ArgumentParser(description='Profile tải req/s theo số worker gunicorn')
+    parser.add_argument('--workers', default=','.join(map(str, default_workers)), help='Danh sách số worker, ví dụ 1,2,4,8')
+    parser.add_argument('--threads', type=int, default=4, help='Số thread mỗi worker')
+    parser.add_argument('--routes', default=','.join(DEFAULT_ROUTES), help='Các route GET, cách nhau bởi dấu phẩy')
+    parser.add_argument('--concurrency', type=int, default=64, help='Tổng số kết nối đồng thời')
+    parser.add_argument('--clients', type=int, default=max(1, cpus // 2), help='Số process tạo tải')
+    parser.add_argument('--duration', type=float, default=15, help='Thời gian đo mỗi cấu hình (giây)')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--output', default=None, help='File JSON lưu kết quả')
+    args = parser.parse_args()
+
+    worker_counts = [int(n) for n in args.workers.split(',') if n]
+    routes = [r for r in args.routes.split(',') if r]
+    print(f"Routes: {routes}, {args.concurrency} kết nối, {args.duration}s mỗi cấu hình, {cpus} CPU")
+    print_report(run(worker_counts, args.threads, routes, args.concurrency, args.clients,
+                     args.duration, args.port), args.output)
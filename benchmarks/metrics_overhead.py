@@ -0,0 +1,53 @@
+"""
+Benchmark chi phí của metrics (app/utils/metrics.py) trên mỗi request và thời gian xuất /metrics
+Không cần MongoDB:
+    python -m benchmarks.metrics_overhead --requests 20000
+Thoát với mã 1 nếu chi phí mỗi request vượt --budget-us
+"""
+import argparse
+import sys
+import time
+
+from flask import Response
+
+from app import create_app
+from app.utils import metrics
+from benchmarks.common import timed, summarize, print_report
+
+def run(requests, budget_us):
+    """Đo before_request + after_request của metrics và thời gian render; trả về (kết quả, đạt ngân sách)"""
+    app = create_app(lazy_db=True)
+    results = []
+    with app.test_request_context('/login'):
+        response = Response('ok')
+        samples = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            metrics.start_request()
+            metrics.finish_request(response)
+            samples.append((time.perf_counter() - start) * 1000)
+        results.append(summarize('metrics hooks / request', samples))
+        # Mỗi lệnh MongoDB: observer của query_stats
+        from app.utils.query_stats import CommandRecord
+        record = CommandRecord('find', 'menus', 'find menus {_id:?}', 1.2, True, {}, 'main.index', 'fastfood')
+        samples = [timed(metrics.observe_command, record)[1] for _ in range(requests)]
+        results.append(summarize('metrics / mongo command', samples))
+        samples = [timed(metrics.render)[1] for _ in range(200)]
+        results.append(summarize('render /metrics', samples))
+    per_request_us = results[0]['mean_ms'] * 1000
+    return results, per_request_us <= budget_us
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark chi phí metrics mỗi request')
+    parser.add_argument('--requests', type=int, default=20000, help='Số request giả lập')
+    parser.add_argument('--budget-us', type=float, default=20.0,
+                        help='Chi phí tối đa mỗi request (µs, gồm cả truy cập flask.g/request)')
+    parser.add_argument('--output', default=None, help='File JSON lưu kết quả')
+    args = parser.parse_args()
+
+    results, ok = run(args.requests, args.budget_us)
+    print_report(results, args.output)
+    if not ok:
+        print(f"❌ Vượt ngân sách {args.budget_us}µs mỗi request")
+        sys.exit(1)
+    print("✅ Trong ngân sách")
@@ -0,0 +1,250 @@
+"""
+Plugin pytest kiểm tra ngân sách truy vấn MongoDB của từng route: số lệnh và số byte MongoDB trả về mỗi request
+Mỗi route GET của blueprint main, customer, restaurant, shipper, admin là một test, chạy qua Flask test client
+với tài khoản đúng vai trò và cache trong process đã xóa (trường hợp xấu nhất, như ngay sau khi catalog đổi).
+Test thất bại khi vượt ngân sách khai báo trong benchmarks/query_budgets.json, hoặc khi một dạng lệnh lặp lại
+nhiều hơn "repeat" lần trong một request (vòng lặp N+1: find_by_id cho từng dòng).
+
+Cần dữ liệu từ benchmarks.datagen (database mặc định 'fastfood_bench'; ngân sách byte tính cho --scale 0.01):
+    python -m benchmarks.datagen --scale 0.01 --drop
+    python -m pytest -p benchmarks.query_budget benchmarks/query_budgets.json
+    python -m pytest -p benchmarks.query_budget benchmarks/query_budgets.json --query-budget-report budgets.json
+Route không có trong file dùng ngân sách "default"; route cần tham số không lấy được từ dataset bị skip.
+--query-budget-update ghi lại file ngân sách theo số đo hiện tại (sau khi đã tối ưu một route) và lưu vào "measured"
+commit, thời điểm và số document của dataset đã đo. Khi "measured" là null (ngân sách mới ước lượng, chưa đo),
+route vượt ngân sách được báo xfail thay vì thất bại: chạy --query-budget-update một lần để bắt đầu kiểm tra thật.
+"""
+import json
+import os
+
+# Dùng database riêng cho benchmark để không đọc/ghi database thật
+os.environ.setdefault('MONGODB_DB', 'fastfood_bench')
+
+import pytest
+from flask import url_for
+from pymongo.errors import ConnectionFailure
+
+from app import create_app
+from app.config import Config
+from app.database import get_db
+from app.utils.doc_cache import catalog_cache
+from app.utils.fragment_cache import get_fragment_cache
+from app.utils.query_stats import capture_queries
+from benchmarks.suite import metadata
+
+BUDGET_FILE = 'query_budgets.json'
+# Blueprint được kiểm tra -> vai trò đăng nhập khi gọi route (None: không đăng nhập)
+BLUEPRINTS = {
+    'main': None,
+    'customer': 'customer',
+    'restaurant': 'restaurant_owner',
+    'shipper': 'shipper',
+    'admin': 'admin',
+}
+# Ngân sách khi file không khai báo "default"
+DEFAULT_BUDGET = {'commands': 8, 'repeat': 3, 'bytes': 256 * 1024}
+
+class BudgetConfig(Config):
+    """Cấu hình đo: không có snapshot catalog, đọc lại version catalog mỗi request, không có thread nền"""
+    TESTING = True
+    CATALOG_SNAPSHOT_DIR = ''
+    CATALOG_VERSION_TTL = 0
+    CACHE_BUS_MODE = 'off'
+    SLOW_QUERY_MS = 0
+
+class BudgetExceeded(Exception):
+    """Route vượt ngân sách truy vấn"""
+
+def pytest_addoption(parser):
+    group = parser.getgroup('query_budget', 'ngân sách truy vấn MongoDB theo route')
+    group.addoption('--query-budget-report', default=None, help='File JSON lưu số đo của từng route')
+    group.addoption('--query-budget-update', action='store_true',
+                    help='Ghi lại file ngân sách theo số đo (commands chính xác, bytes x1.5)')
+
+_state_key = pytest.StashKey()
+
+def pytest_configure(config):
+    config.stash[_state_key] = {'app': None, 'fixtures': None, 'error': None, 'results': {}, 'files': []}
+
+def pytest_collect_file(file_path, parent):
+    if file_path.name == BUDGET_FILE:
+        return BudgetFile.from_parent(parent, path=file_path)
+
+def load_fixtures(db):
+    """
+    Chọn tài khoản và ID cho tham số route từ dataset
+    Trả về: Dictionary vai trò -> {'user_id': ..., tên tham số route: giá trị}
+    """
+    fixtures = {}
+    admin = db.users.find_one({'role': 'admin'}, {'_id': 1})
+    if admin:
+        any_order = db.orders.find_one({}, {'_id': 1}, sort=[('_id', -1)])
+        fixtures['admin'] = {'user_id': admin['_id'], 'order_id': any_order and any_order['_id']}
+    # Khách hàng có nhiều đánh giá nhất trong các đánh giá gần đây (trang reviews lớn nhất)
+    top = list(db.reviews.aggregate([
+        {'$sort': {'_id': -1}}, {'$limit': 20000},
+        {'$group': {'_id': '$user_id', 'n': {'$sum': 1}}}, {'$sort': {'n': -1}}, {'$limit': 1}]))
+    customer_id = top[0]['_id'] if top else (db.users.find_one({'role': 'customer'}, {'_id': 1}) or {}).get('_id')
+    if customer_id:
+        order = db.orders.find_one({'user_id': customer_id}, {'_id': 1})
+        restaurant = db.restaurants.find_one({'status': 'approved'}, {'_id': 1})
+        fixtures['customer'] = {'user_id': customer_id, 'order_id': order and order['_id'],
+                                'rest_id': restaurant and restaurant['_id']}
+    restaurant = db.restaurants.find_one({'status': 'approved', 'owner_id': {'$ne': None}}, {'owner_id': 1})
+    if restaurant:
+        menu = db.menus.find_one({'rest_id': restaurant['_id']}, {'_id': 1})
+        fixtures['restaurant_owner'] = {'user_id': restaurant['owner_id'], 'rest_id': restaurant['_id'],
+                                        'menu_id': menu and menu['_id']}
+    order = db.orders.find_one({'shipper_id': {'$ne': None}}, {'shipper_id': 1}, sort=[('_id', -1)])
+    if order:
+        fixtures['shipper'] = {'user_id': order['shipper_id'], 'order_id': order['_id']}
+    return fixtures
+
+def session_state(config):
+    """App và dữ liệu dùng chung cho cả phiên test (tạo ở test đầu tiên, lỗi kết nối chỉ chờ một lần)"""
+    state = config.stash[_state_key]
+    if isinstance(state['error'], ConnectionFailure):
+        pytest.skip(f"không kết nối được MongoDB ({state['app'].config['MONGODB_DB']})")
+    if state['error'] is not None:
+        raise state['error']
+    if state['fixtures'] is None:
+        try:
+            with state['app'].app_context():
+                # Lần gọi get_db() đầu tiên kết nối và tạo index, không tính vào request nào
+                state['fixtures'] = load_fixtures(get_db())
+        except Exception as e:
+            state['error'] = e
+            return session_state(config)
+    if not state['fixtures']:
+        pytest.skip("dataset trống, chạy: python -m benchmarks.datagen --scale 0.01 --drop")
+    return state
+
+class BudgetFile(pytest.File):
+    """File ngân sách: mỗi route GET của các blueprint trong BLUEPRINTS là một test"""
+
+    def collect(self):
+        with open(self.path, encoding='utf-8') as f:
+            declared = json.load(f)
+        default = dict(DEFAULT_BUDGET, **declared.get('default', {}))
+        routes = declared.get('routes', {})
+        measured = bool(declared.get('measured'))
+        state = self.config.stash[_state_key]
+        if state['app'] is None:
+            state['app'] = create_app(BudgetConfig, lazy_db=True)
+        state['files'].append((self.path, declared))
+        rules = sorted(state['app'].url_map.iter_rules(), key=lambda rule: rule.endpoint)
+        for rule in rules:
+            blueprint = rule.endpoint.split('.', 1)[0]
+            if blueprint not in BLUEPRINTS or 'GET' not in rule.methods:
+                continue
+            budget = dict(default, **routes.get(rule.endpoint, {}))
+            yield RouteItem.from_parent(self, name=rule.endpoint, rule=rule, budget=budget,
+                                        role=BLUEPRINTS[blueprint], measured=measured)
+
+class RouteItem(pytest.Item):
+    """Một route: gọi một lần, so số lệnh / số byte / số lần lặp của mỗi dạng lệnh với ngân sách"""
+
+    def __init__(self, *, rule, budget, role, measured, **kwargs):
+        super().__init__(**kwargs)
+        self.rule = rule
+        self.budget = budget
+        self.role = role
+        self.measured = measured
+
+    def runtest(self):
+        state = session_state(self.config)
+        app = state['app']
+        values = state['fixtures'].get(self.role, {}) if self.role else {}
+        if self.role and not values.get('user_id'):
+            pytest.skip(f"dataset không có tài khoản {self.role}")
+        missing = [arg for arg in self.rule.arguments if not values.get(arg)]
+        if missing:
+            pytest.skip(f"dataset không có giá trị cho {', '.join(sorted(missing))}")
+        with app.test_request_context():
+            path = url_for(self.rule.endpoint, **{arg: str(values[arg]) for arg in self.rule.arguments})
+        client = app.test_client()
+        if self.role:
+            with client.session_transaction() as sess:
+                sess['user_id'] = str(values['user_id'])
+                sess['user_role'] = self.role
+                sess['user_name'] = 'Budget'
+        with app.app_context():
+            catalog_cache.clear()
+            get_fragment_cache().clear()
+
+        with capture_queries(self.name, measure_bytes=True) as stats:
+            response = client.get(path)
+        repeated = stats.repeated(self.budget['repeat']) if self.budget.get('repeat') is not None else []
+        state['results'][self.name] = {
+            'path': path,
+            'status': response.status_code,
+            'commands': stats.count,
+            'bytes': stats.bytes,
+            'mongo_ms': round(stats.total_ms, 3),
+            'repeated': [f"{shape} x{n}" for shape, n in repeated],
+            'budget': self.budget,
+        }
+
+        location = response.headers.get('Location', '')
+        if self.role and '/login' in location:
+            raise BudgetExceeded(f"{path}: bị chuyển về trang đăng nhập (session {self.role} không hợp lệ)")
+        problems = []
+        if stats.count > self.budget['commands']:
+            problems.append(f"{stats.count} lệnh MongoDB > ngân sách {self.budget['commands']}")
+        if self.budget.get('bytes') is not None and stats.bytes > self.budget['bytes']:
+            problems.append(f"{stats.bytes:,} byte MongoDB trả về > ngân sách {self.budget['bytes']:,}")
+        for shape, n in repeated:
+            problems.append(f"N+1: '{shape}' chạy {n} lần (tối đa {self.budget['repeat']})")
+        if problems and not self.measured:
+            pytest.xfail("ngân sách ước lượng, chưa đo (chạy --query-budget-update): " + '; '.join(problems))
+        if problems:
+            raise BudgetExceeded(f"GET {path} ({response.status_code}):\n  " + '\n  '.join(problems))
+
+    def repr_failure(self, excinfo):
+        if isinstance(excinfo.value, BudgetExceeded):
+            return str(excinfo.value)
+        return super().repr_failure(excinfo)
+
+    def reportinfo(self):
+        return self.path, None, f"query budget: {self.name}"
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    results = config.stash[_state_key]['results']
+    if not results:
+        return
+    terminalreporter.section('ngân sách truy vấn MongoDB')
+    for path, declared in config.stash[_state_key]['files']:
+        if not declared.get('measured'):
+            terminalreporter.write_line(f"⚠️  {path}: ngân sách chưa đo, vượt ngân sách chỉ báo xfail "
+                                        f"(chạy --query-budget-update)")
+    for endpoint, result in sorted(results.items()):
+        budget = result['budget']
+        bytes_budget = f"{budget['bytes'] / 1024:.0f}" if budget.get('bytes') is not None else '-'
+        terminalreporter.write_line(
+            f"{endpoint:<32} {result['status']:>3} lệnh {result['commands']:>3}/{budget['commands']:<3} "
+            f"KB {result['bytes'] / 1024:>8.1f}/{bytes_budget:<6} {result['mongo_ms']:>8.1f}ms")
+    output = config.getoption('query_budget_report')
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        terminalreporter.write_line(f"Đã lưu kết quả vào {output}")
+    if config.getoption('query_budget_update'):
+        with config.stash[_state_key]['app'].app_context():
+            run = metadata(1, None)
+        measured = {key: run[key] for key in ('created_at', 'commit', 'database', 'dataset')}
+        for path, declared in config.stash[_state_key]['files']:
+            update_budgets(declared, results)
+            declared['measured'] = measured
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(declared, f, indent=2, ensure_ascii=False)
+                f.write('\n')
+            terminalreporter.write_line(f"Đã cập nhật ngân sách trong {path}")
+
+def update_budgets(declared, results):
+    """Đặt ngân sách của các route đã đo theo số đo: số lệnh chính xác, số byte x1.5 (làm tròn KB)"""
+    routes = declared.setdefault('routes', {})
+    for endpoint, result in results.items():
+        budget = routes.setdefault(endpoint, {})
+        budget['commands'] = result['commands']
+        if budget.get('bytes', 0) is not None:
+            budget['bytes'] = max(1024, -(-int(result['bytes'] * 1.5) // 1024) * 1024)
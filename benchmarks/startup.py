@@ -0,0 +1,110 @@
+"""
+Benchmark thời gian khởi động (cold start) và ngân sách import
+- import: chạy 'python -X importtime -c "import app"' trong process mới, tổng thời gian import
+  và các module tốn thời gian nhất
+- boot: mỗi lần chạy là một process mới (như một worker gunicorn không preload): import app,
+  create_app(lazy_db=True) và request đầu tiên tới /login; chế độ script đo create_app(web=False)
+Không cần MongoDB (khởi tạo trễ, /login không truy vấn database).
+
+Chạy:
+    python -m benchmarks.startup --runs 10 --import-budget-ms 350 --boot-budget-ms 600 --output bench_startup.json
+Thoát với mã 1 nếu p50 vượt ngân sách (dùng được làm bước kiểm tra trong CI).
+"""
+import argparse
+import json
+import subprocess
+import sys
+from benchmarks.common import summarize, print_report
+
+# Đoạn code chạy trong process mới, in thời gian từng giai đoạn dạng JSON
+BOOT_SCRIPT = r"""
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app(web=(sys.argv[1] == 'web'), lazy_db=True)
+created = time.perf_counter()
+if sys.argv[1] == 'web':
+    status = app.test_client().get('/login').status_code
+    assert status == 200, status
+served = time.perf_counter()
+print(json.dumps({'import_ms': (imported - start) * 1000, 'create_ms': (created - imported) * 1000,
+                  'first_request_ms': (served - created) * 1000, 'total_ms': (served - start) * 1000}))
+"""
+
+def import_profile(top=10):
+    """
+    Chạy python -X importtime và phân tích kết quả
+    Trả về: Tuple (tổng thời gian import app tính bằng ms, danh sách (module, thời gian tự thân ms) lớn nhất)
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                            capture_output=True, text=True, check=True)
+    total_us = 0
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        name = name.rstrip()
+        modules.append((name.strip(), int(self_us) / 1000))
+        # Dòng của module cấp cao nhất 'app' chứa thời gian tích lũy của cả cây import
+        if name.strip() == 'app' and not name.startswith('  '):
+            total_us = int(cumulative_us)
+    modules.sort(key=lambda m: m[1], reverse=True)
+    return total_us / 1000, modules[:top]
+
+def boot(mode):
+    """Một lần khởi động trong process mới; trả về dict thời gian các giai đoạn"""
+    result = subprocess.run([sys.executable, '-c', BOOT_SCRIPT, mode], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else 'boot failed')
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def run(runs, import_budget_ms, boot_budget_ms):
+    """Chạy các kịch bản, trả về (danh sách kết quả, danh sách ngân sách bị vượt)"""
+    results = []
+    violations = []
+
+    import_samples = []
+    top_modules = []
+    for _ in range(runs):
+        total_ms, top_modules = import_profile()
+        import_samples.append(total_ms)
+    result = summarize('import app (-X importtime)', import_samples)
+    result['budget_ms'] = import_budget_ms
+    results.append(result)
+    if result['p50_ms'] > import_budget_ms:
+        violations.append(result['name'])
+
+    for mode in ('web', 'script'):
+        phases = [boot(mode) for _ in range(runs)]
+        for phase in ('import_ms', 'create_ms', 'first_request_ms'):
+            if mode == 'script' and phase == 'first_request_ms':
+                continue
+            results.append(summarize(f'boot {mode}: {phase[:-3]}', [p[phase] for p in phases]))
+        result = summarize(f'boot {mode}: total', [p['total_ms'] for p in phases])
+        if mode == 'web':
+            result['budget_ms'] = boot_budget_ms
+            if result['p50_ms'] > boot_budget_ms:
+                violations.append(result['name'])
+        results.append(result)
+
+    print('Module import chậm nhất (thời gian tự thân):')
+    for name, ms in top_modules:
+        print(f"  {ms:8.2f}ms  {name}")
+    return results, violations
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark thời gian khởi động')
+    parser.add_argument('--runs', type=int, default=10, help='Số lần chạy mỗi kịch bản')
+    parser.add_argument('--import-budget-ms', type=float, default=350, help='Ngân sách p50 cho import app')
+    parser.add_argument('--boot-budget-ms', type=float, default=600, help='Ngân sách p50 cho boot web đến request đầu tiên')
+    parser.add_argument('--output', default=None, help='File JSON lưu kết quả')
+    args = parser.parse_args()
+
+    results, violations = run(args.runs, args.import_budget_ms, args.boot_budget_ms)
+    print_report(results, args.output)
+    if violations:
+        print(f"❌ Vượt ngân sách: {', '.join(violations)}")
+        sys.exit(1)
+    print("✅ Trong ngân sách")
@@ -0,0 +1,247 @@
+"""
+Bộ benchmark các kịch bản chính qua blueprint thật (Flask test client, cùng process với app):
+browse (trang chủ, danh sách và chi tiết nhà hàng), add_to_cart, checkout (tiền mặt),
+shipper_claim (tài xế nhận đơn) và review (đánh giá đơn đã hoàn thành).
+Mỗi kịch bản ghi p50/p99/mean, số request lỗi và số lệnh MongoDB trung bình mỗi request;
+báo cáo JSON (kèm commit, database, số document) dùng để so sánh giữa các lần chạy.
+
+Cần dữ liệu từ benchmarks.datagen trong cùng database (mặc định 'fastfood_bench'):
+    python -m benchmarks.datagen --scale 0.01 --drop
+    python -m benchmarks.suite --iterations 200 --output bench_suite.json
+    python -m benchmarks.suite --baseline bench_suite.json --tolerance 0.2
+Với --baseline: thoát với mã 1 nếu p50 của kịch bản nào chậm hơn baseline quá --tolerance
+hoặc số lệnh MongoDB mỗi request tăng. Đo throughput qua HTTP thật: benchmarks.load_profile.
+
+Nhận đơn và đánh giá được hoàn tác sau mỗi lần đo (dataset không đổi giữa các lần chạy);
+đơn tạo bởi checkout được giữ lại như đơn chờ nhận mới.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+from datetime import datetime
+
+# Dùng database riêng cho benchmark để không ghi dữ liệu giả vào database thật
+os.environ.setdefault('MONGODB_DB', 'fastfood_bench')
+
+from app import create_app
+from app.database import get_db
+from app.utils.cart import snapshot_menu
+from app.utils.query_stats import capture_queries
+from benchmarks.common import timed, summarize, print_report
+
+# Số lần chạy thử trước khi đo (nạp cache, snapshot catalog, kết nối)
+WARMUP = 10
+
+def sample_ids(collection, match, size):
+    """Lấy ngẫu nhiên size _id thỏa match ($sample, không quét cả collection khi size nhỏ)"""
+    return [doc['_id'] for doc in collection.aggregate([
+        {'$match': match}, {'$sample': {'size': size}}, {'$project': {'_id': 1}}])]
+
+def load_fixtures(size):
+    """
+    Chọn dữ liệu cho các kịch bản từ dataset
+    Trả về: Dictionary: restaurants (có món đang bán), menus theo nhà hàng, customers, shippers (online),
+            pending (đơn chờ nhận), completed (đơn hoàn thành chưa đánh giá)
+    """
+    db = get_db()
+    restaurants = sample_ids(db.restaurants, {'status': 'approved'}, size)
+    menus = {}
+    for menu in db.menus.find({'rest_id': {'$in': restaurants}, 'status': 'available'},
+                              {'rest_id': 1, 'name': 1, 'price': 1, 'cat': 1}):
+        menus.setdefault(menu['rest_id'], []).append(menu)
+    completed = list(db.orders.find({'status': 'completed'}, {'user_id': 1, 'items': 1, 'shipper_id': 1})
+                     .sort('_id', -1).limit(size * 2))
+    reviewed = {r['order_id'] for r in db.reviews.find({'order_id': {'$in': [o['_id'] for o in completed]}},
+                                                       {'order_id': 1})}
+    fixtures = {
+        'restaurants': [rest_id for rest_id in restaurants if rest_id in menus],
+        'menus': menus,
+        'customers': sample_ids(db.users, {'role': 'customer'}, size),
+        'shippers': [u['_id'] for u in db.users.find(
+            {'role': 'shipper', 'status': {'$in': ['active', 'approved']}, 'is_online': True}, {'_id': 1}).limit(size)],
+        'pending': [o['_id'] for o in db.orders.find({'status': 'pending', 'shipper_id': None}, {'_id': 1}).limit(size)],
+        'completed': [o for o in completed if o['_id'] not in reviewed][:size],
+    }
+    missing = [name for name, values in fixtures.items() if not values]
+    if missing:
+        raise SystemExit(f"❌ Dataset thiếu dữ liệu cho: {', '.join(missing)} (chạy python -m benchmarks.datagen trước)")
+    return fixtures
+
+def login(client, user_id, role):
+    """Ghi session đăng nhập giống auth.login"""
+    with client.session_transaction() as sess:
+        sess['user_id'] = str(user_id)
+        sess['user_role'] = role
+        sess['user_name'] = 'Bench'
+
+def session_value(client, key):
+    with client.session_transaction() as sess:
+        return sess.get(key)
+
+# Mỗi kịch bản: hàm nhận (app, fixtures, rng) và trả về một bước đo gồm
+#   client, method, path, data (form), check(response, client) -> bool, cleanup() (chạy ngoài thời gian đo)
+
+def browse(app, fixtures, rng):
+    client = app.test_client()
+    login(client, rng.choice(fixtures['customers']), 'customer')
+    path = rng.choice(['/', '/customer/restaurants', f"/customer/restaurant/{rng.choice(fixtures['restaurants'])}"])
+    return client, 'GET', path, None, lambda response, c: response.status_code == 200, None
+
+def add_to_cart(app, fixtures, rng):
+    client = app.test_client()
+    login(client, rng.choice(fixtures['customers']), 'customer')
+    rest_id = rng.choice(fixtures['restaurants'])
+    menu = rng.choice(fixtures['menus'][rest_id])
+    data = {'menu_id': str(menu['_id']), 'quantity': rng.randint(1, 3), 'rest_id': str(rest_id)}
+    return client, 'POST', '/customer/cart/add', data, lambda response, c: bool(session_value(c, 'cart')), None
+
+def checkout(app, fixtures, rng):
+    client = app.test_client()
+    login(client, rng.choice(fixtures['customers']), 'customer')
+    rest_id = rng.choice(fixtures['restaurants'])
+    menus = rng.sample(fixtures['menus'][rest_id], min(3, len(fixtures['menus'][rest_id])))
+    with client.session_transaction() as sess:
+        sess['cart'] = {str(menu['_id']): rng.randint(1, 2) for menu in menus}
+        sess['cart_meta'] = {'rest_id': str(rest_id),
+                             'items': {str(menu['_id']): snapshot_menu(menu) for menu in menus}}
+    data = {'delivery_address': 'Bench', 'payment_method': 'cash'}
+    return (client, 'POST', '/customer/checkout', data,
+            lambda response, c: '/customer/order/' in response.headers.get('Location', ''), None)
+
+def shipper_claim(app, fixtures, rng):
+    client = app.test_client()
+    login(client, rng.choice(fixtures['shippers']), 'shipper')
+    order_id = rng.choice(fixtures['pending'])
+
+    def cleanup():
+        get_db().orders.update_one({'_id': order_id}, {'$set': {'status': 'pending', 'shipper_id': None}})
+    return (client, 'POST', f'/shipper/order/{order_id}/accept', None,
+            lambda response, c: '/shipper/order/' in response.headers.get('Location', ''), cleanup)
+
+def review(app, fixtures, rng):
+    order = rng.choice(fixtures['completed'])
+    client = app.test_client()
+    login(client, order['user_id'], 'customer')
+    data = {'restaurant_rating': rng.randint(1, 5), 'restaurant_comment': 'Bench'}
+    if order.get('shipper_id'):
+        data['driver_rating'] = rng.randint(1, 5)
+    for item in order.get('items', []):
+        data[f"menu_rating_{item['menu_id']}"] = rng.randint(1, 5)
+
+    def check(response, c):
+        return get_db().reviews.find_one({'order_id': order['_id']}, {'_id': 1}) is not None
+
+    def cleanup():
+        get_db().reviews.delete_many({'order_id': order['_id']})
+    return client, 'POST', f"/customer/order/{order['_id']}/review", data, check, cleanup
+
+SCENARIOS = {
+    'browse': browse,
+    'add_to_cart': add_to_cart,
+    'checkout': checkout,
+    'shipper_claim': shipper_claim,
+    'review': review,
+}
+
+def run_scenario(app, name, fixtures, iterations, rng):
+    """Chạy một kịch bản WARMUP + iterations lần; trả về kết quả summarize kèm errors và mongo_commands"""
+    step = SCENARIOS[name]
+    samples, errors, commands = [], 0, 0
+    for i in range(WARMUP + iterations):
+        client, method, path, data, check, cleanup = step(app, fixtures, rng)
+        with capture_queries(name) as stats:
+            response, elapsed = timed(client.open, path, method=method, data=data)
+        ok = response.status_code < 400 and check(response, client)
+        if cleanup:
+            cleanup()
+        if i < WARMUP:
+            continue
+        samples.append(elapsed)
+        errors += 0 if ok else 1
+        commands += stats.count
+    result = summarize(name, samples)
+    result['errors'] = errors
+    result['mongo_commands'] = round(commands / iterations, 2) if iterations else 0.0
+    return result
+
+def metadata(iterations, seed):
+    """Thông tin môi trường chạy (để biết hai báo cáo có so sánh được không)"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except OSError:
+        commit = None
+    db = get_db()
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit or None,
+        'database': db.name,
+        'python': platform.python_version(),
+        'iterations': iterations,
+        'seed': seed,
+        'dataset': {name: db[name].estimated_document_count()
+                    for name in ('users', 'restaurants', 'menus', 'orders', 'payments', 'reviews')},
+    }
+
+def compare(results, baseline, tolerance):
+    """
+    So sánh với báo cáo baseline
+    Trả về: List mô tả các kịch bản chậm hơn p50 * (1 + tolerance) hoặc gửi nhiều lệnh MongoDB hơn
+    """
+    previous = {result['name']: result for result in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        before = previous.get(result['name'])
+        if before is None:
+            continue
+        if result['p50_ms'] > before['p50_ms'] * (1 + tolerance):
+            regressions.append(f"{result['name']}: p50 {before['p50_ms']:.3f}ms -> {result['p50_ms']:.3f}ms")
+        if result['mongo_commands'] > before.get('mongo_commands', result['mongo_commands']) + 0.5:
+            regressions.append(f"{result['name']}: MongoDB {before['mongo_commands']} -> "
+                               f"{result['mongo_commands']} lệnh/request")
+        if result['errors'] > before.get('errors', 0):
+            regressions.append(f"{result['name']}: {result['errors']} request lỗi (trước: {before.get('errors', 0)})")
+    return regressions
+
+def run(scenarios, iterations, seed):
+    """Chạy các kịch bản; trả về báo cáo {meta, results}"""
+    app = create_app(lazy_db=True)
+    rng = random.Random(seed)
+    with app.app_context():
+        fixtures = load_fixtures(max(50, iterations))
+        results = [run_scenario(app, name, fixtures, iterations, rng) for name in scenarios]
+        return {'meta': metadata(iterations, seed), 'results': results}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark các kịch bản chính qua Flask test client')
+    parser.add_argument('--iterations', type=int, default=200, help='Số lần đo mỗi kịch bản')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Danh sách kịch bản, cách nhau bởi dấu phẩy')
+    parser.add_argument('--seed', type=int, default=42, help='Seed chọn dữ liệu')
+    parser.add_argument('--output', default=None, help='File JSON lưu báo cáo')
+    parser.add_argument('--baseline', default=None, help='Báo cáo JSON trước đó để so sánh')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Mức chậm hơn baseline cho phép (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Kịch bản không tồn tại: {', '.join(unknown)} (có: {', '.join(SCENARIOS)})")
+
+    report = run(names, args.iterations, args.seed)
+    print_report(report['results'])
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Đã lưu kết quả vào {args.output}")
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(report['results'], json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"❌ {line}")
+        if regressions:
+            sys.exit(1)
+        print("✅ Không có kịch bản nào chậm hơn baseline")
@@ -0,0 +1,105 @@
+"""
+Micro-benchmark ký/xác thực VnPay: so sánh cách cũ (hmac.new mỗi lần, sort + urlencode hai lần)
+với VnPaySigner (khóa HMAC chuẩn bị sẵn + copy(), encode một lượt).
+Không cần MongoDB hay app context. Kết quả in ra p50/p99 cho mỗi lô và số thao tác/giây.
+
+Chạy:
+    python -m benchmarks.vnpay_sign --ops 20000 --output bench_vnpay_sign.json
+"""
+import argparse
+import hashlib
+import hmac
+import urllib.parse
+from datetime import datetime
+
+from app.utils.vnpay import VnPay
+from benchmarks.common import timed, summarize, print_report
+
+CONFIG = {
+    'VNPAY_TMN_CODE': 'BENCH001',
+    'VNPAY_HASH_SECRET': 'BENCHSECRETBENCHSECRETBENCHSECRET',
+    'VNPAY_URL': 'https://sandbox.vnpayment.vn/paymentv2/vpcpay.html',
+    'VNPAY_RETURN_URL': 'http://localhost:5000/customer/payment/vnpay_return',
+}
+
+def legacy_sign(hash_secret, vnp_params):
+    """Cách ký trước khi có VnPaySigner"""
+    query_string = urllib.parse.urlencode(dict(sorted(vnp_params.items())))
+    return hmac.new(bytes(hash_secret, 'utf-8'), bytes(query_string, 'utf-8'), hashlib.sha512).hexdigest()
+
+def legacy_payment_url(vnpay, vnp_params):
+    """Phần ký + tạo URL của create_payment_url trước khi có VnPaySigner"""
+    vnp_params = dict(sorted({k: v for k, v in vnp_params.items() if v}.items()))
+    vnp_params['vnp_SecureHash'] = legacy_sign(vnpay.hash_secret, vnp_params)
+    return vnpay.url + '?' + urllib.parse.urlencode(vnp_params)
+
+def legacy_verify(hash_secret, request_data):
+    """Phần xác thực chữ ký của verify_payment trước khi có VnPaySigner"""
+    vnp_params = {k: v for k, v in request_data.items()
+                  if k.startswith('vnp_') and k not in ('vnp_SecureHash', 'vnp_SecureHashType')}
+    return hmac.compare_digest(request_data['vnp_SecureHash'].lower(), legacy_sign(hash_secret, vnp_params))
+
+def sample_params(vnpay, i):
+    """Tham số thanh toán điển hình (giống create_payment_url tạo ra)"""
+    return {
+        'vnp_Version': '2.1.0', 'vnp_Command': 'pay', 'vnp_TmnCode': vnpay.tmn_code,
+        'vnp_Amount': str(11500000 + i), 'vnp_CurrCode': 'VND', 'vnp_TxnRef': f"{12345678 + i}65f0c0ffee",
+        'vnp_OrderInfo': f"Don hang {i:08d}", 'vnp_OrderType': 'other', 'vnp_Locale': 'vn',
+        'vnp_ReturnUrl': vnpay.return_url, 'vnp_IpAddr': '127.0.0.1',
+        'vnp_CreateDate': datetime(2024, 1, 1).strftime('%Y%m%d%H%M%S'),
+    }
+
+def sample_callback(vnpay, i):
+    """Query string IPN đã ký (dạng dict như request.args.to_dict())"""
+    params = {
+        'vnp_Amount': str(11500000 + i), 'vnp_BankCode': 'NCB', 'vnp_OrderInfo': f"Don hang {i:08d}",
+        'vnp_PayDate': '20240101120000', 'vnp_ResponseCode': '00', 'vnp_TmnCode': vnpay.tmn_code,
+        'vnp_TransactionNo': str(14000000 + i), 'vnp_TransactionStatus': '00',
+        'vnp_TxnRef': f"{12345678 + i}65f0c0ffee",
+    }
+    params['vnp_SecureHash'] = vnpay.sign(params)
+    return params
+
+def measure(name, func, inputs, batch):
+    """Chạy func trên inputs theo lô, mỗi mẫu là thời gian một lô"""
+    samples = []
+    for start in range(0, len(inputs), batch):
+        chunk = inputs[start:start + batch]
+        samples.append(timed(lambda: [func(x) for x in chunk])[1])
+    result = summarize(name, samples)
+    result['batch'] = batch
+    result['ops_per_sec'] = round(len(inputs) / (sum(samples) / 1000), 1)
+    return result
+
+def run(ops, batch):
+    """Chạy các kịch bản và trả về danh sách kết quả"""
+    vnpay = VnPay(CONFIG)
+    params = [sample_params(vnpay, i) for i in range(ops)]
+    callbacks = [sample_callback(vnpay, i) for i in range(ops)]
+
+    # Cách mới phải cho kết quả giống hệt cách cũ
+    assert vnpay.sign(params[0]) == legacy_sign(vnpay.hash_secret, params[0])
+    new_url = f"{vnpay.url}?{vnpay.signer.encode(params[0])}&vnp_SecureHash={vnpay.sign(params[0])}"
+    assert new_url == legacy_payment_url(vnpay, params[0])
+    assert vnpay.verify_payment(callbacks[0])['signature_valid'] and legacy_verify(vnpay.hash_secret, callbacks[0])
+
+    def signer_payment_url(p):
+        query_string = vnpay.signer.encode({k: v for k, v in p.items() if v})
+        return f"{vnpay.url}?{query_string}&vnp_SecureHash={vnpay.signer.digest(query_string)}"
+
+    return [
+        measure('legacy_sign', lambda p: legacy_sign(vnpay.hash_secret, p), params, batch),
+        measure('signer_sign', vnpay.sign, params, batch),
+        measure('legacy_payment_url', lambda p: legacy_payment_url(vnpay, p), params, batch),
+        measure('signer_payment_url', signer_payment_url, params, batch),
+        measure('legacy_ipn_verify', lambda c: legacy_verify(vnpay.hash_secret, c), callbacks, batch),
+        measure('verify_payment', vnpay.verify_payment, callbacks, batch),
+    ]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Micro-benchmark ký/xác thực VnPay')
+    parser.add_argument('--ops', type=int, default=20000, help='Số thao tác mỗi kịch bản')
+    parser.add_argument('--batch', type=int, default=100, help='Số thao tác mỗi mẫu đo')
+    parser.add_argument('--output', default=None, help='File JSON để lưu kết quả')
+    args = parser.parse_args()
+    print_report(run(args.ops, args.batch), args.output)
@@ -0,0 +1,20 @@
+"""
+Script dựng snapshot catalog (nhà hàng đã duyệt + món đang bán) cho version catalog hiện tại
+Web server tự dựng khi version đổi; chạy script này khi deploy để request đầu tiên đã có snapshot
+Chạy: python build_catalog_snapshot.py
+"""
+import os
+from app import create_app
+from app.utils.catalog_snapshot import build_snapshot, CatalogSnapshot
+
+app = create_app(web=False, lazy_db=True)
+
+with app.app_context():
+    directory = app.config.get('CATALOG_SNAPSHOT_DIR')
+    if not directory:
+        print("⚠️  CATALOG_SNAPSHOT_DIR đang để trống (snapshot bị tắt)")
+    else:
+        path = build_snapshot(directory)
+        snapshot = CatalogSnapshot(path)
+        print(f"✅ Đã dựng snapshot version {snapshot.version}: {snapshot.restaurant_count} nhà hàng, "
+              f"{snapshot.menu_count} món, {os.path.getsize(path) / 1024:.1f} KB -> {path}")
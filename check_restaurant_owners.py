@@ -5,7 +5,7 @@ from app import create_app
 from app.database import get_db
 from app.models import User, Restaurant
 
-app = create_app()
+app = create_app(web=False, lazy_db=True)
 
 with app.app_context():
     db = get_db()
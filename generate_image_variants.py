@@ -0,0 +1,31 @@
+"""
+Script tạo bản thu nhỏ (thumb/card/full, WebP + JPEG) cho ảnh món ăn và ảnh đánh giá đã upload trước đây
+Chỉ đưa job vào hàng đợi, worker.py sẽ xử lý (hoặc chạy ngay nếu JOB_RUN_INLINE=1)
+Chạy: python generate_image_variants.py
+"""
+from app import create_app
+from app.database import get_db
+from app.utils.jobs import enqueue_many
+
+app = create_app(web=False, lazy_db=True)
+
+with app.app_context():
+    db = get_db()
+
+    # Món ăn có ảnh upload nhưng chưa có bản thu nhỏ
+    menus = db.menus.find(
+        {'image_url': {'$regex': '^/static/uploads/'}, 'image_variants': {'$in': [None, {}]}},
+        {'image_url': 1}
+    )
+    menu_jobs = [{'menu_id': str(m['_id']), 'image_url': m['image_url']} for m in menus]
+    enqueue_many('images.menu', menu_jobs)
+    print(f"🖼️  Đã đưa {len(menu_jobs)} ảnh món ăn vào hàng đợi")
+
+    # Đánh giá có ảnh nhưng chưa có bản thu nhỏ
+    reviews = db.reviews.find(
+        {'images.0': {'$exists': True}, 'image_variants': {'$in': [None, []]}},
+        {'images': 1}
+    )
+    review_jobs = [{'review_id': str(r['_id']), 'images': r['images']} for r in reviews]
+    enqueue_many('images.review', review_jobs)
+    print(f"🖼️  Đã đưa {len(review_jobs)} đánh giá có ảnh vào hàng đợi")
@@ -0,0 +1,35 @@
+"""
+Cấu hình gunicorn, đọc từ app.config.Config (có thể ghi đè bằng biến môi trường WEB_*)
+Chạy: gunicorn -c gunicorn.conf.py wsgi:app     (hoặc: python wsgi.py)
+"""
+from app.config import Config
+
+bind = Config.WEB_BIND
+workers = Config.WEB_WORKERS
+worker_class = Config.WEB_WORKER_CLASS
+threads = Config.WEB_THREADS
+keepalive = Config.WEB_KEEPALIVE
+timeout = Config.WEB_TIMEOUT
+graceful_timeout = Config.WEB_GRACEFUL_TIMEOUT
+max_requests = Config.WEB_MAX_REQUESTS
+# Tránh mọi worker khởi động lại cùng lúc
+max_requests_jitter = max_requests // 10
+
+# Tạo app một lần trong process chính rồi fork: worker khởi động nhanh, template/manifest dùng chung bộ nhớ
+preload_app = True
+wsgi_app = 'wsgi:app'
+
+def on_starting(server):
+    """Xóa file số liệu metrics của lần chạy trước (worker cũ đã dừng)"""
+    from app.utils.metrics import clear_directory
+    clear_directory(Config.METRICS_MULTIPROC_DIR)
+
+def when_ready(server):
+    """Process chính không phục vụ request: đóng kết nối MongoDB mở lúc preload"""
+    from app.database import close_db
+    close_db()
+
+def post_fork(server, worker):
+    """Mỗi worker tạo MongoClient riêng (client của process cha không dùng được sau fork)"""
+    from app.database import reconnect_after_fork
+    reconnect_after_fork()
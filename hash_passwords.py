@@ -1,44 +1,40 @@
 """
 Script để hash lại tất cả password trong database
 Chạy script này để chuyển đổi password từ plain text sang bcrypt hash
+Hash song song bằng nhiều process, ghi theo lô và lưu tiến độ vào collection migrations:
+nếu bị dừng giữa chừng, chạy lại lệnh sẽ tiếp tục từ user cuối cùng đã xử lý.
+Chạy: python hash_passwords.py                          (tiếp tục lần chạy trước nếu chưa xong)
+      python hash_passwords.py --workers 8 --batch 2000
+      python hash_passwords.py --restart                (bỏ checkpoint, quét lại từ đầu)
 """
+import argparse
 from app import create_app
-from app.database import get_db
-from app import bcrypt
+from app.utils.password_migration import hash_passwords
 
-app = create_app()
+def report(state):
+    print(f"✅ Đến user {state['last_id']}: đã hash {state['hashed']:,} | "
+          f"bỏ qua (vừa đổi password) {state['changed']:,} | lỗi {state['errors']:,} | {state['per_sec']:,} user/s")
 
-with app.app_context():
-    db = get_db()
-    users = db.users.find({})
-    
-    updated_count = 0
-    skipped_count = 0
-    
-    for user in users:
-        password = user.get('password', '')
-        
-        # Kiểm tra xem password đã được hash chưa
-        is_bcrypt_hash = password.startswith('$2a$') or password.startswith('$2b$')
-        
-        if not is_bcrypt_hash and password:
-            # Password là plain text, hash lại
-            try:
-                hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
-                db.users.update_one(
-                    {'_id': user['_id']},
-                    {'$set': {'password': hashed_password}}
-                )
-                print(f"✅ Đã hash password cho user: {user.get('phone', 'N/A')} ({user.get('name', 'N/A')})")
-                updated_count += 1
-            except Exception as e:
-                print(f"❌ Lỗi khi hash password cho user {user.get('phone', 'N/A')}: {str(e)}")
-        else:
-            print(f"⏭️  Bỏ qua user {user.get('phone', 'N/A')} - password đã được hash")
-            skipped_count += 1
-    
-    print(f"\n📊 Tổng kết:")
-    print(f"   - Đã hash: {updated_count} user(s)")
-    print(f"   - Đã bỏ qua: {skipped_count} user(s)")
-    print(f"   - Tổng cộng: {updated_count + skipped_count} user(s)")
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Hash password plain text của users bằng bcrypt')
+    parser.add_argument('--workers', type=int, default=None, help='Số process hash (mặc định: số CPU)')
+    parser.add_argument('--batch', type=int, default=1000, help='Số user mỗi lô bulk_write')
+    parser.add_argument('--limit', type=int, default=None, help='Số user tối đa xử lý trong lần chạy')
+    parser.add_argument('--restart', action='store_true', help='Bỏ checkpoint, quét lại từ user đầu tiên')
+    args = parser.parse_args()
+
+    app = create_app(web=False, lazy_db=True)
 
+    with app.app_context():
+        stats = hash_passwords(app.config, batch_size=args.batch, workers=args.workers,
+                               restart=args.restart, limit=args.limit, report=report)
+
+    if stats['resumed_from'] is not None:
+        print(f"⏭️  Lần chạy này tiếp tục từ user {stats['resumed_from']}")
+    print(f"\n📊 Tổng kết:")
+    print(f"   - Đã hash: {stats['hashed']:,} user(s)")
+    print(f"   - Bỏ qua do password vừa đổi: {stats['changed']:,} user(s)")
+    print(f"   - Lỗi: {stats['errors']:,} user(s) (_id lưu trong db.migrations, _id 'hash_passwords')")
+    print(f"   - Thời gian: {stats['seconds']:.1f}s ({stats['per_sec']:,} user/s)")
+    if not stats['done']:
+        print("⏸️  Chưa xong (đạt --limit), chạy lại để tiếp tục")
@@ -0,0 +1,100 @@
+"""
+Script import dữ liệu JSON / NDJSON vào MongoDB (dữ liệu mẫu doc/database hoặc bản dump lớn)
+Đọc file từng document, đổi ID tượng trưng (REST_ID_0, CUST1_ID...) thành ObjectId, ghi song song bằng insert_many.
+Chạy: python import_data.py doc/database                     (các file users/restaurants/menus/... trong thư mục)
+      python import_data.py dump/orders.ndjson dump/payments.ndjson --workers 8 --batch 5000
+      python import_data.py orders=export_2024.jsonl --symbols symbols.json
+Tên file (bỏ phần mở rộng) là tên collection, hoặc chỉ rõ bằng collection=đường_dẫn.
+ObjectId của REST_ID_X, ORDER_ID_X... giống nhau ở mọi lần chạy trên cùng database (epoch lưu trong db.migrations):
+import từng file ở các lần chạy riêng vẫn tham chiếu đúng, chạy lại sau khi lỗi chỉ thêm document còn thiếu.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from app import create_app
+from app.database import create_indexes, get_db
+from app.utils.fragment_cache import bump_catalog_version
+from app.utils.importer import COLLECTIONS, EXTENSIONS, run_import
+
+parser = argparse.ArgumentParser(description='Import file JSON / NDJSON vào MongoDB')
+parser.add_argument('paths', nargs='+', help='Thư mục, file <collection>.json/.ndjson/.jsonl hoặc collection=file')
+parser.add_argument('--symbols', default=None,
+                    help='File JSON khai báo ID đặt tên (mặc định: symbols.json trong thư mục nếu có)')
+parser.add_argument('--batch', type=int, default=1000, help='Số document mỗi lệnh insert_many')
+parser.add_argument('--workers', type=int, default=4, help='Số thread ghi song song')
+parser.add_argument('--drop', action='store_true', help='Xóa các collection sẽ import trước khi import')
+parser.add_argument('--epoch', type=int, default=None,
+                    help='Phần thời gian (giây) của ObjectId theo vị trí, mặc định giá trị đã lưu trong database')
+args = parser.parse_args()
+
+def collect_files(paths):
+    """List tuple (collection, file) theo thứ tự import, và file symbols.json tìm thấy trong thư mục"""
+    files, symbols_path = [], None
+    for path in paths:
+        if os.path.isdir(path):
+            for collection in COLLECTIONS:
+                for extension in EXTENSIONS:
+                    candidate = os.path.join(path, collection + extension)
+                    if os.path.isfile(candidate):
+                        files.append((collection, candidate))
+                        break
+            if os.path.isfile(os.path.join(path, 'symbols.json')):
+                symbols_path = symbols_path or os.path.join(path, 'symbols.json')
+        elif '=' in path and not os.path.exists(path):
+            collection, file_path = path.split('=', 1)
+            files.append((collection, file_path))
+        else:
+            files.append((os.path.splitext(os.path.basename(path))[0], path))
+    return files, symbols_path
+
+files, symbols_path = collect_files(args.paths)
+if not files:
+    sys.exit("❌ Không tìm thấy file nào để import")
+symbols_path = args.symbols or symbols_path
+aliases = {}
+if symbols_path:
+    with open(symbols_path, encoding='utf-8') as f:
+        aliases = json.load(f)
+    print(f"🔗 {len(aliases)} ID đặt tên từ {symbols_path}")
+
+app = create_app(web=False, lazy_db=True)
+
+def report(result):
+    print(f"✅ {result['collection']:<12} {result['read']:>10,} document | thêm {result['inserted']:,} | "
+          f"trùng {result['duplicates']:,} | lỗi {result['errors']:,} | "
+          f"{result['seconds']:.1f}s ({result['docs_per_sec']:,} docs/s)")
+
+with app.app_context():
+    db = get_db()
+    if args.drop:
+        for collection in dict(files):
+            db[collection].drop()
+        print(f"🗑️  Đã xóa dữ liệu cũ: {', '.join(dict(files))}")
+
+    start = time.perf_counter()
+    results, symbols, errors = run_import(db, files, aliases, batch_size=args.batch,
+                                          workers=args.workers, report=report, epoch=args.epoch)
+    elapsed = time.perf_counter() - start
+
+    total = sum(result['read'] for result in results)
+    print(f"\n📊 Đã import {total:,} document từ {len(results)} file trong {elapsed:.1f}s "
+          f"({round(total / elapsed) if elapsed > 0 else total:,} docs/s)")
+    for name in sorted(set(aliases) - set(symbols.bound)):
+        print(f"⚠️  Không tìm thấy document khớp cho {name}: {aliases[name]['match']}")
+    for name, count in sorted(symbols.unresolved.items()):
+        print(f"⚠️  ID tượng trưng chưa đổi được: {name} ({count} lần, giữ nguyên dạng chuỗi)")
+    for error in errors:
+        print(f"❌ {error}")
+
+    if args.drop:
+        # Tạo lại index sau khi nạp xong (nhanh hơn cập nhật index cho từng lô)
+        if not create_indexes(db):
+            print("⚠️  Chưa tạo đủ index (xem log), app sẽ tạo lại khi khởi động")
+    # Menu / nhà hàng mới: các process đang chạy bỏ cache catalog
+    if any(collection in ('restaurants', 'menus') for collection, _ in files):
+        bump_catalog_version()
+    plain = sum(result['plain_passwords'] for result in results)
+    if plain:
+        print(f"🔑 {plain} user có password chưa hash, chạy: python hash_passwords.py")
@@ -0,0 +1,41 @@
+"""
+Script để bổ sung metadata (nhà hàng đã ghim + giá chụp theo từng món) cho các giỏ hàng cũ trong users.cart
+Giỏ hàng chưa migrate vẫn dùng được (được bổ sung tự động khi khách đăng nhập),
+script này giúp migrate toàn bộ một lần
+"""
+from app import create_app
+from app.database import get_db
+from app.utils.cart import build_meta
+
+app = create_app(web=False, lazy_db=True)
+
+with app.app_context():
+    db = get_db()
+    # Chỉ lấy user có giỏ hàng không rỗng nhưng chưa có cart_meta
+    users = db.users.find(
+        {'cart': {'$nin': [None, {}]}, 'cart_meta': {'$exists': False}},
+        {'cart': 1, 'phone': 1}
+    )
+
+    updated_count = 0
+    empty_count = 0
+
+    for user in users:
+        cart = user.get('cart') or {}
+        meta = build_meta(cart)
+
+        # Bỏ các món không còn tồn tại khỏi giỏ hàng
+        cart = {menu_id: qty for menu_id, qty in cart.items() if menu_id in meta['items']}
+        if not cart:
+            empty_count += 1
+
+        db.users.update_one(
+            {'_id': user['_id']},
+            {'$set': {'cart': cart, 'cart_meta': meta}}
+        )
+        updated_count += 1
+        print(f"✅ Đã migrate giỏ hàng của user: {user.get('phone', 'N/A')} ({len(cart)} món)")
+
+    print(f"\n📊 Tổng kết:")
+    print(f"   - Đã migrate: {updated_count} giỏ hàng")
+    print(f"   - Giỏ hàng trống sau khi bỏ món không còn tồn tại: {empty_count}")
@@ -0,0 +1,23 @@
+"""
+Script xử lý các tác vụ phụ còn tồn đọng trong outbox của đơn hàng (doanh thu, xóa giỏ hàng)
+Bình thường outbox được xử lý bởi job orders.outbox (worker.py) ngay sau khi đặt hàng, và worker.py
+tự quét lại định kỳ; script này xử lý các đơn bị bỏ lỡ khi không chạy worker.
+Chạy: python process_outbox.py          (chạy một lần)
+      python process_outbox.py --loop   (chạy liên tục, mỗi 10 giây)
+"""
+import sys
+import time
+from app import create_app
+from app.utils.order_service import OrderService
+
+app = create_app(web=False, lazy_db=True)
+
+with app.app_context():
+    loop = '--loop' in sys.argv
+
+    while True:
+        processed = OrderService.process_pending()
+        print(f"📦 Đã xử lý {processed} tác vụ outbox")
+        if not loop:
+            break
+        time.sleep(10)
@@ -0,0 +1,56 @@
+"""
+Script đối soát các payment VnPay còn pending (khách đóng trình duyệt, IPN không tới được server...)
+Truy vấn trạng thái từng giao dịch qua API querydr của VnPay rồi cập nhật success/failed hàng loạt.
+Chạy: python reconcile_payments.py                          (payment pending quá 15 phút)
+      python reconcile_payments.py --older-than 30 --workers 32
+      python reconcile_payments.py --fake                   (server VnPay giả lập + database fastfood_bench)
+Payment VnPay báo đã thanh toán nhưng sai số tiền được giữ pending và đánh dấu needs_review để kiểm tra thủ công.
+"""
+import argparse
+import time
+from app import create_app
+from app.config import Config
+from app.utils.reconcile import reconcile_pending, VnPayQueryClient
+
+parser = argparse.ArgumentParser(description='Đối soát payment VnPay đang pending')
+parser.add_argument('--older-than', type=int, default=15, help='Chỉ đối soát payment tạo trước số phút này')
+parser.add_argument('--expire-after', type=int, default=60, help='Quá số phút này chưa thanh toán thì đánh dấu failed')
+parser.add_argument('--workers', type=int, default=16, help='Số request querydr đồng thời')
+parser.add_argument('--batch', type=int, default=500, help='Số payment mỗi lô bulk_write')
+parser.add_argument('--limit', type=int, default=None, help='Số payment tối đa trong lần chạy')
+parser.add_argument('--fake', action='store_true', help='Dùng server VnPay giả lập (benchmarks/fake_vnpay.py)')
+parser.add_argument('--fake-db', default='fastfood_bench', help='Database dùng khi chạy với --fake')
+args = parser.parse_args()
+
+config_class = Config
+if args.fake:
+    # Kết quả giả lập không được ghi vào database thật
+    if args.fake_db == Config.MONGODB_DB:
+        parser.error(f"--fake không chạy trên database của ứng dụng ({Config.MONGODB_DB}), chọn --fake-db khác")
+
+    class FakeConfig(Config):
+        MONGODB_DB = args.fake_db
+
+    config_class = FakeConfig
+
+app = create_app(config_class, web=False, lazy_db=True)
+
+with app.app_context():
+    client = None
+    if args.fake:
+        from benchmarks.fake_vnpay import FakeVnPay, start_server
+        server, api_url = start_server(FakeVnPay(app.config['VNPAY_HASH_SECRET']))
+        client = VnPayQueryClient(api_url, app.config['VNPAY_TMN_CODE'], app.config['VNPAY_HASH_SECRET'])
+        print(f"🧪 Dùng VnPay giả lập: {api_url} (database {app.config['MONGODB_DB']})")
+
+    start = time.perf_counter()
+    stats = reconcile_pending(app.config, older_than_minutes=args.older_than,
+                              expire_after_minutes=args.expire_after, workers=args.workers,
+                              batch_size=args.batch, client=client, limit=args.limit)
+    elapsed = time.perf_counter() - start
+
+    print(f"✅ Đã đối soát {stats['scanned']} payment trong {elapsed:.1f}s")
+    print(f"   Thành công: {stats['success']} | Thất bại: {stats['failed']} | "
+          f"Giữ nguyên: {stats['unchanged']} | Lỗi truy vấn: {stats['errors']} | Đã cập nhật: {stats['modified']}")
+    if stats['review']:
+        print(f"⚠️  {stats['review']} payment sai số tiền, cần kiểm tra thủ công: db.payments.find({{needs_review: true}})")
@@ -0,0 +1,41 @@
+"""
+Fixture dùng chung cho tests/
+Chạy: python -m pytest tests
+Test dùng fixture test_db cần MongoDB ở MONGODB_HOST:MONGODB_PORT và ghi vào database riêng 'fastfood_test'
+(xóa sau mỗi test); bị skip nếu không kết nối được.
+"""
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from app import create_app
+from app.config import Config
+
+class TestConfig(Config):
+    """Database riêng, job vào hàng đợi (không chạy ngay), không có thread nền"""
+    TESTING = True
+    MONGODB_DB = 'fastfood_test'
+    JOB_RUN_INLINE = False
+    SLOW_QUERY_MS = 0
+    CACHE_BUS_MODE = 'off'
+
+@pytest.fixture
+def test_config():
+    """Lớp cấu hình cho create_app() trong test (subclass khi cần đổi cấu hình)"""
+    return TestConfig
+
+@pytest.fixture
+def test_db():
+    """(app, database) trong app context, database trống"""
+    client = MongoClient(Config.MONGODB_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command('ping')
+    except PyMongoError:
+        client.close()
+        pytest.skip('MongoDB không chạy')
+    client.drop_database(TestConfig.MONGODB_DB)
+    app = create_app(TestConfig, web=False, lazy_db=True)
+    with app.app_context():
+        yield app, client[TestConfig.MONGODB_DB]
+    client.drop_database(TestConfig.MONGODB_DB)
+    client.close()
@@ -0,0 +1,29 @@
+"""Kiểm thử bỏ món không còn bán khỏi giỏ hàng khi đặt hàng (app/utils/cart.py)"""
+from flask import session
+
+from app.utils import cart as cart_utils
+
+def test_prune_unavailable(test_db):
+    app, database = test_db
+    rest_id, other_rest = database.restaurants.insert_many([{'status': 'approved'}, {'status': 'approved'}]).inserted_ids
+    user_id = database.users.insert_one({'role': 'customer'}).inserted_id
+    menus = {
+        'ok': {'name': 'Burger', 'price': 50000, 'rest_id': rest_id, 'status': 'available'},
+        'off': {'name': 'Pizza', 'price': 90000, 'rest_id': rest_id, 'status': 'unavailable'},
+        'moved': {'name': 'Salad', 'price': 40000, 'rest_id': other_rest, 'status': 'available'},
+    }
+    ids = dict(zip(menus, (str(i) for i in database.menus.insert_many(list(menus.values())).inserted_ids)))
+    ids['deleted'] = '0123456789abcdef01234567'
+    cart = {menu_id: 1 for menu_id in ids.values()}
+    meta = {'rest_id': str(rest_id), 'items': {
+        menu_id: {'name': name, 'price': 1000, 'cat': ''} for name, menu_id in ids.items()}}
+
+    with app.test_request_context():
+        cart, meta, removed = cart_utils.prune_unavailable(str(user_id), cart, meta)
+        assert sorted(removed) == ['deleted', 'moved', 'off']
+        assert list(cart) == [ids['ok']] == list(meta['items'])
+        assert session['cart'] == cart
+    assert database.users.find_one({'_id': user_id})['cart'] == cart
+
+    with app.test_request_context():
+        assert cart_utils.prune_unavailable(str(user_id), cart, meta) == (cart, meta, [])
@@ -0,0 +1,21 @@
+"""Kiểm thử tạo index ở chế độ khởi tạo trễ (app/database.py)"""
+from pymongo import MongoClient
+
+from app import database
+
+def test_failed_index_creation_is_retried(monkeypatch):
+    # Cổng không có MongoDB: tạo index lỗi kết nối
+    client = MongoClient('mongodb://127.0.0.1:1/', serverSelectionTimeoutMS=100, connect=False)
+    monkeypatch.setattr(database, 'db', client['fastfood_test'])
+    monkeypatch.setattr(database, '_indexes_pending', True)
+    monkeypatch.setattr(database, '_indexes_retry_at', 0.0)
+    assert database.create_indexes(database.db) is False
+
+    database.get_db()
+    assert database._indexes_pending is True
+    retry_at = database._indexes_retry_at
+    assert retry_at > 0
+    # Trong thời gian chờ, get_db() không thử lại (không chặn request)
+    database.get_db()
+    assert database._indexes_retry_at == retry_at
+    client.close()
@@ -0,0 +1,42 @@
+"""Kiểm thử import JSON / NDJSON (app/utils/importer.py)"""
+import json
+
+from app.utils import importer
+from app.utils.importer import SymbolTable, iter_documents, run_import
+
+def write_ndjson(path, documents):
+    path.write_text('\n'.join(json.dumps(document, ensure_ascii=False) for document in documents), encoding='utf-8')
+    return str(path)
+
+def test_iter_documents_across_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(importer, 'CHUNK_SIZE', 7)
+    path = write_ndjson(tmp_path / 'menus.ndjson',
+                        [{'name': f"Món {i}", 'price': i, 'created_at': {'$date': '2024-01-01T00:00:00Z'}}
+                         for i in range(50)])
+    documents = list(iter_documents(path))
+    assert [document['price'] for document in documents] == list(range(50))
+    assert documents[0]['created_at'].year == 2024
+    array = tmp_path / 'array.json'
+    array.write_text(json.dumps([{'a': 1}, {'a': 2}]), encoding='utf-8')
+    assert [document['a'] for document in iter_documents(str(array))] == [1, 2]
+
+def test_positional_ids_depend_only_on_epoch():
+    first, second = SymbolTable(epoch=1700000000), SymbolTable(epoch=1700000000)
+    assert first.resolve('REST_ID_0') == second.resolve('REST_ID_0')
+    assert first.resolve('REST_ID_0') != first.resolve('ORDER_ID_0')
+    assert first.replace({'rest_id': 'REST_ID_2', 'note': 'UNKNOWN_ID'})['rest_id'] == first.positional_id('restaurants', 2)
+    assert first.unresolved == {'UNKNOWN_ID': 1}
+
+def test_separate_runs_share_ids(test_db, tmp_path):
+    app, database = test_db
+    restaurants = write_ndjson(tmp_path / 'restaurants.ndjson', [{'name': 'A'}, {'name': 'B'}])
+    orders = write_ndjson(tmp_path / 'orders.ndjson', [{'rest_id': 'REST_ID_1', 'total': 100}])
+    run_import(database, [('restaurants', restaurants)], report=lambda result: None)
+    # Lần chạy riêng cho orders vẫn tham chiếu đúng nhà hàng
+    run_import(database, [('orders', orders)], report=lambda result: None)
+    order = database.orders.find_one()
+    assert database.restaurants.find_one({'_id': order['rest_id']})['name'] == 'B'
+    # Import lại sau lỗi: không thêm bản sao
+    results, _, _ = run_import(database, [('restaurants', restaurants)], report=lambda result: None)
+    assert (results[0]['inserted'], results[0]['duplicates']) == (0, 2)
+    assert database.restaurants.count_documents({}) == 2
@@ -0,0 +1,96 @@
+"""
+Kiểm thử bus xóa cache giữa các process (app/utils/invalidation.py): một process khác sửa món ăn,
+doc_cache và fragment_cache của process test phải bỏ dữ liệu cũ
+Chế độ change_stream cần MongoDB chạy replica set (kể cả một node: mongod --replSet rs0 + rs.initiate()),
+bị skip với MongoDB standalone
+"""
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from app import create_app
+from app.models import Menu
+from app.utils.fragment_cache import get_fragment_cache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Process ghi: app riêng cùng database và cùng chế độ bus, sửa giá món qua Menu.update
+WRITER = '''
+import sys
+from app import create_app
+from app.config import Config
+from app.models import Menu
+
+class WriterConfig(Config):
+    MONGODB_DB = sys.argv[1]
+    CACHE_BUS_MODE = sys.argv[2]
+
+app = create_app(WriterConfig, web=False, lazy_db=True)
+with app.app_context():
+    Menu.update(sys.argv[3], {'price': int(sys.argv[4])})
+'''
+
+def write_in_other_process(database, mode, menu_id, price):
+    subprocess.run([sys.executable, '-c', WRITER, database.name, mode, str(menu_id), str(price)],
+                   cwd=ROOT, check=True, timeout=60)
+
+def wait_for(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.1)
+    return predicate()
+
+def listener(test_config, mode, **settings):
+    """App web của process test với bus đang chạy (thread được khởi động như ở request đầu tiên)"""
+    class ListenerConfig(test_config):
+        CACHE_BUS_MODE = mode
+    for name, value in settings.items():
+        setattr(ListenerConfig, name, value)
+    app = create_app(ListenerConfig, lazy_db=True)
+    from app.utils.invalidation import bus
+    bus.ensure_started()
+    return app
+
+def check_eviction(app, database, mode, attempts=1):
+    rest_id = database.restaurants.insert_one({'name': 'Bus', 'status': 'approved'}).inserted_id
+    menu_id = database.menus.insert_one({'name': 'Bus Burger', 'price': 50000, 'rest_id': rest_id}).inserted_id
+    renders = []
+
+    def render():
+        renders.append(1)
+        return f"<p>{Menu.find_by_id(menu_id)['price']}</p>"
+
+    with app.app_context():
+        fragments = get_fragment_cache()
+        assert Menu.find_by_id(menu_id)['price'] == 50000
+        assert fragments.get_or_render(('bus', str(rest_id)), render) == '<p>50000</p>'
+        assert fragments.get_or_render(('bus', str(rest_id)), render) == '<p>50000</p>'
+        assert len(renders) == 1
+
+        # Change stream chỉ nhận thay đổi sau khi mở: thử lại nếu lần ghi đầu xảy ra trước đó
+        for attempt in range(attempts):
+            price = 60000 + attempt
+            write_in_other_process(database, mode, menu_id, price)
+            if wait_for(lambda: Menu.find_by_id(menu_id)['price'] == price, timeout=5):
+                break
+        assert Menu.find_by_id(menu_id)['price'] == price
+        assert wait_for(lambda: fragments.get_or_render(('bus', str(rest_id)), render) == f'<p>{price}</p>',
+                        timeout=5)
+
+def test_poll_mode_evicts_other_process_cache(test_db, test_config):
+    _, database = test_db
+    app = listener(test_config, 'poll', CACHE_BUS_POLL_INTERVAL=0.2)
+    check_eviction(app, database, 'poll')
+
+def test_change_stream_evicts_other_process_cache(test_db, test_config):
+    _, database = test_db
+    hello = database.client.admin.command('hello')
+    if 'setName' not in hello and hello.get('msg') != 'isdbgrid':
+        pytest.skip('MongoDB không chạy replica set (change stream không dùng được)')
+    # Version catalog chỉ được đọc lại sau 60 giây: fragment_cache đổi là nhờ change stream của cache_versions
+    app = listener(test_config, 'change_stream', CATALOG_VERSION_TTL=60.0)
+    check_eviction(app, database, 'change_stream', attempts=3)
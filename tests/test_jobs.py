@@ -0,0 +1,37 @@
+"""Kiểm thử hàng đợi job (app/utils/jobs.py): hết lượt thử và worker cũ sau khi job bị nhận lại"""
+from datetime import datetime, timedelta
+
+from app.utils.jobs import enqueue, fail, lease
+
+def expire(database, job_id):
+    database.jobs.update_one({'_id': job_id}, {'$set': {'lease_expires_at': datetime.now() - timedelta(seconds=1)}})
+
+def test_expired_lease_dead_lettered_after_last_attempt(test_db):
+    app, database = test_db
+    job_id = enqueue('revenue.update', {'order_id': 'x'}, max_attempts=2)
+    for attempt in (1, 2):
+        job = lease('w1', 60)
+        assert (job['_id'], job['attempts']) == (job_id, attempt)
+        expire(database, job_id)
+    # Worker bị dừng ở cả hai lần chạy: không nhận lại nữa mà chuyển sang jobs_dead
+    assert lease('w1', 60) is None
+    assert database.jobs.count_documents({}) == 0
+    dead = database.jobs_dead.find_one({'_id': job_id})
+    assert (dead['status'], dead['attempts']) == ('dead', 2)
+
+def test_stale_worker_cannot_dead_letter_released_job(test_db):
+    app, database = test_db
+    job_id = enqueue('revenue.update', {'order_id': 'x'}, max_attempts=2)
+    lease('w1', 60)
+    expire(database, job_id)
+    stale = lease('w1', 60)
+    expire(database, job_id)
+    database.jobs.update_one({'_id': job_id}, {'$set': {'max_attempts': 3}})
+    current = lease('w2', 60)
+    assert current['leased_by'] == 'w2'
+    # w1 báo lỗi sau khi job đã thuộc về w2: không được chuyển job sang jobs_dead
+    fail(stale, 'late failure')
+    assert database.jobs_dead.count_documents({}) == 0
+    assert database.jobs.find_one({'_id': job_id})['leased_by'] == 'w2'
+    fail(current, 'failure')
+    assert database.jobs_dead.find_one({'_id': job_id})['last_error'] == 'failure'
@@ -0,0 +1,27 @@
+"""Kiểm thử quyền đọc /metrics"""
+import pytest
+
+from app import create_app
+
+@pytest.fixture
+def client(test_config):
+    def make(token=''):
+        class MetricsConfig(test_config):
+            METRICS_TOKEN = token
+        return create_app(MetricsConfig, lazy_db=True).test_client()
+    return make
+
+def test_metrics_without_token_localhost_only(client):
+    anonymous = client()
+    assert anonymous.get('/metrics').status_code == 200
+    assert anonymous.get('/metrics', environ_base={'REMOTE_ADDR': '203.0.113.7'}).status_code == 403
+    assert anonymous.get('/metrics', headers={'X-Forwarded-For': '203.0.113.7'}).status_code == 403
+
+def test_metrics_with_token(client):
+    protected = client('s3cret')
+    assert protected.get('/metrics').status_code == 403
+    assert protected.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    assert protected.get('/metrics', headers={'Authorization': 'Bearer é'}).status_code == 403
+    response = protected.get('/metrics', headers={'Authorization': 'Bearer s3cret'},
+                             environ_base={'REMOTE_ADDR': '203.0.113.7'})
+    assert response.status_code == 200
@@ -0,0 +1,42 @@
+"""Kiểm thử đặt đơn tiền mặt và outbox qua hàng đợi job (app/utils/order_service.py)"""
+from bson import ObjectId
+import pytest
+
+from app.utils import order_service
+from app.utils.jobs import lease, run_job
+from app.utils.order_service import OrderService
+
+ITEMS = [{'menu_id': str(ObjectId()), 'name': 'Burger', 'quantity': 2, 'price': 50000}]
+
+def seed(database):
+    owner = database.users.insert_one({'role': 'restaurant_owner', 'revenue': 0}).inserted_id
+    database.users.insert_one({'role': 'admin', 'revenue': 0})
+    customer = database.users.insert_one({'role': 'customer', 'cart': {'x': 1}}).inserted_id
+    rest_id = database.restaurants.insert_one({'owner_id': owner, 'status': 'approved'}).inserted_id
+    return owner, customer, rest_id
+
+def test_outbox_runs_as_job(test_db):
+    app, database = test_db
+    owner, customer, rest_id = seed(database)
+    order_id = OrderService.place(str(customer), str(rest_id), ITEMS, 'HN', 'cash')
+    OrderService.dispatch(order_id)
+    job = lease('w1', 60)
+    assert (job['name'], job['payload']) == ('orders.outbox', {'order_id': str(order_id)})
+    assert run_job(job) is True
+    order = database.orders.find_one({'_id': order_id})
+    assert (order['outbox'], order['outbox_claims']) == ([], [])
+    assert database.users.find_one({'_id': owner})['revenue'] == 95000
+    assert database.users.find_one({'_id': customer})['cart'] == {}
+
+def test_failed_effect_returns_to_outbox(test_db, monkeypatch):
+    app, database = test_db
+    _, customer, rest_id = seed(database)
+    order_id = OrderService.place(str(customer), str(rest_id), ITEMS, 'HN', 'cash')
+
+    def broken(order):
+        raise RuntimeError('database unavailable')
+    monkeypatch.setitem(order_service.OUTBOX_EFFECTS, 'revenue', broken)
+    with pytest.raises(RuntimeError):
+        OrderService.process_outbox(order_id)
+    order = database.orders.find_one({'_id': order_id})
+    assert (order['outbox'], order['outbox_claims']) == (['clear_cart', 'revenue'], [])
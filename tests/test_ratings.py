@@ -0,0 +1,17 @@
+"""Kiểm thử ghi điểm đánh giá nhà hàng không làm mất cache catalog khi điểm hiển thị không đổi"""
+from app.models import Restaurant
+from app.utils.fragment_cache import CATALOG_KEY
+
+def catalog_version(database):
+    doc = database.cache_versions.find_one({'_id': CATALOG_KEY})
+    return doc['version'] if doc else 0
+
+def test_rating_bumps_catalog_only_when_changed(test_db):
+    app, database = test_db
+    rest_id = str(database.restaurants.insert_one({'name': 'R', 'status': 'approved', 'rating': 0}).inserted_id)
+    assert Restaurant.set_rating(rest_id, 4.5) is True
+    version = catalog_version(database)
+    assert version == 1
+    assert Restaurant.set_rating(rest_id, 4.5) is False
+    assert catalog_version(database) == version
+    assert database.restaurants.find_one()['rating'] == 4.5
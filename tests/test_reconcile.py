@@ -0,0 +1,99 @@
+"""Kiểm thử đối soát payment VnPay (app/utils/reconcile.py) với server querydr giả lập (benchmarks/fake_vnpay.py)"""
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from app.config import Config
+from app.utils.reconcile import VnPayQueryClient, decide, reconcile_pending
+from benchmarks.fake_vnpay import FakeVnPay, start_server
+
+SECRET = Config.VNPAY_HASH_SECRET
+TMN_CODE = Config.VNPAY_TMN_CODE
+AMOUNT = 115000
+
+def txn_refs(fake):
+    """Một txn_ref cho mỗi kết quả của server giả lập: paid, not_found, processing"""
+    refs = {}
+    number = 0
+    while len(refs) < 3:
+        ref = f"T{number:08d}"
+        refs.setdefault(fake.outcome(ref), ref)
+        number += 1
+    return refs
+
+@pytest.fixture
+def fake_server():
+    fake = FakeVnPay(SECRET, amounts={})
+    server, api_url = start_server(fake)
+    yield fake, api_url
+    server.shutdown()
+
+def payment(txn_ref, minutes_ago, amount=AMOUNT):
+    created_at = datetime.now() - timedelta(minutes=minutes_ago)
+    return {'_id': ObjectId(), 'order_id': ObjectId(), 'txn_ref': txn_ref, 'amount': amount, 'method': 'vnpay',
+            'status': 'pending', 'created_at': created_at, 'vnp_create_date': created_at.strftime('%Y%m%d%H%M%S')}
+
+def test_decide():
+    expire_before = datetime.now() - timedelta(minutes=60)
+    old, recent = payment('A', 120), payment('B', 20)
+    paid = {'response_code': '00', 'transaction_status': '00', 'amount': AMOUNT}
+    assert decide(recent, paid, expire_before) == 'success'
+    assert decide(recent, dict(paid, amount=AMOUNT + 1000), expire_before) == 'review'
+    processing = {'response_code': '00', 'transaction_status': '01', 'amount': AMOUNT}
+    assert decide(recent, processing, expire_before) is None
+    assert decide(old, processing, expire_before) == 'failed'
+    not_found = {'response_code': '91', 'transaction_status': None, 'amount': None}
+    assert decide(recent, not_found, expire_before) is None
+    assert decide(old, not_found, expire_before) == 'failed'
+    assert decide(old, {'response_code': '97', 'transaction_status': None, 'amount': None}, expire_before) is None
+
+def test_query_client_against_fake(fake_server):
+    fake, api_url = fake_server
+    refs = txn_refs(fake)
+    client = VnPayQueryClient(api_url, TMN_CODE, SECRET)
+    paid = client.query(payment(refs['paid'], 30))
+    assert (paid['response_code'], paid['transaction_status'], paid['amount']) == ('00', '00', AMOUNT)
+    assert client.query(payment(refs['not_found'], 30))['response_code'] == '91'
+    assert client.query(payment(refs['processing'], 30))['transaction_status'] == '01'
+
+def test_query_client_rejects_bad_signature(fake_server):
+    fake, api_url = fake_server
+    client = VnPayQueryClient(api_url, TMN_CODE, 'wrong-secret')
+    with pytest.raises(ValueError):
+        client.query(payment('T00000000', 30))
+
+def test_reconcile_pending_against_fake(fake_server, test_db):
+    fake, api_url = fake_server
+    app, database = test_db
+    refs = txn_refs(fake)
+    mismatch_ref = next(f"M{n:08d}" for n in range(10000) if fake.outcome(f"M{n:08d}") == 'paid')
+    fake.amounts[mismatch_ref] = AMOUNT + 5000
+    payments = {
+        'paid': payment(refs['paid'], 30),
+        'expired': payment(refs['not_found'], 120),
+        'waiting': payment(refs['processing'], 30),
+        'mismatch': payment(mismatch_ref, 30),
+    }
+    database.payments.insert_many(list(payments.values()))
+    database.orders.insert_many([{'_id': p['order_id'], 'status': 'pending'} for p in payments.values()])
+
+    client = VnPayQueryClient(api_url, TMN_CODE, SECRET)
+    stats = reconcile_pending(app.config, workers=4, client=client)
+
+    assert stats['scanned'] == 4
+    assert (stats['success'], stats['failed'], stats['review'], stats['unchanged']) == (1, 1, 1, 1)
+    status = {name: database.payments.find_one({'_id': p['_id']}) for name, p in payments.items()}
+    assert status['paid']['status'] == 'success'
+    assert status['expired']['status'] == 'failed'
+    assert status['waiting']['status'] == 'pending'
+    assert status['mismatch']['status'] == 'pending'
+    assert status['mismatch']['needs_review'] is True
+    assert status['mismatch']['gateway_amount'] == AMOUNT + 5000
+    # Chỉ payment thành công được tính doanh thu
+    jobs = list(database.jobs.find({'name': 'revenue.update'}))
+    assert [job['payload']['order_id'] for job in jobs] == [str(payments['paid']['order_id'])]
+
+    # Payment chờ kiểm tra thủ công không bị truy vấn lại
+    requests_before = fake.requests
+    assert reconcile_pending(app.config, workers=4, client=client)['scanned'] == 1
+    assert fake.requests == requests_before + 1
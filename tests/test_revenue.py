@@ -0,0 +1,90 @@
+"""Kiểm thử cộng doanh thu / tiền ship đúng một lần cho mỗi đơn (app/utils/revenue.py)"""
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from app.utils.revenue import (CREDIT_CLAIM, CreditInProgress, calculate_and_update_revenue,
+                               update_shipper_delivery_fee)
+
+def seed(database):
+    admin, owner, shipper = ObjectId(), ObjectId(), ObjectId()
+    database.users.insert_many([
+        {'_id': admin, 'role': 'admin', 'revenue': 0},
+        {'_id': owner, 'role': 'restaurant_owner', 'revenue': 0},
+        {'_id': shipper, 'role': 'shipper', 'delivery_earnings': 0},
+    ])
+    rest_id = database.restaurants.insert_one({'owner_id': owner, 'status': 'approved'}).inserted_id
+    order_id = database.orders.insert_one({'rest_id': rest_id, 'total': 115000, 'delivery_fee': 15000,
+                                           'status': 'completed', 'shipper_id': shipper}).inserted_id
+    return admin, owner, shipper, order_id
+
+def test_revenue_applied_once(test_db):
+    app, database = test_db
+    admin, owner, _, order_id = seed(database)
+    assert calculate_and_update_revenue(str(order_id)) is True
+    assert calculate_and_update_revenue(str(order_id)) is False
+    assert database.users.find_one({'_id': admin})['revenue'] == 5000
+    assert database.users.find_one({'_id': owner})['revenue'] == 95000
+
+def test_revenue_retry_after_failure_before_mark(test_db):
+    app, database = test_db
+    admin, owner, _, order_id = seed(database)
+    calculate_and_update_revenue(str(order_id))
+    # Lần chạy trước dừng sau khi cộng tiền nhưng trước khi đánh dấu đơn hàng
+    database.orders.update_one({'_id': order_id}, {'$unset': {'revenue_applied': 1}})
+    assert calculate_and_update_revenue(str(order_id)) is False
+    assert database.orders.find_one({'_id': order_id})['revenue_applied'] is True
+    assert database.users.find_one({'_id': admin})['revenue'] == 5000
+    assert database.users.find_one({'_id': owner})['revenue'] == 95000
+
+def test_revenue_retry_after_failure_between_credits(test_db):
+    app, database = test_db
+    admin, owner, _, order_id = seed(database)
+    calculate_and_update_revenue(str(order_id))
+    database.orders.update_one({'_id': order_id}, {'$unset': {'revenue_applied': 1}})
+    # Lần trước dừng trước khi cộng cho chủ nhà hàng: chỉ cộng phần còn thiếu
+    database.revenue_credits.delete_one({'order_id': order_id, 'user_id': owner})
+    database.users.update_one({'_id': owner}, {'$set': {'revenue': 0}})
+    assert calculate_and_update_revenue(str(order_id)) is True
+    assert database.users.find_one({'_id': admin})['revenue'] == 5000
+    assert database.users.find_one({'_id': owner})['revenue'] == 95000
+    assert database.revenue_credits.count_documents({'order_id': order_id, 'status': 'applied'}) == 2
+
+def test_pending_credit_resumed_after_claim(test_db):
+    app, database = test_db
+    admin, owner, _, order_id = seed(database)
+    expired = datetime.now() - CREDIT_CLAIM
+    # Worker trước dừng sau khi $inc admin (id còn trong pending_credits) và trước khi $inc chủ nhà hàng
+    admin_credit = database.revenue_credits.insert_one({
+        'order_id': order_id, 'user_id': admin, 'inc': {'revenue': 5000}, 'status': 'pending', 'claimed_at': expired
+    }).inserted_id
+    database.users.update_one({'_id': admin}, {'$inc': {'revenue': 5000}, '$push': {'pending_credits': admin_credit}})
+    database.revenue_credits.insert_one({
+        'order_id': order_id, 'user_id': owner, 'inc': {'revenue': 95000}, 'status': 'pending', 'claimed_at': expired
+    })
+    assert calculate_and_update_revenue(str(order_id)) is True
+    admin_doc, owner_doc = database.users.find_one({'_id': admin}), database.users.find_one({'_id': owner})
+    assert (admin_doc['revenue'], admin_doc['pending_credits']) == (5000, [])
+    assert (owner_doc['revenue'], owner_doc['pending_credits']) == (95000, [])
+
+def test_pending_credit_held_by_other_worker(test_db):
+    app, database = test_db
+    admin, _, _, order_id = seed(database)
+    database.revenue_credits.insert_one({
+        'order_id': order_id, 'user_id': admin, 'inc': {'revenue': 5000}, 'status': 'pending',
+        'claimed_at': datetime.now()
+    })
+    with pytest.raises(CreditInProgress):
+        calculate_and_update_revenue(str(order_id))
+    assert database.users.find_one({'_id': admin})['revenue'] == 0
+
+def test_shipper_fee_applied_once(test_db):
+    app, database = test_db
+    _, _, shipper, order_id = seed(database)
+    assert update_shipper_delivery_fee(str(order_id)) is True
+    database.orders.update_one({'_id': order_id}, {'$unset': {'shipper_fee_applied': 1}})
+    assert update_shipper_delivery_fee(str(order_id)) is False
+    user = database.users.find_one({'_id': shipper})
+    assert user['delivery_earnings'] == 15000
+    assert user['delivery_stats']['completed_orders'] == 1
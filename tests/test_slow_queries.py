@@ -0,0 +1,33 @@
+"""Kiểm thử chọn lệnh ghi vào nhật ký truy vấn chậm (app/utils/slow_queries.py)"""
+import os
+
+import pytest
+from bson.int64 import Int64
+
+from app.utils import slow_queries
+from app.utils.query_stats import CommandRecord
+
+def record(name, command, duration_ms=1500):
+    return CommandRecord(name, command.get(name) if isinstance(command.get(name), str) else '', name,
+                         duration_ms, True, command, None, 'fastfood_test')
+
+@pytest.fixture
+def queued(monkeypatch):
+    """Các lệnh observe() đưa vào hàng đợi (không chạy thread ghi log)"""
+    monkeypatch.setitem(slow_queries._settings, 'threshold_ms', 100)
+    monkeypatch.setitem(slow_queries._state, 'pid', os.getpid())
+    items = []
+    monkeypatch.setattr(slow_queries._queue, 'put_nowait', items.append)
+    return items
+
+def test_await_data_get_more_is_not_slow(queued):
+    # Change stream của bus xóa cache (Database.watch) và cursor tailable chờ dữ liệu mới
+    slow_queries.observe(record('getMore', {'getMore': Int64(1), 'collection': '$cmd.aggregate'}))
+    slow_queries.observe(record('getMore', {'getMore': Int64(2), 'collection': 'jobs', 'maxTimeMS': 1000}))
+    assert queued == []
+
+def test_slow_commands_are_queued(queued):
+    slow_queries.observe(record('find', {'find': 'menus', 'filter': {'rest_id': 1}}))
+    slow_queries.observe(record('getMore', {'getMore': Int64(3), 'collection': 'orders'}))
+    slow_queries.observe(record('find', {'find': 'menus', 'filter': {}}, duration_ms=5))
+    assert [item.name for item in queued] == ['find', 'getMore']
@@ -0,0 +1,44 @@
+"""Kiểm thử lưu ảnh upload và bản thu nhỏ (app/utils/uploads.py, app/utils/images.py)"""
+import io
+import os
+import stat
+
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+from app import create_app
+from app.utils.images import make_variants
+from app.utils.uploads import FILE_MODE, save_upload, url_to_path
+
+@pytest.fixture
+def app(tmp_path, test_config):
+    app = create_app(test_config, web=False, lazy_db=True)
+    app.config['UPLOAD_FOLDER'] = str(tmp_path / 'static' / 'uploads' / 'menus')
+    with app.app_context():
+        yield app
+
+def png_upload(color='red'):
+    data = io.BytesIO()
+    Image.new('RGB', (800, 600), color).save(data, 'PNG')
+    data.seek(0)
+    return FileStorage(stream=data, filename='photo.png')
+
+def mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+def test_upload_and_variants_readable(app):
+    url = save_upload(png_upload(), 'menus')
+    path = url_to_path(url)
+    assert mode(path) == FILE_MODE
+    # Cùng nội dung: cùng URL
+    assert save_upload(png_upload(), 'menus') == url
+
+    variants = make_variants(url)
+    assert set(variants) == {'thumb', 'card', 'full'}
+    assert variants['card']['width'] == 480
+    folder = os.path.dirname(path)
+    for name in os.listdir(folder):
+        assert not name.startswith('.upload-')
+        assert mode(os.path.join(folder, name)) == FILE_MODE
+    assert make_variants(url) == variants
@@ -0,0 +1,41 @@
+"""Kiểm thử xác thực callback VnPay (app/utils/vnpay.py, /customer/payment/vnpay_ipn) với dữ liệu không hợp lệ"""
+import pytest
+
+from app import create_app
+from app.config import Config
+from app.utils.vnpay import VnPay
+
+SECRET = Config.VNPAY_HASH_SECRET
+
+def signed(params, secret=SECRET):
+    vnpay = VnPay({'VNPAY_HASH_SECRET': secret})
+    return dict(params, vnp_SecureHash=vnpay.sign(params))
+
+@pytest.fixture
+def client(test_config):
+    return create_app(test_config, lazy_db=True).test_client()
+
+def test_non_ascii_secure_hash_is_invalid_signature():
+    result = VnPay({'VNPAY_HASH_SECRET': 'x'}).verify_payment({'vnp_SecureHash': 'é', 'vnp_TxnRef': '1'})
+    assert result['signature_valid'] is False
+
+def test_uppercase_secure_hash_is_accepted():
+    params = signed({'vnp_TxnRef': '1', 'vnp_Amount': '11500000', 'vnp_ResponseCode': '00'})
+    params['vnp_SecureHash'] = params['vnp_SecureHash'].upper()
+    result = VnPay({'VNPAY_HASH_SECRET': SECRET}).verify_payment(params)
+    assert (result['success'], result['amount']) == (True, 115000)
+
+@pytest.mark.parametrize('amount', ['abc', '', '1.5'])
+def test_unparsable_amount(amount):
+    params = signed({'vnp_TxnRef': '1', 'vnp_Amount': amount, 'vnp_ResponseCode': '00'})
+    result = VnPay({'VNPAY_HASH_SECRET': SECRET}).verify_payment(params)
+    assert result['signature_valid'] is True
+    assert result['success'] is False
+    assert result['invalid_amount'] is True
+
+def test_ipn_rejects_bad_input_without_error(client):
+    response = client.get('/customer/payment/vnpay_ipn', query_string={'vnp_SecureHash': 'é', 'vnp_TxnRef': '1'})
+    assert (response.status_code, response.get_json()['RspCode']) == (200, '97')
+    params = signed({'vnp_TxnRef': '1', 'vnp_Amount': 'abc', 'vnp_ResponseCode': '00'})
+    response = client.get('/customer/payment/vnpay_ipn', query_string=params)
+    assert (response.status_code, response.get_json()['RspCode']) == (200, '04')
@@ -0,0 +1,21 @@
+"""
+Worker xử lý hàng đợi công việc nền (collection jobs)
+Các route chỉ đưa job vào hàng đợi (doanh thu, tiền ship, tính lại rating...), worker này thực thi chúng.
+Chạy: python worker.py               (số thread lấy từ JOB_WORKER_THREADS)
+      python worker.py --threads 8
+Có thể chạy nhiều process worker cùng lúc, mỗi job chỉ được một worker nhận.
+"""
+import argparse
+from app import create_app
+from app.utils.jobs import run_worker
+from app.utils.order_service import OrderService
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Worker xử lý hàng đợi job')
+    parser.add_argument('--threads', type=int, default=None, help='Số thread xử lý job')
+    args = parser.parse_args()
+
+    app = create_app(web=False, lazy_db=True)
+    print(f"Worker đang chạy với {args.threads or app.config['JOB_WORKER_THREADS']} thread (Ctrl+C để dừng)")
+    # Quét outbox đơn hàng định kỳ để xử lý các đơn bị bỏ lỡ (thay cho chạy process_outbox.py riêng)
+    run_worker(app, threads=args.threads, periodic=[(OrderService.process_pending, 30)])
@@ -0,0 +1,42 @@
+"""
+Entry point production (WSGI)
+  gunicorn -c gunicorn.conf.py wsgi:app   (Linux/macOS: nhiều process, preload, cấu hình trong gunicorn.conf.py)
+  python wsgi.py                          (dùng gunicorn nếu có, nếu không dùng waitress - ví dụ trên Windows)
+Số worker, thread, keep-alive, timeout lấy từ Config (biến môi trường WEB_*).
+run.py chỉ dùng khi phát triển (debug server của Flask).
+"""
+import os
+import sys
+from app.config import Config
+
+CONF_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+
+def serve_gunicorn(extra_args):
+    """Chạy gunicorn với gunicorn.conf.py (tham số thêm được truyền thẳng cho gunicorn)"""
+    from gunicorn.app.wsgiapp import run
+    sys.argv = ['gunicorn', '-c', CONF_FILE] + extra_args
+    run()
+
+def serve_waitress():
+    """Waitress không fork: một process, WEB_THREADS thread"""
+    from waitress import serve
+    from app import create_app
+    host, _, port = Config.WEB_BIND.rpartition(':')
+    print(f"🚀 Waitress: http://{host}:{port} ({Config.WEB_THREADS} thread)")
+    serve(create_app(), host=host or '0.0.0.0', port=int(port),
+          threads=Config.WEB_THREADS, channel_timeout=Config.WEB_TIMEOUT)
+
+def main():
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        serve_waitress()
+    else:
+        serve_gunicorn(sys.argv[1:])
+
+if __name__ == '__main__':
+    main()
+else:
+    # gunicorn (preload_app) và các WSGI server khác import module này và dùng biến app
+    from app import create_app
+    app = create_app()